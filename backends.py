@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Text-to-speech engines behind one interface.
+
+The pipeline in ``core`` synthesizes each batch in two stages: a token
+stage (``generate_tokens``) on the calling thread and a decode stage
+(``decode``) that may run on another thread. Every backend implements both,
+plus loading, voice conditioning and its output sample rate, and is picked
+by name with ``get_backend``:
+
+    chatterbox - ChatterboxTTS (default)
+    onnx       - ChatterboxTTS on CPU with S3Gen's estimator and vocoder run
+                 through onnxruntime (see ort_stages.py)
+    fake       - deterministic synthetic audio with a configurable latency,
+                 for profiling parsing, batching, post-processing and muxing
+                 without downloading or running the model
+"""
+import copy
+import logging
+import time
+
+import numpy as np
+import torch
+
+from chatterbox_stages import (
+    S3_TOKENS_PER_SEC,
+    SPEECH_VOCAB_SIZE,
+    max_speech_tokens,
+    generate_speech_tokens,
+    decode_speech_tokens,
+)
+
+DEFAULT_BACKEND = 'chatterbox'
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class TTSBackend:
+    """
+    Interface of a synthesis engine. Subclasses set ``name`` and
+    ``tokens_per_second`` (tokens per second of decoded audio), and set
+    ``device`` and ``sample_rate`` once loaded.
+    """
+    name = None
+    tokens_per_second = S3_TOKENS_PER_SEC
+    sample_rate = 24000
+    device = "cpu"
+
+    def load(self, device=None, precision='fp32'):
+        """Load the engine onto ``device`` (default: CUDA when available). Returns self."""
+        raise NotImplementedError
+
+    def condition(self, wav_path):
+        """Speak with the voice of the reference recording ``wav_path`` from now on."""
+        raise NotImplementedError
+
+    def reset_voice(self):
+        """Go back to the voice the engine was loaded with, undoing ``condition``."""
+        raise NotImplementedError
+
+    def max_tokens(self):
+        """Hard upper bound on tokens one ``generate_tokens`` call can produce."""
+        raise NotImplementedError
+
+    def generate_tokens(self, text, max_new_tokens, seed, **sampling):
+        """
+        Token stage for ``text``, deterministic for a given ``seed``. Returns a
+        1-D sequence; it is exactly ``max_new_tokens`` long when generation
+        ran into the cap.
+        """
+        raise NotImplementedError
+
+    def decode(self, tokens, watermark=False):
+        """Decode stage. Returns a 1-D float numpy array at ``sample_rate``."""
+        raise NotImplementedError
+
+    def watermark(self, audio):
+        """Watermark a finished stretch of audio (a no-op unless the engine has one)."""
+        return audio
+
+    def compile(self):
+        """``torch.compile`` the engine's hot modules in place; False if there are none."""
+        return False
+
+    def generate(self, text, seed=0, **sampling):
+        """Both stages for ``text`` in one call, watermarked."""
+        tokens = self.generate_tokens(text, self.max_tokens(), seed, **sampling)
+        return self.decode(tokens, watermark=True)
+
+
+class ChatterboxBackend(TTSBackend):
+    """ChatterboxTTS: T3 produces speech tokens, S3Gen renders them."""
+    name = 'chatterbox'
+    # The T3 backbone (run once per speech token) and the flow-matching
+    # estimator (run once per Euler step)
+    compile_targets = ("t3.tfmr", "s3gen.flow.decoder.estimator")
+
+    def __init__(self):
+        self.model = None
+        self.default_conds = None
+
+    def load(self, device=None, precision='fp32'):
+        from chatterbox.tts import ChatterboxTTS
+        from precision import apply_precision
+
+        self.device = device or default_device()
+        self.model = ChatterboxTTS.from_pretrained(device=self.device)
+        apply_precision(self.model, precision)
+        self.sample_rate = self.model.sr
+        # prepare_conditionals replaces model.conds, so the built-in voice has to be kept aside
+        self.default_conds = copy.deepcopy(self.model.conds)
+        return self
+
+    def condition(self, wav_path):
+        self.model.prepare_conditionals(wav_fpath=wav_path)
+
+    def reset_voice(self):
+        if self.default_conds is None:
+            raise RuntimeError("This model has no built-in voice; a reference recording is required")
+        self.model.conds = copy.deepcopy(self.default_conds)
+
+    def max_tokens(self):
+        return max_speech_tokens(self.model)
+
+    def generate_tokens(self, text, max_new_tokens, seed, **sampling):
+        # A private generator, so decoding on another thread can use the global RNG
+        generator = torch.Generator(device=self.device).manual_seed(seed)
+        return generate_speech_tokens(self.model, text, max_new_tokens, generator=generator, **sampling)
+
+    def decode(self, tokens, watermark=False):
+        return decode_speech_tokens(self.model, tokens, watermark=watermark)
+
+    def watermark(self, audio):
+        return self.model.watermarker.apply_watermark(audio, sample_rate=self.sample_rate)
+
+    def compile(self):
+        from compilation import compile_modules
+
+        compile_modules(self.model, self.compile_targets)
+        return True
+
+
+class OnnxBackend(ChatterboxBackend):
+    """
+    ChatterboxTTS on CPU with the stateless S3Gen networks exported to ONNX
+    and run by onnxruntime. ``threads`` sizes onnxruntime's intra-op pool
+    (0: onnxruntime's default).
+    """
+    name = 'onnx'
+    # The estimator already runs in onnxruntime
+    compile_targets = ("t3.tfmr",)
+
+    def __init__(self, threads=0):
+        super().__init__()
+        self.threads = threads
+
+    def load(self, device=None, precision='fp32'):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise ImportError("--backend onnx needs onnxruntime, which is not installed: pip install onnxruntime") from None
+        from ort_stages import accelerate_s3gen
+
+        if device not in (None, 'cpu'):
+            logging.warning(f"The onnx backend runs on CPU; ignoring device {device!r}")
+        if precision != 'fp32':
+            logging.warning(f"The onnx backend exports fp32 graphs; ignoring precision {precision!r}")
+        super().load('cpu')
+        accelerate_s3gen(self.model.s3gen, threads=self.threads)
+        return self
+
+
+class FakeBackend(TTSBackend):
+    """
+    Deterministic stand-in for a real engine.
+
+    Speech lasts ``len(text) / chars_per_sec`` seconds; each token becomes a
+    short tone whose pitch is derived from the token id, so the same text and
+    seed always give the same samples. ``latency`` is the time each token
+    stage call takes and ``rtf`` the decode time per second of audio, to mimic
+    the load profile of a real model.
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0, rtf=0.0, chars_per_sec=15.0, sample_rate=24000):
+        self.latency = latency
+        self.rtf = rtf
+        self.chars_per_sec = chars_per_sec
+        self.sample_rate = sample_rate
+
+    def load(self, device=None, precision='fp32'):
+        self.device = "cpu"
+        return self
+
+    def condition(self, wav_path):
+        pass
+
+    def reset_voice(self):
+        pass
+
+    def max_tokens(self):
+        return 4096
+
+    def generate_tokens(self, text, max_new_tokens, seed, **sampling):
+        n_tokens = max(1, round(len(text) / self.chars_per_sec * self.tokens_per_second))
+        rng = np.random.default_rng(seed)
+        tokens = rng.integers(0, SPEECH_VOCAB_SIZE, size=min(n_tokens, max_new_tokens))
+        if self.latency:
+            time.sleep(self.latency)
+        return tokens
+
+    def decode(self, tokens, watermark=False):
+        frame_len = self.sample_rate // self.tokens_per_second
+        t = np.arange(frame_len) / self.sample_rate
+        pitch = 110.0 + (np.asarray(tokens) % 128) * 2.0
+        frames = 0.1 * np.sin(2 * np.pi * pitch[:, None] * t[None, :]) * np.hanning(frame_len)[None, :]
+        if self.rtf:
+            time.sleep(self.rtf * len(tokens) / self.tokens_per_second)
+        return frames.astype(np.float32).flatten()
+
+
+BACKENDS = {
+    ChatterboxBackend.name: ChatterboxBackend,
+    OnnxBackend.name: OnnxBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+
+def get_backend(name=DEFAULT_BACKEND, **options):
+    """Instantiate the backend registered as ``name``; call ``load`` on it before use."""
+    if name not in BACKENDS:
+        raise ValueError(f"backend must be one of {tuple(BACKENDS)}, got {name!r}")
+    return BACKENDS[name](**options)
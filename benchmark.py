@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the synthesis pipeline.
+
+Usage:
+    python benchmark.py prefix-cache [--wav voice.wav] [--runs 5]
+    python benchmark.py precision [--modes bf16 int8] [--max-chars 1500]
+    python benchmark.py onnx [--max-chars 1500]
+    python benchmark.py time-stretch [--audio chapter.wav] [--speeds 0.8 1.0 1.25 1.5]
+"""
+import argparse
+import logging
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+TEST_EPUBS = Path(__file__).parent / "test_epubs"
+
+SAMPLE_TEXT = (
+    "The lighthouse keeper climbed the spiral stairs one last time that evening. "
+    "Below him the sea rolled grey and patient against the rocks, and somewhere "
+    "beyond the fog a ship's bell answered the wind."
+)
+
+
+def load_model(wav=None, device=None, precision='fp32', backend='chatterbox'):
+    """Load a TTS backend the same way core.main does, optionally with a voice prompt."""
+    from backends import get_backend
+
+    tts = get_backend(backend).load(device, precision)
+    if wav:
+        tts.condition(wav)
+    return tts
+
+
+def load_test_texts(max_chars, folder=TEST_EPUBS):
+    """Cleaned text of the bundled test books, truncated to ``max_chars`` each."""
+    from ebooklib import epub
+    import core
+
+    texts = {}
+    for path in sorted(Path(folder).glob("*.epub")):
+        book = epub.read_epub(str(path))
+        chapters = core.find_good_chapters(core.find_document_chapters_and_extract_texts(book))
+        lines = (core.clean_line(line) for c in chapters for line in c.extracted_text.splitlines())
+        texts[path.stem] = "\n".join(line for line in lines if line.strip())[:max_chars]
+    return texts
+
+
+def synthesize_text(tts, text):
+    """Render ``text`` through the core batching and per-batch seeding; returns (audio, seconds taken)."""
+    import core
+
+    batches = core.batch_sentences_intelligently(list(core.get_nlp()(text).sents))
+    start = time.perf_counter()
+    audio = np.concatenate([
+        core.generate_batch_audio(tts, batch, seed=core.DEFAULT_SEED, watermark=False)
+        for batch in batches
+    ])
+    return audio, time.perf_counter() - start
+
+
+def spectral_distance(ref, test, sr):
+    """
+    Mean Euclidean distance between DTW-aligned MFCC frames (c1..c12) of two
+    renders of the same text. Lower is closer; identical audio scores 0.
+    """
+    import librosa
+
+    mfcc_ref = librosa.feature.mfcc(y=ref.astype(np.float32), sr=sr, n_mfcc=13)[1:]
+    mfcc_test = librosa.feature.mfcc(y=test.astype(np.float32), sr=sr, n_mfcc=13)[1:]
+    _, path = librosa.sequence.dtw(X=mfcc_ref, Y=mfcc_test, metric="euclidean")
+    diffs = mfcc_ref[:, path[:, 0]] - mfcc_test[:, path[:, 1]]
+    return float(np.mean(np.sqrt((diffs ** 2).sum(axis=0))))
+
+
+def _sync(device):
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def time_ms(fn, runs, device, warmup=1):
+    """Run ``fn`` ``warmup + runs`` times and return the timed runs in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        _sync(device)
+        start = time.perf_counter()
+        fn()
+        _sync(device)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    logging.info(f"{label:<40} median {statistics.median(timings):8.1f} ms   "
+                 f"min {min(timings):8.1f} ms   ({len(timings)} runs)")
+    return statistics.median(timings)
+
+
+def bench_prefix_cache(args):
+    """
+    Per-call saving from reusing the conditioning prefix KV cache.
+
+    A one-token generation is almost entirely the prefill pass, so timing it
+    with and without the cache isolates the prefix re-encoding cost.
+    """
+    from chatterbox_stages import generate_speech_tokens, cached_prefix_kv, conditioning_prefix_kv
+
+    cb_model = load_model(args.wav).model
+    device = cb_model.device
+
+    def call(prefix_cache, max_new_tokens):
+        generator = torch.Generator(device=device).manual_seed(0)
+        return generate_speech_tokens(cb_model, args.text, max_new_tokens, generator=generator,
+                                      prefix_cache=prefix_cache)
+
+    summarize("prefix KV build (once per voice)",
+              time_ms(lambda: conditioning_prefix_kv(cb_model.t3, cb_model.conds.t3), args.runs, device))
+    cached_prefix_kv(cb_model)
+
+    without = summarize("prefill, no prefix cache", time_ms(lambda: call(False, 1), args.runs, device))
+    with_cache = summarize("prefill, prefix cache", time_ms(lambda: call(True, 1), args.runs, device))
+    logging.info(f"Saving per generate call: {without - with_cache:.1f} ms")
+
+    if args.full:
+        summarize("full T3, no prefix cache", time_ms(lambda: call(False, 1000), args.runs, device))
+        summarize("full T3, prefix cache", time_ms(lambda: call(True, 1000), args.runs, device))
+
+
+def compare_renders(args, variants):
+    """
+    Render the bundled test books with each of ``variants`` (label -> kwargs
+    for ``load_model``, the first being the reference) and log real-time
+    factor (synthesis seconds per audio second, lower is faster), speedup and
+    spectral distance from the reference render.
+    """
+    texts = load_test_texts(args.max_chars)
+    results = {}
+    for label, load_kwargs in variants.items():
+        tts = load_model(args.wav, device="cpu", **load_kwargs)
+        results[label] = {name: synthesize_text(tts, text) for name, text in texts.items()}
+        del tts
+
+    sr = 24000
+    reference = next(iter(results))
+    for label, renders in results.items():
+        for name, (audio, seconds) in renders.items():
+            rtf = seconds / (len(audio) / sr)
+            line = f"{label:<10} {name:<28} RTF {rtf:6.3f}"
+            if label != reference:
+                ref_audio, ref_seconds = results[reference][name]
+                line += (f"   speedup {ref_seconds / seconds:5.2f}x"
+                         f"   spectral distance {spectral_distance(ref_audio, audio, sr):6.2f}")
+            logging.info(line)
+
+
+def bench_precision(args):
+    """A/B of low-precision CPU modes against fp32 on the bundled test books."""
+    modes = ['fp32'] + [m for m in args.modes if m != 'fp32']
+    compare_renders(args, {mode: {"precision": mode} for mode in modes})
+
+
+def bench_onnx(args):
+    """Eager torch against the onnxruntime backend on CPU, on the bundled test books."""
+    compare_renders(args, {"torch": {"backend": "chatterbox"}, "onnx": {"backend": "onnx"}})
+
+
+def speech_like_audio(seconds, sr=24000):
+    """Harmonic source with a gliding pitch and pauses; stands in for a chapter when no --audio is given."""
+    t = np.arange(int(seconds * sr)) / sr
+    phase = np.cumsum((120 + 30 * np.sin(2 * np.pi * 0.3 * t)) / sr)
+    source = sum(np.sin(2 * np.pi * h * phase) / h for h in range(1, 20))
+    pauses = np.sin(2 * np.pi * 0.7 * t) > -0.3
+    return (0.3 * source * pauses).astype(np.float32)
+
+
+def bench_time_stretch(args):
+    """
+    WSOLA (timestretch.py, used for --speed) against librosa's phase
+    vocoder, the previous --speed path, at each of ``--speeds``.
+    """
+    import librosa
+    import soundfile
+    from timestretch import wsola
+
+    if args.audio:
+        audio, sr = soundfile.read(args.audio, dtype="float32")
+        audio = audio.mean(axis=1) if audio.ndim > 1 else audio
+    else:
+        sr = 24000
+        audio = speech_like_audio(args.seconds, sr)
+    logging.info(f"{len(audio) / sr:.0f}s of audio at {sr} Hz")
+    for speed in args.speeds:
+        label = f"{speed:.2f}x"
+        librosa_ms = summarize(f"librosa phase vocoder {label}",
+                               time_ms(lambda: librosa.effects.time_stretch(audio, rate=speed), args.runs, "cpu"))
+        wsola_ms = summarize(f"WSOLA {label}", time_ms(lambda: wsola(audio, speed, sr), args.runs, "cpu"))
+        logging.info(f"{'':<40} speedup {librosa_ms / wsola_ms:.1f}x, "
+                     f"{len(audio) / sr / (wsola_ms / 1000):.0f}x real time")
+
+
+BENCHMARKS = {
+    "prefix-cache": bench_prefix_cache,
+    "precision": bench_precision,
+    "onnx": bench_onnx,
+    "time-stretch": bench_time_stretch,
+}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logging.getLogger('chatterbox').setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description="Chatterblez benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--wav', help='Voice prompt WAV (default: built-in voice)')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per measurement (default: 5)')
+    parser.add_argument('--text', default=SAMPLE_TEXT, help='Text to synthesize')
+    parser.add_argument('--full', action='store_true', help='Also time complete generations')
+    parser.add_argument('--modes', nargs='+', default=['bf16', 'int8', 'int8-bf16'],
+                        help='Precision modes to compare against fp32 (precision benchmark)')
+    parser.add_argument('--max-chars', type=int, default=1500,
+                        help='Characters rendered per test book (precision and onnx benchmarks)')
+    parser.add_argument('--audio', help='Mono WAV to time-stretch (time-stretch benchmark; default: synthetic speech)')
+    parser.add_argument('--seconds', type=float, default=60, help='Length of the synthetic audio (default: 60)')
+    parser.add_argument('--speeds', nargs='+', type=float, default=[0.8, 0.9, 1.1, 1.25, 1.5],
+                        help='Speeds to benchmark (time-stretch benchmark)')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
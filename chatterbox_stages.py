@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Stage-level access to a loaded ``ChatterboxTTS`` model.
+
+``ChatterboxTTS.generate`` runs T3 (text -> speech tokens) and S3Gen
+(speech tokens -> waveform) back to back with a hardcoded token limit.
+These helpers split that call in two so the pipeline in ``core`` can cap
+and inspect the token stage before paying for the vocoder.
+"""
+import torch
+import torch.nn.functional as F
+
+from precision import autocast_context, uses_bf16
+
+# S3 speech tokens are emitted at a fixed 25 tokens per second of audio
+S3_TOKENS_PER_SEC = 25
+# Token ids at or above this value are special (SOS/EOS/padding)
+SPEECH_VOCAB_SIZE = 6561
+
+
+def max_speech_tokens(cb_model):
+    """Hard upper bound on speech tokens T3 can generate for one call."""
+    return cb_model.t3.hp.max_speech_tokens
+
+
+def _update_exaggeration(cb_model, exaggeration):
+    from chatterbox.models.t3.modules.cond_enc import T3Cond
+
+    if exaggeration != cb_model.conds.t3.emotion_adv[0, 0, 0]:
+        _cond = cb_model.conds.t3
+        cb_model.conds.t3 = T3Cond(
+            speaker_emb=_cond.speaker_emb,
+            cond_prompt_speech_tokens=_cond.cond_prompt_speech_tokens,
+            emotion_adv=exaggeration * torch.ones(1, 1, 1),
+        ).to(device=cb_model.device)
+
+
+def tokenize_text(cb_model, text, cfg_weight):
+    """Normalize and tokenize text exactly like ``ChatterboxTTS.generate``."""
+    from chatterbox.tts import punc_norm
+
+    text_tokens = cb_model.tokenizer.text_to_tokens(punc_norm(text)).to(cb_model.device)
+    if cfg_weight > 0.0:
+        text_tokens = torch.cat([text_tokens, text_tokens], dim=0)  # Need two seqs for CFG
+    text_tokens = F.pad(text_tokens, (1, 0), value=cb_model.t3.hp.start_text_token)
+    text_tokens = F.pad(text_tokens, (0, 1), value=cb_model.t3.hp.stop_text_token)
+    return text_tokens
+
+
+@torch.inference_mode()
+def conditioning_prefix_kv(t3, t3_cond):
+    """
+    Key/value cache of the T3 backbone over the conditioning prefix alone
+    (speaker embedding, prompt speech tokens, emotion). The prefix is the same
+    for every batch spoken with one voice, so it only needs computing once.
+
+    Returned as a legacy tuple of ``(key, value)`` per layer with batch size 1.
+    """
+    cond_emb = t3.prepare_conditioning(t3_cond)  # (1, len_cond, dim)
+    output = t3.tfmr(inputs_embeds=cond_emb, use_cache=True, return_dict=True)
+    past = output.past_key_values
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+    return tuple((k, v) for k, v in past)
+
+
+def _expand_prefix_kv(prefix_kv, n_rows):
+    """Fresh cache object over the shared prefix, expanded to ``n_rows`` sequences."""
+    from transformers import DynamicCache
+
+    return DynamicCache.from_legacy_cache(tuple(
+        (k.expand(n_rows, -1, -1, -1), v.expand(n_rows, -1, -1, -1)) for k, v in prefix_kv
+    ))
+
+
+def cached_prefix_kv(cb_model):
+    """
+    ``conditioning_prefix_kv`` for the model's current conditionals, computed
+    on first use and reused until ``prepare_conditionals`` or a change of
+    exaggeration replaces ``cb_model.conds.t3``.
+    """
+    t3_cond = cb_model.conds.t3
+    cached = getattr(cb_model, "_prefix_kv_cache", None)
+    if cached is None or cached[0] is not t3_cond:
+        cached = (t3_cond, conditioning_prefix_kv(cb_model.t3, t3_cond))
+        cb_model._prefix_kv_cache = cached
+    return cached[1]
+
+
+@torch.inference_mode()
+def t3_inference(t3, t3_cond, text_tokens, max_new_tokens, temperature=0.8, cfg_weight=0.5,
+                 repetition_penalty=1.2, min_p=0.05, top_p=1.0, generator=None, prefix_kv=None):
+    """
+    Sampling loop equivalent to ``T3.inference`` for the English model.
+
+    Differences from the upstream loop:
+      - ``cfg_weight=0`` runs a single sequence instead of a CFG pair, halving
+        the work per step (upstream always decodes two rows);
+      - logits processors that would be no-ops (``repetition_penalty=1``,
+        ``min_p=0``, ``top_p=1``) are skipped;
+      - attention weights are not requested, so the backbone keeps SDPA;
+      - sampling can draw from a private ``generator`` instead of the global RNG;
+      - with ``prefix_kv`` (see ``conditioning_prefix_kv``) the conditioning
+        prefix is not re-encoded; the first forward pass only covers the text.
+    """
+    from transformers.generation.logits_process import (
+        MinPLogitsWarper,
+        RepetitionPenaltyLogitsProcessor,
+        TopPLogitsWarper,
+    )
+
+    hp = t3.hp
+    text_tokens = torch.atleast_2d(text_tokens).to(dtype=torch.long, device=t3.device)
+    use_cfg = cfg_weight > 0.0
+
+    initial_speech_tokens = hp.start_speech_token * torch.ones_like(text_tokens[:, :1])
+    if prefix_kv is None:
+        embeds, _ = t3.prepare_input_embeds(
+            t3_cond=t3_cond,
+            text_tokens=text_tokens,
+            speech_tokens=initial_speech_tokens,
+            cfg_weight=cfg_weight,
+        )
+        past = None
+    else:
+        # Same as prepare_input_embeds, minus the conditioning prefix
+        text_emb = t3.text_emb(text_tokens)
+        if use_cfg:
+            text_emb[1].zero_()  # CFG uncond
+        text_emb = text_emb + t3.text_pos_emb(text_tokens)
+        speech_emb = t3.speech_emb(initial_speech_tokens) + t3.speech_pos_emb(initial_speech_tokens)
+        embeds = torch.cat([text_emb, speech_emb], dim=1)
+        past = _expand_prefix_kv(prefix_kv, embeds.size(0))
+    n_rows = embeds.size(0)
+
+    bos_token = torch.tensor([[hp.start_speech_token]], dtype=torch.long, device=embeds.device)
+    bos_embed = t3.speech_emb(bos_token) + t3.speech_pos_emb.get_fixed_embedding(0)
+    inputs_embeds = torch.cat([embeds, bos_embed.expand(n_rows, -1, -1)], dim=1)
+
+    repetition_processor = None
+    if repetition_penalty != 1.0:
+        repetition_processor = RepetitionPenaltyLogitsProcessor(penalty=float(repetition_penalty))
+    min_p_warper = MinPLogitsWarper(min_p=min_p) if min_p > 0.0 else None
+    top_p_warper = TopPLogitsWarper(top_p=top_p) if top_p < 1.0 else None
+
+    generated_ids = bos_token.clone()
+    predicted = []
+    for i in range(max_new_tokens):
+        output = t3.tfmr(
+            inputs_embeds=inputs_embeds,
+            past_key_values=past,
+            use_cache=True,
+            return_dict=True,
+        )
+        past = output.past_key_values
+        logits = t3.speech_head(output.last_hidden_state[:, -1, :])  # (rows, V)
+
+        if use_cfg:
+            cond, uncond = logits[0:1], logits[1:2]
+            logits = cond + cfg_weight * (cond - uncond)
+        if repetition_processor is not None:
+            logits = repetition_processor(generated_ids, logits)
+        if temperature != 1.0:
+            logits = logits / temperature
+        if min_p_warper is not None:
+            logits = min_p_warper(generated_ids, logits)
+        if top_p_warper is not None:
+            logits = top_p_warper(generated_ids, logits)
+
+        probs = torch.softmax(logits, dim=-1)
+        next_token = torch.multinomial(probs, num_samples=1, generator=generator)  # (1, 1)
+        predicted.append(next_token)
+        generated_ids = torch.cat([generated_ids, next_token], dim=1)
+        if next_token.item() == hp.stop_speech_token:
+            break
+
+        next_embed = t3.speech_emb(next_token) + t3.speech_pos_emb.get_fixed_embedding(i + 1)
+        inputs_embeds = next_embed.expand(n_rows, -1, -1)
+
+    return torch.cat(predicted, dim=1)
+
+
+def generate_speech_tokens(cb_model, text, max_new_tokens, repetition_penalty=1.2, min_p=0.05, top_p=1.0,
+                           exaggeration=0.5, cfg_weight=0.5, temperature=0.8, generator=None, prefix_cache=True):
+    """
+    Run the T3 half of ``ChatterboxTTS.generate``.
+
+    Returns a 1-D tensor of valid speech tokens. If T3 never emitted EOS the
+    result is exactly ``max_new_tokens`` long, which callers use to detect a
+    runaway generation. ``prefix_cache`` reuses the conditioning prefix's
+    key/value cache across calls with the same voice.
+    """
+    from chatterbox.models.s3tokenizer import drop_invalid_tokens
+
+    assert cb_model.conds is not None, "Please `prepare_conditionals` first"
+    _update_exaggeration(cb_model, exaggeration)
+    text_tokens = tokenize_text(cb_model, text, cfg_weight)
+
+    sampling = dict(
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        cfg_weight=cfg_weight,
+        repetition_penalty=repetition_penalty,
+        min_p=min_p,
+        top_p=top_p,
+    )
+    with torch.inference_mode(), autocast_context(cb_model):
+        if getattr(cb_model.t3.hp, "is_multilingual", False):
+            # The multilingual model relies on upstream's alignment analyzer
+            speech_tokens = cb_model.t3.inference(t3_cond=cb_model.conds.t3, text_tokens=text_tokens, **sampling)
+        else:
+            prefix_kv = cached_prefix_kv(cb_model) if prefix_cache else None
+            speech_tokens = t3_inference(cb_model.t3, cb_model.conds.t3, text_tokens, generator=generator,
+                                         prefix_kv=prefix_kv, **sampling)
+        # Extract only the conditional batch
+        speech_tokens = drop_invalid_tokens(speech_tokens[0])
+        speech_tokens = speech_tokens[speech_tokens < SPEECH_VOCAB_SIZE]
+    return speech_tokens.to(cb_model.device)
+
+
+def decode_speech_tokens(cb_model, speech_tokens, watermark=True):
+    """
+    Run the S3Gen half of ``ChatterboxTTS.generate``.
+
+    Returns a 1-D float numpy array at ``cb_model.sr``.
+    """
+    with torch.inference_mode():
+        if uses_bf16(getattr(cb_model, "precision", "fp32")):
+            # Same as S3Gen.inference, with only the flow model under autocast:
+            # the HiFi-GAN vocoder's STFT needs fp32 input
+            s3gen = cb_model.s3gen
+            with autocast_context(cb_model):
+                mels = s3gen.flow_inference(speech_tokens, ref_dict=cb_model.conds.gen, finalize=True)
+            wav, _ = s3gen.hift_inference(mels.float(), None)
+            wav[:, :len(s3gen.trim_fade)] *= s3gen.trim_fade
+        else:
+            wav, _ = cb_model.s3gen.inference(
+                speech_tokens=speech_tokens,
+                ref_dict=cb_model.conds.gen,
+            )
+        wav = wav.squeeze(0).detach().float().cpu().numpy()
+    if watermark:
+        wav = cb_model.watermarker.apply_watermark(wav, sample_rate=cb_model.sr)
+    return wav.flatten()
@@ -16,12 +16,19 @@ def cli_main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--file', '-f', help='Path to a single EPUB or PDF file')
     group.add_argument('--batch', '-b', help='Path to a folder containing EPUB/PDF files for batch processing')
+    group.add_argument('--serve', nargs='?', const='http://127.0.0.1:8765', metavar='ADDRESS',
+                       help='Run as a daemon with the model kept warm, accepting jobs at ADDRESS '
+                            '(default http://127.0.0.1:8765; or unix:/path/to/socket)')
+    group.add_argument('--remux', metavar='PATH',
+                       help='Fix metadata, chapters or cover of an existing m4b, or of every m4b under a folder, '
+                            'by stream copy (see remux.py for per-book sidecar files)')
 
     parser.add_argument('-o', '--output', default='.', help='Output folder for the audiobook and temporary files', metavar='FOLDER')
     parser.add_argument('--filterlist', help='Comma-separated list of chapter names to ignore (case-insensitive substring match)')
     parser.add_argument('--wav', help='Path to a WAV file for voice conditioning (audio prompt)')
     parser.add_argument('--speed', type=float, default=1.0, help='Speech speed (default: 1.0)')
     parser.add_argument('--cuda', default=True, help='Use GPU via Cuda in Torch if available', action='store_true')
+    parser.add_argument('--draft', action='store_true', help='Fast draft-quality render for proofing (no CFG, no post-processing, low bitrate)')
 
     # Silence trimming parameters
     parser.add_argument('--enable-silence-trimming', action='store_true', help='Enable silence trimming on the generated audio chapters.')
@@ -36,12 +43,76 @@ def cli_main():
     parser.add_argument('--exaggeration', type=float, default=0.4, help='Exaggeration factor (default: 0.4)')
     parser.add_argument('--cfg-weight', type=float, default=0.8, help='CFG weight (default: 0.8)')
     parser.add_argument('--temperature', type=float, default=0.85, help='Temperature for sampling (default: 0.85)')
+    parser.add_argument('--watermark', choices=['chapter', 'batch', 'off'], default='chapter',
+                        help='Apply the Perth watermark once per chapter (default), on every generated clip, or not at all')
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'int8', 'int8-bf16'], default='fp32',
+                        help='CPU inference precision: bf16 autocast and/or int8 dynamic quantization (default: fp32)')
+    parser.add_argument('--backend', choices=['chatterbox', 'onnx', 'fake'], default='chatterbox',
+                        help='TTS engine; "onnx" runs S3Gen through onnxruntime on CPU, "fake" renders deterministic '
+                             'synthetic audio without the model, for profiling (default: chatterbox)')
+    parser.add_argument('--onnx-threads', type=int, default=0,
+                        help='With --backend onnx: onnxruntime intra-op threads (default: 0, onnxruntime decides)')
+    parser.add_argument('--fake-latency', type=float, default=0.0,
+                        help='With --backend fake: seconds each batch takes in the token stage (default: 0)')
+    parser.add_argument('--fake-rtf', type=float, default=0.0,
+                        help='With --backend fake: decode seconds per second of audio (default: 0)')
+    parser.add_argument('--compile', dest='torch_compile', action='store_true',
+                        help='torch.compile the model\'s hot modules and warm them up first; '
+                             'compiled kernels are cached across runs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='With --batch: books synthesized at once by forked workers sharing one loaded model (CPU only, default: 1)')
+    parser.add_argument('--worker-threads', type=int, default=None,
+                        help='Torch threads per worker (default: CPU cores divided by --workers)')
+    parser.add_argument('--progressive', action='store_true',
+                        help='Keep a playable <book>.partial.m4b that grows chapter by chapter while rendering')
+    parser.add_argument('--encode-jobs', type=int, default=None,
+                        help='Chapters AAC-encoded at once while synthesis continues, or books at once with --remux '
+                             '(default: one per CPU core)')
+    parser.add_argument('--export-chapters', choices=['aac', 'mp3', 'opus'], default=None,
+                        help='Also write every chapter as a standalone file into <book>_chapters/')
+    parser.add_argument('--intermediate-format', choices=['wav', 'flac'], default='wav',
+                        help='Format of the chapter files between synthesis and encoding: 16-bit WAV, or FLAC '
+                             'for about half the scratch space (default: wav)')
+    parser.add_argument('--scratch-dir', metavar='DIR', default=None,
+                        help='Where each job keeps its intermediate files, e.g. /dev/shm for RAM-backed scratch '
+                             '(default: --output); every job uses and cleans only its own subdirectory')
+    parser.add_argument('--normalize-loudness', dest='loudness_target', type=float, nargs='?', const=-18.0,
+                        default=None, metavar='LUFS',
+                        help='Bring every chapter to the same integrated loudness (default target: -18 LUFS)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the audio of chapters unchanged since the last render of the book (same text, '
+                             'voice and settings), even if renamed or moved; keeps lossless copies in '
+                             '.chatterblez-renders/ in --output')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only list which chapters an --incremental re-render would reuse, render or drop')
+    parser.add_argument('--metadata', action='append', default=[], metavar='KEY=VALUE',
+                        help='With --remux: set a container tag, e.g. title=... or artist=... (repeatable)')
+    parser.add_argument('--chapters', metavar='FILE',
+                        help='With --remux: replace the chapter list with this chapters.txt-style FFMETADATA file')
+    parser.add_argument('--cover', metavar='IMAGE', help='With --remux: replace the cover image')
+    parser.add_argument('--job-db', metavar='PATH', default=None,
+                        help='SQLite job database for crash-safe resume (default with --batch: '
+                             '.chatterblez-jobs.sqlite3 in --output; off for --file unless given)')
+    parser.add_argument('--server', metavar='ADDRESS',
+                        help='Submit --file/--batch as jobs to a running --serve daemon instead of synthesizing here')
+    parser.add_argument('--priority', type=int, default=0, help='With --server: job priority, lower runs first (default: 0)')
+    parser.add_argument('--wait', action='store_true',
+                        help='With --server: follow the jobs until they finish and fetch the audiobooks into --output')
+    parser.add_argument('--seed', type=int, default=12345, help='Job seed; the same seed and text give the same audio (default: 12345)')
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
     args = parser.parse_args()
 
+    if args.server:
+        submit_to_server(args)
+        return
+
+    if args.remux:
+        remux(args)
+        return
+
     if args.cuda:
         import torch.cuda
         if torch.cuda.is_available():
@@ -53,7 +124,7 @@ def cli_main():
     from core import main
 
     # Prepare ignore_list
-    ignore_list = [s.strip() for s in args.filterlist.split(',')] if args.filterlist else None
+    ignore_list = parse_ignore_list(args)
 
     # Prepare audio prompt
     audio_prompt_wav = args.wav if args.wav else None
@@ -65,6 +136,15 @@ def cli_main():
     # Prepare speed
     speed = args.speed
 
+    backend_options = parse_backend_options(args)
+
+    if args.serve:
+        from serve import run_server
+        run_server(args.serve, audio_prompt_wav=audio_prompt_wav, output_folder=output_folder,
+                   backend=args.backend, backend_options=backend_options, precision=args.precision,
+                   torch_compile=args.torch_compile, scratch_dir=args.scratch_dir)
+        return
+
     # Batch mode
     if args.batch:
         folder = Path(args.batch)
@@ -101,7 +181,25 @@ def cli_main():
             enable_silence_trimming=args.enable_silence_trimming,
             silence_thresh=args.silence_thresh,
             min_silence_len=args.min_silence_len,
-            keep_silence=args.keep_silence
+            keep_silence=args.keep_silence,
+            seed=args.seed,
+            draft=args.draft,
+            watermark=args.watermark,
+            precision=args.precision,
+            backend=args.backend,
+            backend_options=backend_options,
+            torch_compile=args.torch_compile,
+            workers=args.workers,
+            worker_threads=args.worker_threads,
+            job_db=args.job_db,
+            progressive=args.progressive,
+            encode_jobs=args.encode_jobs,
+            export_chapters=args.export_chapters,
+            incremental=args.incremental,
+            dry_run=args.dry_run,
+            intermediate_format=args.intermediate_format,
+            scratch_dir=args.scratch_dir,
+            loudness_target=args.loudness_target
         )
     # Single file mode
     elif args.file:
@@ -128,11 +226,101 @@ def cli_main():
             enable_silence_trimming=args.enable_silence_trimming,
             silence_thresh=args.silence_thresh,
             min_silence_len=args.min_silence_len,
-            keep_silence=args.keep_silence
+            keep_silence=args.keep_silence,
+            seed=args.seed,
+            draft=args.draft,
+            watermark=args.watermark,
+            precision=args.precision,
+            backend=args.backend,
+            backend_options=backend_options,
+            torch_compile=args.torch_compile,
+            workers=args.workers,
+            worker_threads=args.worker_threads,
+            job_db=args.job_db,
+            progressive=args.progressive,
+            encode_jobs=args.encode_jobs,
+            export_chapters=args.export_chapters,
+            incremental=args.incremental,
+            dry_run=args.dry_run,
+            intermediate_format=args.intermediate_format,
+            scratch_dir=args.scratch_dir,
+            loudness_target=args.loudness_target
         )
     elapsed_time = time.time() - start_time
     logging.info(f"Script finished in {elapsed_time:.2f} seconds")
 
+def parse_ignore_list(args):
+    return [s.strip() for s in args.filterlist.split(',')] if args.filterlist else None
+
+
+def parse_backend_options(args):
+    if args.backend == 'fake':
+        return {'latency': args.fake_latency, 'rtf': args.fake_rtf}
+    if args.backend == 'onnx':
+        return {'threads': args.onnx_threads}
+    return None
+
+
+def remux(args):
+    from remux import remux_library
+
+    metadata = dict(item.split('=', 1) for item in args.metadata if '=' in item)
+    failed = remux_library(args.remux, jobs=args.encode_jobs, metadata=metadata,
+                           chapters_file=args.chapters, cover=args.cover)
+    if failed:
+        sys.exit(1)
+
+
+def submit_to_server(args):
+    """Thin client: queue the book(s) on a --serve daemon, optionally waiting for the results."""
+    from serve import submit_job, wait_for_job, fetch_result
+
+    if args.file:
+        files = [args.file]
+    elif args.batch:
+        files = [str(p) for p in sorted(Path(args.batch).iterdir()) if p.suffix.lower() in ('.epub', '.pdf')]
+    else:
+        logging.error('--server needs --file or --batch')
+        sys.exit(1)
+    options = {
+        'speed': args.speed,
+        'repetition_penalty': args.repetition_penalty,
+        'min_p': args.min_p,
+        'top_p': args.top_p,
+        'exaggeration': args.exaggeration,
+        'cfg_weight': args.cfg_weight,
+        'temperature': args.temperature,
+        'enable_silence_trimming': args.enable_silence_trimming,
+        'silence_thresh': args.silence_thresh,
+        'min_silence_len': args.min_silence_len,
+        'keep_silence': args.keep_silence,
+        'seed': args.seed,
+        'draft': args.draft,
+        'watermark': args.watermark,
+        'ignore_list': parse_ignore_list(args),
+        'progressive': args.progressive,
+        'export_chapters': args.export_chapters,
+        'incremental': args.incremental,
+        'loudness_target': args.loudness_target,
+    }
+    jobs = [submit_job(args.server, f, priority=args.priority, output_folder=args.output,
+                       audio_prompt_wav=args.wav, options=options) for f in files]
+    for job in jobs:
+        logging.info(f"Submitted {job['file_path']} as job {job['id']}")
+    if not args.wait:
+        return
+    failed = False
+    for job in jobs:
+        job = wait_for_job(args.server, job['id'])
+        if job['status'] == 'finished':
+            logging.info(f"Job {job['id']} finished: {fetch_result(args.server, job, args.output)}")
+        else:
+            logging.error(f"Job {job['id']} {job['status']}: {job['error']}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
 if __name__ == '__main__':
     logging.basicConfig(
         level=logging.INFO,
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in ``torch.compile`` of the hot modules of a loaded model (``--compile``).
+
+Compilation artifacts persist across runs in two layers:
+    - inductor's FX graph and AOTAutograd caches, pointed at COMPILE_CACHE_DIR
+    - on torch versions that have it, the portable cache bundle from
+      ``torch.compiler.save_cache_artifacts``, reloaded before compiling
+so only the first run on a node pays the full compile cost; later runs
+mostly load kernels from disk.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+
+import torch
+
+COMPILE_CACHE_DIR = Path(os.environ.get(
+    "CHATTERBLEZ_COMPILE_CACHE", Path.home() / ".cache" / "chatterblez" / "torch_compile"))
+# Short enough to be cheap, long enough to exercise prefill and decode steps
+WARMUP_TEXT = "The quick brown fox jumps over the lazy dog."
+
+
+def _artifacts_path(cache_dir):
+    return Path(cache_dir) / f"artifacts-torch{torch.__version__}.bin"
+
+
+def enable_compile_cache(cache_dir=COMPILE_CACHE_DIR):
+    """Point inductor's on-disk caches at ``cache_dir`` and load saved artifacts."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache_dir / "inductor"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+    artifacts = _artifacts_path(cache_dir)
+    if artifacts.exists() and hasattr(torch.compiler, "load_cache_artifacts"):
+        try:
+            torch.compiler.load_cache_artifacts(artifacts.read_bytes())
+            logging.info(f"Loaded compilation artifacts from {artifacts}")
+        except Exception as e:
+            logging.warning(f"Ignoring unusable compilation artifacts {artifacts}: {e}")
+
+
+def save_compile_cache(cache_dir=COMPILE_CACHE_DIR):
+    """Persist this process's compilation artifacts for the next run."""
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return
+    saved = torch.compiler.save_cache_artifacts()
+    if not saved:
+        return
+    artifacts = _artifacts_path(cache_dir)
+    try:
+        tmp_path = artifacts.with_suffix(".tmp")
+        tmp_path.write_bytes(saved[0])
+        os.replace(tmp_path, artifacts)
+    except OSError as e:
+        logging.warning(f"Could not save compilation artifacts to {artifacts}: {e}")
+
+
+def compile_modules(root, targets):
+    """Replace each dotted attribute path in ``targets`` under ``root`` with its compiled version."""
+    for path in targets:
+        parent_path, _, name = path.rpartition(".")
+        parent = root
+        for part in filter(None, parent_path.split(".")):
+            parent = getattr(parent, part)
+        # Text and mel lengths vary per batch; compile for dynamic shapes up front
+        setattr(parent, name, torch.compile(getattr(parent, name), dynamic=True))
+
+
+def compile_backend(tts, cache_dir=COMPILE_CACHE_DIR):
+    """
+    Compile ``tts``'s hot modules and warm them up on WARMUP_TEXT, so the first
+    batch of the book runs compiled code. Returns the seconds spent, which
+    callers report apart from synthesis time.
+    """
+    start = time.perf_counter()
+    enable_compile_cache(cache_dir)
+    if not tts.compile():
+        logging.warning(f"The {tts.name} backend has nothing to compile; running eagerly")
+        return 0.0
+    tokens = tts.generate_tokens(WARMUP_TEXT, tts.max_tokens(), seed=0)
+    tts.decode(tokens)
+    save_compile_cache(cache_dir)
+    seconds = time.perf_counter() - start
+    logging.info(f"Compiled and warmed up {tts.name} in {seconds:.1f}s (cache: {cache_dir})")
+    return seconds
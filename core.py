@@ -7,7 +7,6 @@
 import logging
 import os
 import sys
-import traceback
 from glob import glob
 
 import torch.cuda
@@ -15,7 +14,6 @@ import spacy
 import ebooklib
 import soundfile
 import numpy as np
-import librosa
 import time
 import shutil
 import subprocess
@@ -30,13 +28,29 @@ from bs4 import BeautifulSoup
 from ebooklib import epub
 from pick import pick
 import threading
-import queue  # Import queue for concurrent reading
+import random
+import hashlib
+import inspect
+import json
+import queue
 from pydub import AudioSegment
 from pydub.silence import split_on_silence
 
-from functools import lru_cache
+from functools import lru_cache, partial
 from ebooklib.epub import EpubReader
 
+from backends import DEFAULT_BACKEND, default_device, get_backend
+from compilation import compile_backend
+from workers import fork_supported, run_worker_pool
+from scheduler import estimate_book, plan_units, log_schedule, report_makespan
+from jobdb import JOB_DB_NAME, JobDB
+from progressive import ProgressiveM4B
+from encoding import ChapterEncoder, m4b_mux_args, run_ffmpeg, write_ffmetadata
+from manifest import RENDER_STORE, RenderManifest, log_diff, render_fingerprint
+from intermediates import DEFAULT_INTERMEDIATE_FORMAT, ChapterWriter
+from timestretch import wsola
+from loudness import LoudnessNormalizer
+
 _original_read_file = EpubReader.read_file
 
 def _safe_read_file(self, name):
@@ -48,135 +62,80 @@ def _safe_read_file(self, name):
 
 EpubReader.read_file = _safe_read_file
 sample_rate = 24000
+# Job seed used when none is given, so two runs of the same book match
+DEFAULT_SEED = 12345
+
+# main() parameters that shape a chapter's audio; a change re-renders it under --incremental
+RENDER_SETTINGS = (
+    'speed', 'repetition_penalty', 'min_p', 'top_p', 'exaggeration', 'cfg_weight', 'temperature',
+    'enable_silence_trimming', 'silence_thresh', 'min_silence_len', 'keep_silence',
+    'seed', 'draft', 'watermark', 'precision', 'backend',
+)
+# Per-book scratch directories live here, in the output folder or under --scratch-dir
+SCRATCH_DIR_NAME = '.chatterblez-scratch'
+# AAC bitrate of the final audiobook
+DEFAULT_BITRATE = '64k'
+# Cheapest settings the model allows, for proofing renders (--draft).
+# cfg_weight=0 decodes one sequence per step instead of a CFG pair, and
+# top_p=1 / repetition_penalty=1 skip the vocab sort and penalty gather.
+DRAFT_PROFILE = {
+    "cfg_weight": 0.0,
+    "top_p": 1.0,
+    "repetition_penalty": 1.0,
+}
+DRAFT_BITRATE = '32k'
+# Where the Perth watermark is applied: once over each finished chapter
+# ('chapter'), on every generated clip like ChatterboxTTS.generate ('batch'),
+# or not at all ('off')
+WATERMARK_MODES = ('chapter', 'batch', 'off')
+# Latest synthesis throughput per quality profile, used for the run summary
+THROUGHPUT_LOG = Path("logs") / "throughput.json"
 import perth
 if perth.PerthImplicitWatermarker is None:
     perth.PerthImplicitWatermarker = perth.DummyWatermarker
 
-def apply_voice_speed(audio_path: str, speed: float, target_sr: int = sample_rate):
-    """
-    Apply time-stretching to an audio file without changing pitch.
+def time_stretch(audio, speed, sr=sample_rate):
+    """Time-stretch ``audio`` (``(N,)`` or ``(channels, N)``) by ``speed`` without changing pitch (WSOLA)."""
+    if audio.ndim == 1:
+        return wsola(audio, speed, sr)
+    return np.vstack([wsola(ch, speed, sr) for ch in audio])
 
-    Args:
-        audio_path: Path to the audio file to modify in place.
-        speed: Playback speed multiplier (> 0). Values >1 speed up audio.
-        target_sr: Target sample rate for loading/writing.
-    """
-    if not audio_path or speed is None:
-        return
+
+def voice_speed_step(speed, sr=sample_rate):
+    """ChapterWriter step for voice speed ``speed`` (WSOLA), or None when there is nothing to do."""
+    if speed is None or abs(speed - 1.0) < 1e-3:
+        return None
     if speed <= 0:
         logging.warning(f"Invalid voice speed {speed}; skipping time-stretch.")
-        return
-    if abs(speed - 1.0) < 1e-3:
-        return
-    try:
-        audio, sr = librosa.load(audio_path, sr=None, mono=False, res_type="soxr_vhq")
-
-        # time_stretch requires mono input — process per channel
-        if audio.ndim == 1:
-            stretched = librosa.effects.time_stretch(audio, rate=speed)
-        else:
-            stretched = np.vstack([
-                librosa.effects.time_stretch(ch, rate=speed)
-                for ch in audio  # audio shape: (channels, N)
-            ])
-
-        # soundfile expects (N, channels), librosa gives (channels, N)
-        out = stretched.T if stretched.ndim > 1 else stretched
-        soundfile.write(audio_path, out, sr)
+        return None
 
-        logging.info(f"Applied voice speed {speed:.2f}x to {audio_path}")
-    except Exception as exc:
-        logging.error(f"Failed to apply voice speed {speed} to {audio_path}: {exc}")
+    def step(audio):
+        try:
+            return time_stretch(audio, speed, sr)
+        except Exception as exc:
+            logging.error(f"Failed to apply voice speed {speed}: {exc}")
+            return audio
+    return step
 
 
-def remove_silence_from_audio(input_file, output_file, silence_thresh=-50, min_silence_len=1000, keep_silence=200):
+def trim_silence(audio, sr, silence_thresh=-50, min_silence_len=1000, keep_silence=200):
     """
-    Remove silences from an audio file using pydub with high quality.
-
-    Args:
-        input_file: Path to input audio file.
-        output_file: Path to output audio file.
-        silence_thresh: Silence threshold in dBFS (try -50 to -60).
-        min_silence_len: Minimum silence length in milliseconds to remove.
-        keep_silence: Amount of silence to keep in ms.
+    Cut silences longer than ``min_silence_len`` ms from mono float audio,
+    keeping ``keep_silence`` ms at each edge; returns ``audio`` unchanged if
+    no speech is found.
     """
-    # Load audio file
-    audio = AudioSegment.from_file(input_file)
-
-    # Analyze audio loudness for debugging
-    logging.info(f"Audio dBFS: {audio.dBFS:.2f}")
-    logging.info(f"Max dBFS: {audio.max_dBFS:.2f}")
-    logging.info(f"Sample rate: {audio.frame_rate}Hz")
-    logging.info(f"Channels: {audio.channels}")
-    logging.info(f"Sample width: {audio.sample_width} bytes")
-
-    # Split audio on silence
-    chunks = split_on_silence(
-        audio,
-        min_silence_len=min_silence_len,
-        silence_thresh=silence_thresh,
-        keep_silence=keep_silence
-    )
-
-    # Check if any chunks were found
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    segment = AudioSegment(pcm.tobytes(), frame_rate=sr, sample_width=2, channels=1)
+    chunks = split_on_silence(segment, min_silence_len=min_silence_len, silence_thresh=silence_thresh,
+                              keep_silence=keep_silence)
     logging.info(f"Found {len(chunks)} audio chunks")
-
-    if len(chunks) == 0:
+    if not chunks:
         logging.warning("WARNING: No audio chunks found! Adjust silence_thresh or min_silence_len")
-        logging.warning(f"Try setting silence_thresh to {audio.dBFS - 10:.1f} dBFS")
-        return
-
-    # Combine chunks
-    combined = AudioSegment.empty()
-    for chunk in chunks:
-        combined += chunk
-
-    # Export based on file extension
-    output_format = Path(output_file).suffix[1:].lower()
-
-    if output_format == 'wav':
-        # Export as WAV with PCM (uncompressed)
-        combined.export(
-            output_file,
-            format='wav',
-            parameters=[
-                '-ar', str(audio.frame_rate),  # Preserve sample rate
-                '-ac', str(audio.channels)  # Preserve channels
-            ]
-        )
-    elif output_format in ['m4a', 'm4b']:
-        # Export as M4A/M4B with AAC
-        export_params = {
-            'format': 'ipod',
-            'codec': 'aac',
-            'bitrate': '128k',
-            'parameters': [
-                '-ar', str(audio.frame_rate),
-                '-ac', str(audio.channels),
-                '-q:a', '2'
-            ]
-        }
-
-        if output_format == 'm4b':
-            temp_output = Path(output_file).with_suffix('.m4a')
-            combined.export(temp_output, **export_params)
-            if os.path.exists(output_file):
-                os.remove(output_file)
-            os.rename(temp_output, output_file)
-        else:
-            combined.export(output_file, **export_params)
-    else:
-        # For other formats, let pydub handle it
-        combined.export(output_file, format=output_format)
-
-    logging.info(f"Processed audio saved to: {output_file}")
-    original_duration = len(audio) / 1000
-    new_duration = len(combined) / 1000
-    removed_time = original_duration - new_duration
-
-    logging.info(f"\nOriginal duration: {original_duration:.2f}s")
-    logging.info(f"New duration: {new_duration:.2f}s")
-    logging.info(f"Removed silence: {removed_time:.2f}s ({removed_time / original_duration * 100:.1f}%)")
+        logging.warning(f"Try setting silence_thresh to {segment.dBFS - 10:.1f} dBFS")
+        return audio
+    trimmed = np.concatenate([np.array(c.get_array_of_samples(), dtype=np.int16) for c in chunks])
+    logging.info(f"Removed silence: {(len(audio) - len(trimmed)) / sr:.2f}s")
+    return trimmed.astype(np.float32) / 32768
 
 
 import string
@@ -393,15 +352,54 @@ def clean_line(line: str) -> str:
     line = multiple_periods_re.sub('.', line)                 # Remove repeated .
     line = space_re.sub(' ', line)                            # Collapse spaces
     return line.strip()
+
+
+def clean_chapter_text(text: str) -> str:
+    """The text that gets synthesized for a chapter: cleaned lines that contain a word."""
+    return "\n".join(
+        cleaned_line
+        for line in text.splitlines()
+        if (cleaned_line := clean_line(line)).strip() and re.search(r'\w', cleaned_line)
+    )
+
+
 def main(file_path, pick_manually, speed, book_year='', output_folder='.',
          max_chapters=None, max_sentences=None, selected_chapters=None, post_event=None, audio_prompt_wav=None, batch_files=None, ignore_list=None, should_stop=None,
          repetition_penalty=1.1, min_p=0.02, top_p=0.95, exaggeration=0.4, cfg_weight=0.8, temperature=0.85,
-         enable_silence_trimming=False, silence_thresh=-50, min_silence_len=500, keep_silence=100):
+         enable_silence_trimming=False, silence_thresh=-50, min_silence_len=500, keep_silence=100, seed=DEFAULT_SEED,
+         draft=False, watermark='chapter', precision='fp32', backend=DEFAULT_BACKEND, backend_options=None,
+         torch_compile=False, workers=1, worker_threads=None, tts=None, render_only=False, job_db=None,
+         progressive=False, encode_jobs=None, export_chapters=None, incremental=False, dry_run=False,
+         intermediate_format=DEFAULT_INTERMEDIATE_FORMAT, scratch_dir=None, loudness_target=None):
     """
     Main entry point for audiobook synthesis.
     - ignore_list: list of chapter names to ignore (case-insensitive substring match)
     - batch_files: if provided, a list of file paths to process sequentially
     - should_stop: optional callback, returns True if synthesis should be interrupted
+    - seed: job seed; every batch is seeded from it and the batch text (see batch_seed)
+    - draft: fast proofing render (DRAFT_PROFILE sampling, no post-processing, low bitrate)
+    - watermark: one of WATERMARK_MODES
+    - precision: CPU inference precision, one of precision.PRECISION_MODES
+    - backend: name of the TTS engine (see backends.BACKENDS); backend_options are passed to it
+    - torch_compile: torch.compile the backend's hot modules and warm them up before the first chapter
+    - workers: with batch_files, synthesize this many books at once in forked workers that
+      share one copy of the model (see workers.py); worker_threads is each one's torch thread budget
+    - tts: an already loaded backend to use instead of loading one
+    - render_only: only synthesize the chapter WAVs; skip muxing and cleanup (see scheduler.py)
+    - job_db: path of the SQLite job database recording progress for crash-safe resume
+      (see jobdb.py); batch runs default to JOB_DB_NAME in the output folder
+    - progressive: keep a playable <book>.partial.m4b growing chapter by chapter while rendering,
+      then finish the m4b by stream copy (see progressive.py)
+    - encode_jobs: concurrent per-chapter AAC encodes (default: one per core, see encoding.py)
+    - export_chapters: also write each chapter as a standalone file, one of encoding.EXPORT_FORMATS
+    - incremental: reuse the audio of chapters whose text, voice and settings are unchanged since
+      the last render of this book, even if renamed or moved (see manifest.py)
+    - dry_run: only log which chapters an incremental re-render would reuse, render or drop
+    - intermediate_format: file format of the chapter audio between synthesis and encoding,
+      one of intermediates.INTERMEDIATE_FORMATS
+    - scratch_dir: where the job's scratch directory is made (e.g. /dev/shm); default: output_folder
+    - loudness_target: bring every chapter to this integrated loudness in LUFS (e.g. -18); None leaves levels as
+      synthesized
     """
     logging.basicConfig(
         level=logging.INFO,
@@ -412,6 +410,18 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
         ]
     )
     logging.getLogger('chatterbox').setLevel(logging.WARNING)
+    bitrate = DEFAULT_BITRATE
+    # Applied before the parameters are fingerprinted, in batch runs too, so finished drafts are recognised;
+    # the per-book calls of a batch apply the same constants again
+    if draft:
+        logging.info("Draft mode: using DRAFT_PROFILE sampling, skipping post-processing, encoding at %s", DRAFT_BITRATE)
+        repetition_penalty = DRAFT_PROFILE["repetition_penalty"]
+        top_p = DRAFT_PROFILE["top_p"]
+        cfg_weight = DRAFT_PROFILE["cfg_weight"]
+        enable_silence_trimming = False
+        loudness_target = None
+        speed = 1.0
+        bitrate = DRAFT_BITRATE
     params = {
         "speed": speed,
         "repetition_penalty":repetition_penalty,
@@ -424,6 +434,24 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
         "silence_thresh":silence_thresh,
         "min_silence_len":min_silence_len,
         "keep_silence":keep_silence,
+        "seed":seed,
+        "draft":draft,
+        "watermark":watermark,
+        "precision":precision,
+        "backend":backend,
+        "backend_options":backend_options,
+        "torch_compile":torch_compile,
+        "workers":workers,
+        "worker_threads":worker_threads,
+        "job_db":job_db,
+        "progressive":progressive,
+        "encode_jobs":encode_jobs,
+        "export_chapters":export_chapters,
+        "incremental":incremental,
+        "dry_run":dry_run,
+        "intermediate_format":intermediate_format,
+        "scratch_dir":scratch_dir,
+        "loudness_target":loudness_target,
     }
 
     # Log all parameters
@@ -431,10 +459,22 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
         logging.info(f"{key} = {value}")
     if should_stop is None:
         should_stop = lambda: False
+    if watermark not in WATERMARK_MODES:
+        raise ValueError(f"watermark must be one of {WATERMARK_MODES}, got {watermark!r}")
 
+    fingerprint = book_fingerprint(params, audio_prompt_wav, max_sentences)
     if batch_files is not None:
-        # Sequentially process each file in batch_files
-        for batch_file in batch_files:
+        if job_db is None:
+            job_db = Path(output_folder) / JOB_DB_NAME
+        # Finished books are skipped before they are even opened for estimation
+        finished = [f for f in batch_files if JobDB(job_db).is_book_finished(f, fingerprint)]
+        for f in finished:
+            logging.info(f"Skipping {f}: already finished according to {job_db}")
+            if post_event:
+                post_event('CORE_FILE_FINISHED', file_path=f)
+        batch_files = [f for f in batch_files if f not in finished]
+
+        def synthesize_file(batch_file, tts=None, post_event=post_event, selected_chapters=None, render_only=False):
             # Call main for each file, passing ignore_list and other params
             main(
                 file_path=batch_file,
@@ -444,7 +484,7 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
                 output_folder=output_folder,
                 max_chapters=max_chapters,
                 max_sentences=max_sentences,
-                selected_chapters=None,
+                selected_chapters=selected_chapters,
                 post_event=post_event,
                 audio_prompt_wav=audio_prompt_wav,
                 batch_files=None,  # Prevent infinite recursion
@@ -460,11 +500,69 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
                 silence_thresh=silence_thresh,
                 min_silence_len=min_silence_len,
                 keep_silence=keep_silence,
+                seed=seed,
+                draft=draft,
+                watermark=watermark,
+                precision=precision,
+                backend=backend,
+                backend_options=backend_options,
+                torch_compile=torch_compile,
+                tts=tts,
+                render_only=render_only,
+                job_db=job_db,
+                progressive=progressive,
+                encode_jobs=encode_jobs,
+                export_chapters=export_chapters,
+                incremental=incremental,
+                dry_run=dry_run,
+                intermediate_format=intermediate_format,
+                scratch_dir=scratch_dir,
+                loudness_target=loudness_target,
             )
-            if post_event:
-                post_event('CORE_FILE_FINISHED', file_path=batch_file)
-            if should_stop():
-                break
+
+        def run_unit(unit, tts, post_event=post_event):
+            # Parts of a split book only render their chapters; the book is muxed afterwards
+            synthesize_file(unit.book.file_path, tts, post_event=post_event,
+                            selected_chapters=unit.chapters, render_only=unit.chapters is not None)
+            if post_event and unit.chapters is None:
+                post_event('CORE_FILE_FINISHED', file_path=unit.book.file_path)
+
+        if workers > 1:
+            tts, _ = load_tts(backend, backend_options, precision, audio_prompt_wav, torch_compile)
+            if str(tts.device) != 'cpu' or not fork_supported():
+                logging.warning(f"Worker pool needs fork and a CPU model ({tts.device}); processing files sequentially")
+                workers = 1
+
+        # Longest work first, so no long book is left for the end of the night
+        books = [estimate_book(f, ignore_list) for f in batch_files]
+        units = plan_units(books, workers)
+        predicted = log_schedule(units, workers, expected_throughput(draft))
+        batch_start = time.perf_counter()
+
+        if workers > 1:
+            # Workers report back through the pool; post_event is not process-safe
+            def on_job_done(i):
+                if post_event and units[i].chapters is None:
+                    post_event('CORE_FILE_FINISHED', file_path=units[i].book.file_path)
+
+            run_worker_pool(list(range(len(units))), lambda i: run_unit(units[i], tts, post_event=None), workers,
+                            threads_per_worker=worker_threads, on_job_done=on_job_done)
+        else:
+            for unit in units:
+                run_unit(unit, tts)
+                if should_stop():
+                    break
+        for book in books:
+            if book.split and not should_stop():
+                # All chapters exist now, so this only muxes
+                synthesize_file(book.file_path, tts)
+                if post_event:
+                    post_event('CORE_FILE_FINISHED', file_path=book.file_path)
+        report_makespan(predicted, time.perf_counter() - batch_start)
+        return
+
+    if job_db and JobDB(job_db).is_book_finished(file_path, fingerprint):
+        logging.info(f"Skipping {file_path}: already finished with these settings according to {job_db}")
         return
 
     if post_event: post_event('CORE_STARTED')
@@ -538,6 +636,17 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
     print_selected_chapters(document_chapters, selected_chapters)
     texts = [c.extracted_text for c in selected_chapters]
 
+    manifest = None
+    if incremental or dry_run:
+        manifest = RenderManifest(Path(output_folder) / RENDER_STORE / Path(filename).stem, fingerprint)
+        if dry_run:
+            planned = [(c.get_name(), clean_chapter_text(c.extracted_text))
+                       for c in selected_chapters[:max_chapters or None]]
+            logging.info(f"Dry run for {file_path}:")
+            log_diff(manifest.diff([(name, text) for name, text in planned if len(text.strip()) >= 10]))
+            allow_sleep()
+            return
+
     has_ffmpeg = shutil.which('ffmpeg') is not None
     if not has_ffmpeg:
         logging.error('ffmpeg not found. Please install ffmpeg to create mp3 and m4b audiobook files.')
@@ -552,125 +661,203 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
         chars_per_sec=500 if torch.cuda.is_available() else 50,  # initial guess
         start_time=time.perf_counter(),
         eta='–',
-        progress=0
+        progress=0,
+        budget_retries=0,
+        budget_failures=0,
+        synth_chars=0,
+        synth_seconds=0.0,
+        stage_times={'t3': 0.0, 's3gen': 0.0, 'watermark': 0.0},
+        compile_seconds=0.0,
     )
     logging.info('Started at: %s', time.strftime('%H:%M:%S'))
     logging.info(f'Total characters: {stats.total_chars:,}')
     logging.info('Total words: %d', len(' '.join(texts).split()))
     eta = strfdelta((stats.total_chars - stats.processed_chars) / stats.chars_per_sec)
     logging.info(f'Estimated time remaining (assuming {stats.chars_per_sec} chars/sec): {eta}')
-    chapter_wav_files = []
-
-    import torchaudio as ta
-    from chatterbox.tts import ChatterboxTTS
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    logging.info(f'running on device: {device}')
-
-    cb_model = ChatterboxTTS.from_pretrained(device=device)
-
-    # If a custom audio prompt is provided, use it
-    if audio_prompt_wav:
-        AUDIO_PROMPT_PATH = audio_prompt_wav
-        cb_model.prepare_conditionals(wav_fpath=AUDIO_PROMPT_PATH)
-    # You must set AUDIO_PROMPT_PATH to the correct path for your audio prompt
-    # AUDIO_PROMPT_PATH = "audio_prompt.wav"  # <-- Set this to your actual prompt file
-    # cb_model.prepare_conditionals(wav_fpath=AUDIO_PROMPT_PATH)
+    db = JobDB(job_db) if job_db else None
+    book_id = db.start_book(file_path, title, fingerprint) if db else None
+    scratch = job_scratch_dir(file_path, output_folder, scratch_dir)
+    logging.info(f'Scratch directory: {scratch}')
+
+    if tts is None:
+        tts, stats.compile_seconds = load_tts(backend, backend_options, precision, audio_prompt_wav, torch_compile)
+
+    # Chapters are encoded in the background as each one is final; parts of a split book are encoded by the mux run
+    encoder = progressive_book = None
+    if not render_only:
+        stem = Path(filename).stem
+        encoder = ChapterEncoder(scratch / "encoded", bitrate, jobs=encode_jobs,
+                                 export_format=export_chapters, export_dir=Path(output_folder) / f"{stem}_chapters")
+        if progressive:
+            progressive_book = ProgressiveM4B(encoder, Path(output_folder) / f"{stem}.partial.m4b", title, creator)
+
+    def chapter_ready(wav_path, duration, name, index, chapter_hash, chapter_id=None, parts_dir=None):
+        # Runs on the writer thread in book order, once the chapter's final audio is on disk
+        if chapter_id is not None:
+            db.finish_chapter(chapter_id, wav_path, duration)
+            if parts_dir is not None:
+                shutil.rmtree(parts_dir, ignore_errors=True)
+        # Parts of a split book render in parallel processes; the mux run records every chapter once
+        if manifest is not None and not render_only:
+            manifest.record(chapter_hash, name, index, wav_path, duration)
+        # Final chapter audio is encoded (and appended to the progressive file) while synthesis goes on
+        if progressive_book is not None:
+            progressive_book.add_chapter(wav_path)
+        elif encoder is not None:
+            encoder.submit(wav_path)
+
+    # Trimming, voice speed and the write of each chapter overlap with synthesis of the next
+    writer = ChapterWriter(intermediate_format)
+    post_steps = []
+    if enable_silence_trimming:
+        post_steps.append(partial(trim_silence, sr=tts.sample_rate, silence_thresh=silence_thresh,
+                                  min_silence_len=min_silence_len, keep_silence=keep_silence))
+    speed_step = voice_speed_step(speed, tts.sample_rate)
+    if speed_step is not None:
+        post_steps.append(speed_step)
+    normalizer = None
+    if loudness_target is not None:
+        # Measured after trimming and speed, on the audio that is actually written
+        normalizer = LoudnessNormalizer(tts.sample_rate, loudness_target)
+        post_steps.append(normalizer)
 
     chapter_wav_files = []
+    chapter_hashes = []
     nlp = get_nlp()
-    for i, chapter in enumerate(selected_chapters, start=1):
-        if should_stop():
-            logging.info("Synthesis interrupted by user (chapter loop).")
-            break
-        if max_chapters and i > max_chapters: break
-        lines = chapter.extracted_text.splitlines()
-        text = "\n".join(
-            cleaned_line
-            for line in lines
-            if (
-                cleaned_line :=  clean_line(line)
-            ).strip() and re.search(r'\w', cleaned_line)
-        )
-
-        # Sanitize the chapter name to remove all non-alphanumeric characters for the filename
-        xhtml_file_name = re.sub(r'[^a-zA-Z0-9-]', '', chapter.get_name()).replace('xhtml', '').replace('html', '')
-        chapter_wav_path = Path(output_folder) / filename.replace(extension, f'_chapter_{xhtml_file_name}.wav')
-        chapter_wav_files.append(chapter_wav_path)
-        if Path(chapter_wav_path).exists():
-            logging.info(f'File for chapter {i} already exists. Skipping')
-            stats.processed_chars += len(text)
-            if post_event and hasattr(chapter, "chapter_index"):
-                post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
-            continue
-        if len(text.strip()) < 10:
-            logging.info(f'Skipping empty chapter {i}')
-            chapter_wav_files.remove(chapter_wav_path)
-            continue
-
-        logging.info(f'Writing  {text}')
-        start_time = time.time()
-        if post_event and hasattr(chapter, "chapter_index"):
-            post_event('CORE_CHAPTER_STARTED', chapter_index=chapter.chapter_index)
-        audio_segments = gen_audio_segments(
-            cb_model,
-            nlp,
-            text,
-            speed,
-            stats,
-            post_event=post_event,
-            max_sentences=max_sentences,
-            should_stop=should_stop,
-            repetition_penalty=repetition_penalty,
-            min_p=min_p,
-            top_p=top_p,
-            exaggeration=exaggeration,
-            cfg_weight=cfg_weight,
-            temperature=temperature
-        )
-        if should_stop():
-            logging.info("Synthesis interrupted by user (after audio_segments).")
-            break
-        if audio_segments:
-            final_audio = np.concatenate(audio_segments)
-            soundfile.write(chapter_wav_path, final_audio, sample_rate)
-
-            if enable_silence_trimming:
-                trimmed_path = chapter_wav_path.with_suffix('.trimmed.wav')
-                remove_silence_from_audio(
-                    chapter_wav_path,
-                    trimmed_path,
-                    silence_thresh=silence_thresh,
-                    min_silence_len=min_silence_len,
-                    keep_silence=keep_silence
-                )
-                # Replace original with trimmed
-                os.remove(chapter_wav_path)
-                os.rename(trimmed_path, chapter_wav_path)
-
-            apply_voice_speed(chapter_wav_path, speed)
-
-            end_time = time.time()
-            delta_seconds = end_time - start_time
-            chars_per_sec = len(text) / delta_seconds
-            logging.info('Chapter written to %s', chapter_wav_path)
+    try:
+        for i, chapter in enumerate(selected_chapters, start=1):
+            if should_stop():
+                logging.info("Synthesis interrupted by user (chapter loop).")
+                break
+            if max_chapters and i > max_chapters: break
+            text = clean_chapter_text(chapter.extracted_text)
+
+            # Sanitize the chapter name to remove all non-alphanumeric characters for the filename
+            xhtml_file_name = re.sub(r'[^a-zA-Z0-9-]', '', chapter.get_name()).replace('xhtml', '').replace('html', '')
+            chapter_wav_path = scratch / filename.replace(extension, f'_chapter_{xhtml_file_name}{writer.suffix}')
+            chapter_wav_files.append(chapter_wav_path)
+            chapter_hash = manifest.chapter_hash(text) if manifest is not None else None
+            if db is not None:
+                # A WAV on disk may be a half-written one from a crash; only trust finished records
+                done_row = db.finished_chapter(book_id, chapter.get_name(), text)
+                already_done = done_row is not None
+            else:
+                done_row = None
+                already_done = Path(chapter_wav_path).exists()
+                if manifest is not None and already_done and manifest.lookup(chapter_hash) is None:
+                    # Left over from an earlier edition under the same name
+                    already_done = False
+            if already_done:
+                logging.info(f'File for chapter {i} already exists. Skipping')
+                stats.processed_chars += len(text)
+                duration = done_row['duration'] if done_row else soundfile.info(str(chapter_wav_path)).duration
+                if manifest is not None:
+                    chapter_hashes.append(chapter_hash)
+                writer.call(chapter_ready, chapter_wav_path, duration, chapter.get_name(), i, chapter_hash)
+                if post_event and hasattr(chapter, "chapter_index"):
+                    post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
+                continue
+            if len(text.strip()) < 10:
+                logging.info(f'Skipping empty chapter {i}')
+                chapter_wav_files.remove(chapter_wav_path)
+                continue
+            if manifest is not None and manifest.restore(chapter_hash, chapter_wav_path):
+                logging.info(f'Chapter {i} is unchanged since its last render; reusing its audio')
+                stats.processed_chars += len(text)
+                duration = soundfile.info(str(chapter_wav_path)).duration
+                chapter_id = db.start_chapter(book_id, chapter.get_name(), i, text, chapter_wav_path) if db else None
+                chapter_hashes.append(chapter_hash)
+                writer.call(chapter_ready, chapter_wav_path, duration, chapter.get_name(), i, chapter_hash,
+                            chapter_id=chapter_id)
+                if post_event and hasattr(chapter, "chapter_index"):
+                    post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
+                continue
+
+            chapter_id = parts_dir = None
+            if db is not None:
+                chapter_id = db.start_chapter(book_id, chapter.get_name(), i, text, chapter_wav_path)
+                parts_dir = scratch / "parts" / str(chapter_id)
+
+            logging.info(f'Writing  {text}')
+            start_time = time.time()
             if post_event and hasattr(chapter, "chapter_index"):
-                post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
-            logging.info(f'Chapter {i} read in {delta_seconds:.2f} seconds ({chars_per_sec:.0f} characters per second)')
-        else:
-            logging.warning(f'Warning: No audio generated for chapter {i}')
-            chapter_wav_files.remove(chapter_wav_path)
+                post_event('CORE_CHAPTER_STARTED', chapter_index=chapter.chapter_index)
+            audio_segments = gen_audio_segments(
+                tts,
+                nlp,
+                text,
+                speed,
+                stats,
+                post_event=post_event,
+                max_sentences=max_sentences,
+                should_stop=should_stop,
+                repetition_penalty=repetition_penalty,
+                min_p=min_p,
+                top_p=top_p,
+                exaggeration=exaggeration,
+                cfg_weight=cfg_weight,
+                temperature=temperature,
+                seed=seed,
+                watermark_batches=watermark == 'batch',
+                job_db=db,
+                chapter_id=chapter_id,
+                parts_dir=parts_dir,
+            )
+            if should_stop():
+                logging.info("Synthesis interrupted by user (after audio_segments).")
+                break
+            stats.synth_chars += len(text)
+            stats.synth_seconds += time.time() - start_time
+            if audio_segments:
+                final_audio = np.concatenate(audio_segments)
+                if watermark == 'chapter':
+                    wm_start = time.perf_counter()
+                    final_audio = tts.watermark(final_audio)
+                    wm_seconds = time.perf_counter() - wm_start
+                    stats.stage_times['watermark'] += wm_seconds
+                    logging.info(f'Watermarked chapter {i} in {wm_seconds:.2f}s')
+                if manifest is not None:
+                    chapter_hashes.append(chapter_hash)
+                writer.write(chapter_wav_path, final_audio, tts.sample_rate, steps=post_steps,
+                             on_written=partial(chapter_ready, name=chapter.get_name(), index=i,
+                                                chapter_hash=chapter_hash, chapter_id=chapter_id, parts_dir=parts_dir))
+
+                end_time = time.time()
+                delta_seconds = end_time - start_time
+                chars_per_sec = len(text) / delta_seconds
+                logging.info('Chapter queued for writing to %s', chapter_wav_path)
+                if post_event and hasattr(chapter, "chapter_index"):
+                    post_event('CORE_CHAPTER_FINISHED', chapter_index=chapter.chapter_index)
+                logging.info(f'Chapter {i} read in {delta_seconds:.2f} seconds ({chars_per_sec:.0f} characters per second)')
+            else:
+                logging.warning(f'Warning: No audio generated for chapter {i}')
+                chapter_wav_files.remove(chapter_wav_path)
+        writer.close()
+    except BaseException:
+        # A failed chapter write surfaces here: stop the background work, keep what is playable, let sleep again
+        writer.abort()
+        if progressive_book is not None:
+            progressive_book.close()
+        if encoder is not None:
+            encoder.close(cancel=True)
+        allow_sleep()
+        raise
+    finally:
+        writer.report()
+        if normalizer is not None:
+            normalizer.report()
 
     if not chapter_wav_files:
         logging.error("No audio chapters were generated. Cannot create audiobook.")
         if post_event:
             post_event('CORE_ERROR', message="No audio chapters were generated.")
+        if encoder is not None:
+            encoder.close()
         allow_sleep()
         return
 
-    if not chapter_wav_files:
-        logging.error("No audio chapters were generated. Cannot create audiobook.")
-        if post_event:
-            post_event('CORE_ERROR', message="No audio chapters were generated.")
+    if render_only:
+        logging.info('Chapters rendered; leaving audiobook assembly to a later run (render_only)')
         allow_sleep()
         return
 
@@ -681,42 +868,114 @@ def main(file_path, pick_manually, speed, book_year='', output_folder='.',
         output_folder = Path(output_folder) / new_dir_name
         output_folder.mkdir(parents=True, exist_ok=True)
 
+    m4b_path = None
+    if has_ffmpeg and should_stop():
+        logging.info("Synthesis interrupted before the audiobook was assembled.")
+        if progressive_book is not None:
+            logging.info(f"The chapters so far stay playable in {progressive_book.partial_path}")
+        encoder.close()
+        allow_sleep()
+        return
     if has_ffmpeg:
-        create_index_file(title, creator, chapter_wav_files, output_folder)
+        final_path = safe_concat_path(output_folder, f"{Path(filename).stem}.m4b")
         try:
-            concat_file_path = concat_wavs_with_ffmpeg(chapter_wav_files, output_folder, filename,
-                                                       post_event=post_event, should_stop=should_stop)
-            if should_stop() or concat_file_path is None:
-                logging.info("Synthesis interrupted before or during FFmpeg concat.")
-                allow_sleep()
-                return
-            create_m4b(concat_file_path, filename, cover_image, output_folder, post_event=post_event, should_stop=should_stop)
-            if should_stop():
-                logging.info("Synthesis interrupted before or during FFmpeg m4b creation.")
-                allow_sleep()
-                return
-            if post_event: post_event('CORE_FINISHED')
+            # Every chapter is encoded already (or still encoding); only stream-copy muxing is left
+            if progressive_book is not None:
+                m4b_path = progressive_book.finalize(final_path, cover_image)
+            else:
+                concat_file_path = encoder.concat(chapter_wav_files, scratch / "book.aac")
+                create_index_file(title, creator, [encoder.duration(c) for c in chapter_wav_files], scratch)
+                m4b_path = create_m4b(concat_file_path, filename, cover_image, output_folder, post_event=post_event,
+                                      should_stop=should_stop, work_dir=scratch)
+                if should_stop():
+                    logging.info("Synthesis interrupted before or during FFmpeg m4b creation.")
+                    encoder.close()
+                    allow_sleep()
+                    return
+            if db is not None:
+                db.finish_book(book_id, m4b_path)
+            if post_event: post_event('CORE_FINISHED', output_path=str(m4b_path))
         except RuntimeError as e:
             logging.error(f"Audiobook creation failed: {e}")
+            if db is not None:
+                db.fail_book(book_id, e)
             if post_event:
                 post_event('CORE_ERROR', message=str(e))
+    # Keep the chapter encodes for the next attempt unless the book is done
+    encoder.close(remove=m4b_path is not None)
+    if manifest is not None and m4b_path is not None and not max_chapters:
+        manifest.prune(chapter_hashes)
     logging.info('Ended at: %s', time.strftime('%H:%M:%S'))
+    logging.info(f'Token budget retries: {stats.budget_retries}, batches still over budget: {stats.budget_failures}')
+    report_throughput('draft' if draft else 'default', stats.synth_chars, stats.synth_seconds)
+    logging.info('Stage timings: ' + ', '.join(f'{k} {v:.1f}s' for k, v in stats.stage_times.items()))
+    if torch_compile:
+        logging.info(f'Compilation and warm-up: {stats.compile_seconds:.1f}s (not included in synthesis throughput)')
 
-    all_files = os.listdir(output_folder)
-    wav_files = [os.path.join(output_folder, f) for f in all_files if f.lower().endswith('.wav')]
-
-    for wav_file in wav_files:
-        try:
-            os.remove(wav_file)
-            logging.debug(f"Deleted: {wav_file}")
-        except Exception as e:
-            logging.debug(f"Failed to delete {wav_file}: {e}")
+    # Only this job's own scratch, and only once its book is done; a failed or stopped run resumes from it
+    if m4b_path is not None:
+        shutil.rmtree(scratch, ignore_errors=True)
+        logging.debug(f"Deleted scratch directory {scratch}")
 
     allow_sleep()
 
 
 
-def batch_sentences_intelligently(sentences, min_chars=150, max_chars=800):
+def load_tts(backend, backend_options=None, precision='fp32', audio_prompt_wav=None, torch_compile=False):
+    """Load, condition and optionally compile a backend. Returns ``(tts, compile_seconds)``."""
+    device = default_device()
+    logging.info(f'running {backend} on device: {device}')
+
+    tts = get_backend(backend, **(backend_options or {})).load(device, precision)
+
+    # If a custom audio prompt is provided, use it
+    if audio_prompt_wav:
+        tts.condition(audio_prompt_wav)
+    compile_seconds = compile_backend(tts) if torch_compile else 0.0
+    return tts, compile_seconds
+
+
+def last_throughput(profile):
+    """Synthesis throughput in chars/sec of the last ``profile`` run, or None."""
+    try:
+        return json.loads(THROUGHPUT_LOG.read_text(encoding="utf-8")).get(profile)
+    except (OSError, ValueError):
+        return None
+
+
+def expected_throughput(draft=False):
+    """chars/sec to plan with: the last measured run of this profile, else a rough guess."""
+    return last_throughput('draft' if draft else 'default') or (500 if torch.cuda.is_available() else 50)
+
+
+def report_throughput(profile, chars, seconds):
+    """
+    Log synthesis throughput for this run and compare it with the last run
+    of the other quality profile, then remember it for future runs.
+    """
+    if chars <= 0 or seconds <= 0:
+        return
+    chars_per_sec = chars / seconds
+    history = {}
+    try:
+        history = json.loads(THROUGHPUT_LOG.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass
+    summary = f"Synthesis throughput ({profile}): {chars_per_sec:.1f} chars/sec"
+    other = 'default' if profile == 'draft' else 'draft'
+    if other in history and history[other] > 0:
+        ratio = chars_per_sec / history[other] if profile == 'draft' else history[other] / chars_per_sec
+        summary += f" | draft is {ratio:.2f}x the default profile ({history[other]:.1f} chars/sec last {other} run)"
+    logging.info(summary)
+    history[profile] = chars_per_sec
+    try:
+        THROUGHPUT_LOG.parent.mkdir(parents=True, exist_ok=True)
+        THROUGHPUT_LOG.write_text(json.dumps(history, indent=2), encoding="utf-8")
+    except OSError as e:
+        logging.debug(f"Could not write {THROUGHPUT_LOG}: {e}")
+
+
+def batch_sentences_intelligently(sentences, min_chars=150, max_chars=800, with_spans=False):
     """
     Batch sentences into reasonable chunks for TTS processing.
 
@@ -726,13 +985,17 @@ def batch_sentences_intelligently(sentences, min_chars=150, max_chars=800):
         sentences: List of spacy sentence objects
         min_chars: Minimum characters per batch (default 150, increased for speed)
         max_chars: Maximum characters per batch (default 800, increased for speed)
+        with_spans: also return each batch's sentence offsets in the source text
 
     Returns:
-        List of batched sentence texts
+        List of batched sentence texts, or with_spans, of
+        ``(text, [(start_char, end_char), ...])`` pairs
     """
     batches = []
     current_batch = []
     current_length = 0
+    spans = []
+    current_spans = []
 
     for sent in sentences:
         sent_text = sent.text.strip()
@@ -741,39 +1004,51 @@ def batch_sentences_intelligently(sentences, min_chars=150, max_chars=800):
         # Skip empty sentences
         if not sent_text or sent_length < 2:
             continue
+        sent_span = (sent.start_char, sent.end_char)
 
         # If this sentence alone exceeds max_chars, add it as its own batch
         if sent_length > max_chars:
             # First, flush current batch if it exists
             if current_batch:
                 batches.append(' '.join(current_batch))
+                spans.append(current_spans)
                 current_batch = []
+                current_spans = []
                 current_length = 0
 
             # Add the long sentence as its own batch
             batches.append(sent_text)
+            spans.append([sent_span])
             continue
 
         # If adding this sentence would exceed max_chars, start a new batch
         if current_length > 0 and (current_length + sent_length + 1) > max_chars:
             batches.append(' '.join(current_batch))
+            spans.append(current_spans)
             current_batch = [sent_text]
+            current_spans = [sent_span]
             current_length = sent_length
         else:
             # Add to current batch
             current_batch.append(sent_text)
+            current_spans.append(sent_span)
             current_length += sent_length + (1 if current_batch else 0)  # +1 for space
 
         # If we've reached a good minimum size and hit a natural break, flush
         if current_length >= min_chars and sent_text.endswith(('.', '!', '?', '"', "'")):
             batches.append(' '.join(current_batch))
+            spans.append(current_spans)
             current_batch = []
+            current_spans = []
             current_length = 0
 
     # Don't forget the last batch
     if current_batch:
         batches.append(' '.join(current_batch))
+        spans.append(current_spans)
 
+    if with_spans:
+        return list(zip(batches, spans))
     return batches
 
 
@@ -807,24 +1082,173 @@ def print_selected_chapters(document_chapters, chapters):
     ], headers=['#', 'Chapter', 'Text Length', 'Selected', 'First words']))
 
 
-def gen_audio_segments(cb_model, nlp, text, speed, stats=None, max_sentences=None,
-                       post_event=None, should_stop=None, repetition_penalty=1.2, min_p=0.05, top_p=1.0, exaggeration=0.5, cfg_weight=0.5, temperature=0.8):  # Use spacy to split into sentences
+# Upper bound on speech tokens per input character. At 25 tokens/sec this
+# allows ~8 characters per second, well below any natural narration speed.
+SPEECH_TOKENS_PER_CHAR = 3
+# Extra tokens granted to every batch so very short texts ("Yes.") still fit
+MIN_SPEECH_TOKENS = 50
+# Sanity bound on the decoded audio: seconds of speech per input character
+MAX_AUDIO_SEC_PER_CHAR = 0.15
+MIN_AUDIO_SEC = 2.0
+# How often a batch that blew its budget is regenerated with a new seed
+MAX_GENERATE_ATTEMPTS = 3
+
+
+def speech_token_budget(tts, text):
+    """Maximum number of speech tokens T3 may generate for ``text``."""
+    budget = len(text) * SPEECH_TOKENS_PER_CHAR + MIN_SPEECH_TOKENS
+    return min(budget, tts.max_tokens())
+
+
+def audio_seconds_limit(text, max_sec_per_char=MAX_AUDIO_SEC_PER_CHAR):
+    """Longest plausible duration, in seconds, of speech for ``text``."""
+    return max(len(text) * max_sec_per_char, MIN_AUDIO_SEC)
+
+
+def batch_seed(job_seed, text, attempt=0):
+    """
+    Seed for one generate call, derived from the job seed and the batch text.
+
+    It does not depend on batch order or position, so any batch can be
+    regenerated on its own (resume, cache miss, another worker) and give the
+    same audio as in the original run on the same hardware.
+    """
+    digest = hashlib.sha256(f"{job_seed}:{attempt}:{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & (2 ** 63 - 1)
+
+
+def seed_rngs(seed):
+    """Seed every RNG the model may draw from (torch CPU/CUDA, numpy, random)."""
+    torch.manual_seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    random.seed(seed)
+
+
+def generate_batch_tokens(tts, text, stats=None, max_sec_per_char=MAX_AUDIO_SEC_PER_CHAR, seed=DEFAULT_SEED,
+                          **gen_kwargs):
+    """
+    Run T3 for one batch, capping it at a budget proportional to the batch
+    length. A batch that runs into the cap (no EOS) or whose speech would be
+    implausibly long for its text is regenerated with the next seed in its
+    deterministic sequence. Retries and batches that never fit are counted
+    on ``stats``.
+
+    ``tts`` is a loaded backend (see backends.py). Returns
+    ``(speech_tokens, seed)``; pass the seed to ``decode_batch_audio``.
+    """
+    budget = speech_token_budget(tts, text)
+    limit = audio_seconds_limit(text, max_sec_per_char)
+    for attempt in range(1, MAX_GENERATE_ATTEMPTS + 1):
+        if attempt > 1 and stats is not None:
+            stats.budget_retries += 1
+        attempt_seed = batch_seed(seed, text, attempt - 1)
+        speech_tokens = tts.generate_tokens(text, budget, attempt_seed, **gen_kwargs)
+        n_tokens = len(speech_tokens)
+        # Every token decodes to a fixed stretch of audio, so the length is known now
+        seconds = n_tokens / tts.tokens_per_second
+        if n_tokens < budget and seconds <= limit:
+            return speech_tokens, attempt_seed
+        logging.warning(f"Batch over budget: {n_tokens}/{budget} tokens, {seconds:.1f}s of audio "
+                        f"for {len(text)} chars (limit {limit:.1f}s, attempt {attempt})")
+
+    if stats is not None:
+        stats.budget_failures += 1
+    logging.warning(f"Batch still over budget after {MAX_GENERATE_ATTEMPTS} attempts: {text[:80]}")
+    return speech_tokens, attempt_seed
+
+
+def decode_batch_audio(tts, speech_tokens, seed, watermark=False):
+    """Run S3Gen for one batch; seeding here keeps its noise independent of T3."""
+    seed_rngs(seed)
+    return tts.decode(speech_tokens, watermark=watermark)
+
+
+def generate_batch_audio(tts, text, stats=None, seed=DEFAULT_SEED, watermark=True, **gen_kwargs):
+    """T3 followed by S3Gen for a single batch, without pipelining."""
+    speech_tokens, attempt_seed = generate_batch_tokens(tts, text, stats=stats, seed=seed, **gen_kwargs)
+    return decode_batch_audio(tts, speech_tokens, attempt_seed, watermark=watermark)
+
+
+class S3GenDecodeThread(threading.Thread):
+    """
+    Second stage of the synthesis pipeline: decodes speech tokens to audio
+    while the caller's thread is already running T3 on the next batch.
+
+    Work items are ``(index, speech_tokens, seed)``; results land in
+    ``self.results[index]`` so ordering is preserved. ``busy_seconds``
+    accumulates time spent decoding, for stage utilization reporting.
+    ``on_result(index, wav)``, if given, runs on this thread after each decode.
+    """
+
+    def __init__(self, tts, max_pending=2, watermark=False, on_result=None):
+        super().__init__(daemon=True)
+        self.tts = tts
+        self.watermark = watermark
+        self.on_result = on_result
+        self.work = queue.Queue(maxsize=max_pending)
+        self.results = {}
+        self.busy_seconds = 0.0
+        self.error = None
+
+    def submit(self, index, speech_tokens, seed):
+        self.work.put((index, speech_tokens, seed))
+
+    def finish(self):
+        """Wait for all submitted batches and re-raise any decode error."""
+        self.work.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        # On CUDA, decode on a side stream so its kernels can overlap T3's
+        stream = torch.cuda.Stream() if str(self.tts.device).startswith('cuda') else None
+        while True:
+            item = self.work.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            index, speech_tokens, seed = item
+            t0 = time.perf_counter()
+            try:
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        wav = decode_batch_audio(self.tts, speech_tokens, seed, self.watermark)
+                else:
+                    wav = decode_batch_audio(self.tts, speech_tokens, seed, self.watermark)
+                self.results[index] = wav
+                if self.on_result is not None:
+                    self.on_result(index, wav)
+            except Exception as exc:
+                self.error = exc
+            self.busy_seconds += time.perf_counter() - t0
+
+
+def gen_audio_segments(tts, nlp, text, speed, stats=None, max_sentences=None,
+                       post_event=None, should_stop=None, repetition_penalty=1.2, min_p=0.05, top_p=1.0, exaggeration=0.5, cfg_weight=0.5, temperature=0.8,
+                       seed=DEFAULT_SEED, watermark_batches=False, job_db=None, chapter_id=None, parts_dir=None,
+                       on_segment=None):  # Use spacy to split into sentences
+    # With job_db, finished batches of chapter_id are reloaded and new ones saved under parts_dir.
+    # on_segment(segment) runs on the decoder thread as each batch is decoded, in order; segment has
+    # index, text, sentences (char offsets in text) and audio.
 
     if should_stop is None:
         should_stop = lambda: False
 
-    audio_segments = []
     doc = nlp(text)
     sentences = list(doc.sents)
     batch_min_chars=150
     batch_max_chars=800
     num_candidates=3
     # Then batch sentences intelligently
-    batches = batch_sentences_intelligently(
+    batches_with_spans = batch_sentences_intelligently(
         sentences,
         min_chars=batch_min_chars,
-        max_chars=batch_max_chars
+        max_chars=batch_max_chars,
+        with_spans=True,
     )
+    batches = [batch for batch, _ in batches_with_spans]
 
     total_batches = len(batches)
     logging.info(f"Split {len(sentences)} sentences into {total_batches} batches")
@@ -835,28 +1259,142 @@ def gen_audio_segments(cb_model, nlp, text, speed, stats=None, max_sentences=Non
     if total_batches > 3:
         logging.info(f"  ... and {total_batches - 3} more batches")
 
-    for i, batch_text in enumerate(batches):
-        if should_stop():
-            logging.info("Synthesis interrupted by user (batch loop).")
-            return audio_segments
-        if max_sentences and i >= max_sentences:
-            break
+    # T3 runs here while S3GenDecodeThread decodes the previous batch
+    def on_result(index, wav):
+        if job_db is not None:
+            job_db.finish_batch(chapter_id, index, wav, parts_dir)
+        if on_segment is not None:
+            batch_text, spans = batches_with_spans[index]
+            on_segment(SimpleNamespace(index=index, text=batch_text.strip(), sentences=spans, audio=wav))
+
+    decoder = S3GenDecodeThread(tts, watermark=watermark_batches,
+                                on_result=on_result if job_db is not None or on_segment is not None else None)
+    decoder.start()
+    t3_seconds = 0.0
+    pipeline_start = time.perf_counter()
+    try:
+        for i, batch_text in enumerate(batches):
+            if should_stop():
+                logging.info("Synthesis interrupted by user (batch loop).")
+                break
+            if max_sentences and i >= max_sentences:
+                break
+            if decoder.error is not None:
+                # The chapter is lost already; finish() re-raises, don't spend T3 on the remaining batches
+                logging.error(f"S3Gen decode failed; stopping the chapter at batch {i + 1}/{total_batches}")
+                break
 
-        batch_text = batch_text.strip()
-        if not batch_text:
-            continue
+            batch_text = batch_text.strip()
+            if not batch_text:
+                continue
 
+            saved = job_db.load_batch(chapter_id, i, batch_text) if job_db is not None else None
+            if saved is not None:
+                decoder.results[i] = saved
+                if on_segment is not None:
+                    on_segment(SimpleNamespace(index=i, text=batch_text, sentences=batches_with_spans[i][1],
+                                               audio=saved))
+            else:
+                if job_db is not None:
+                    job_db.start_batch(chapter_id, i, batch_text)
+                t0 = time.perf_counter()
+                speech_tokens, attempt_seed = generate_batch_tokens(
+                    tts, batch_text, stats=stats, seed=seed,
+                    repetition_penalty=repetition_penalty, min_p=min_p, top_p=top_p,
+                    exaggeration=exaggeration, cfg_weight=cfg_weight, temperature=temperature)
+                t3_seconds += time.perf_counter() - t0
+                decoder.submit(i, speech_tokens, attempt_seed)
+
+            # Update statistics based on batch size
+            if stats:
+                update_stats(stats, len(batch_text))
+                if post_event:
+                    post_event('CORE_PROGRESS', stats=stats)
+    finally:
+        decoder.finish()
 
-        wav = cb_model.generate(batch_text, repetition_penalty=repetition_penalty, min_p=min_p, top_p=top_p,
-                                exaggeration=exaggeration, cfg_weight=cfg_weight, temperature=temperature)
-        audio_segments.append(wav.numpy().flatten())
+    wall = time.perf_counter() - pipeline_start
+    if wall > 0:
+        logging.info(f"Pipeline: T3 busy {t3_seconds:.1f}s ({t3_seconds / wall:.0%}), "
+                     f"S3Gen busy {decoder.busy_seconds:.1f}s ({decoder.busy_seconds / wall:.0%}) "
+                     f"over {wall:.1f}s")
+    if stats is not None and hasattr(stats, 'stage_times'):
+        stats.stage_times['t3'] += t3_seconds
+        stats.stage_times['s3gen'] += decoder.busy_seconds
+    return [decoder.results[i] for i in sorted(decoder.results)]
 
-        # Update statistics based on batch size
-        if stats:
-            update_stats(stats, len(batch_text))
-            if post_event:
-                post_event('CORE_PROGRESS', stats=stats)
-    return audio_segments
+
+STREAM_PARAMS = ('repetition_penalty', 'min_p', 'top_p', 'exaggeration', 'cfg_weight', 'temperature',
+                 'max_sentences')
+
+
+def stream_defaults():
+    """``main``'s defaults for STREAM_PARAMS, so a stream sounds like the book render."""
+    parameters = inspect.signature(main).parameters
+    return {name: parameters[name].default for name in STREAM_PARAMS}
+
+
+def synthesize_stream(text_or_chapter, voice=None, params=None, tts=None, backend=DEFAULT_BACKEND,
+                      backend_options=None, precision='fp32', seed=DEFAULT_SEED, should_stop=None):
+    """
+    Synthesize a text (or an EPUB chapter) and yield its audio batch by
+    batch as soon as each is decoded, without writing any files.
+
+    Text goes through the same cleaning, sentence batching, seeding and
+    T3/S3Gen pipeline as ``main``. Each yielded chunk has ``index``,
+    ``text``, ``sentences`` (``(start, end)`` offsets into ``chunk.source``,
+    the cleaned text), ``audio`` (1-D float32 PCM, watermarked per batch)
+    and ``sample_rate``. Speed change and silence trimming work on whole
+    chapters and are not applied.
+
+    - voice: WAV to condition on; with ``tts`` given, it is re-conditioned only if voice is set
+    - params: sampling options, any of STREAM_PARAMS (defaults: ``stream_defaults()``)
+    - tts: an already loaded backend; otherwise one is loaded per call
+    Closing the generator early stops synthesis after the batch in flight.
+    """
+    params = dict(params or {})
+    unknown = set(params) - set(STREAM_PARAMS)
+    if unknown:
+        raise ValueError(f"unsupported stream params: {sorted(unknown)}")
+    raw = text_or_chapter if isinstance(text_or_chapter, str) else text_or_chapter.extracted_text
+    source = clean_chapter_text(raw)
+    if tts is None:
+        tts, _ = load_tts(backend, backend_options, precision, voice)
+    elif voice:
+        tts.condition(voice)
+    if not source.strip():
+        return
+
+    closed = threading.Event()
+    chunks = queue.Queue()
+    done = object()
+
+    def produce():
+        try:
+            gen_audio_segments(
+                tts, get_nlp(), source, 1.0, seed=seed, watermark_batches=True,
+                should_stop=lambda: closed.is_set() or (should_stop is not None and should_stop()),
+                on_segment=chunks.put, **{**stream_defaults(), **params})
+            chunks.put(done)
+        except Exception as exc:
+            chunks.put(exc)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            item.source = source
+            item.sample_rate = tts.sample_rate
+            item.audio = np.asarray(item.audio, dtype=np.float32)
+            yield item
+    finally:
+        closed.set()
+        producer.join()
 
 
 def extract_chapter_number(chapter_name):
@@ -945,14 +1483,34 @@ def strfdelta(tdelta, fmt='{D:02}d {H:02}h {M:02}m {S:02}s'):
     return f.format(fmt, **values)
 
 
-def enqueue_output(stream, queue_obj):
-    """Helper function to read from a stream and put lines into a queue."""
-    for line in iter(stream.readline, ''):
-        queue_obj.put(line)
-    stream.close()
-
 MAX_PATH_LEN = 240
 
+def book_fingerprint(params, audio_prompt_wav, max_sentences):
+    """
+    Hash of the voice and every setting that shapes a book's audio. Resumed
+    (jobdb) and reused (manifest) chapters only count when it matches.
+    """
+    settings = {key: params[key] for key in RENDER_SETTINGS}
+    settings["max_sentences"] = max_sentences
+    if params["loudness_target"] is not None:
+        settings["loudness_target"] = params["loudness_target"]
+    return render_fingerprint(audio_prompt_wav, settings)
+
+
+def job_scratch_dir(file_path, output_folder, scratch_dir=None):
+    """
+    Scratch directory of one book's job: chapter intermediates, saved
+    batches, encodes and mux inputs. It is named after the book and the
+    output folder, so a resumed run and the parts of a split book find it
+    again, while other jobs never touch it.
+    """
+    key = hashlib.sha256(f"{Path(file_path).resolve()}\n{Path(output_folder).resolve()}".encode()).hexdigest()[:12]
+    stem = re.sub(r'[^a-zA-Z0-9_.-]', '_', Path(file_path).stem)
+    path = Path(scratch_dir or output_folder) / SCRATCH_DIR_NAME / f"{stem}-{key}"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 def safe_concat_path(output_folder: str, filename: str) -> Path:
     folder_path = Path(output_folder)
     name_part = Path(filename).stem
@@ -968,330 +1526,41 @@ def safe_concat_path(output_folder: str, filename: str) -> Path:
 
     return candidate
 
-def concat_wavs_with_ffmpeg(chapter_files, output_folder, filename, post_event=None, should_stop=None):
-    base_filename_stem = Path(filename).stem
-    wav_list_txt = Path(output_folder) / f"{base_filename_stem}_wav_list.txt"
-    with open(wav_list_txt, 'w') as f:
-        for wav_file in chapter_files:
-            f.write(f"file '{str(wav_file)}'\n")
-
-    concat_file_path = Path(output_folder) / f"{base_filename_stem}.tmp.mp4"
-
-    ffmpeg_concat_cmd = [
-        'ffmpeg',
-        '-y',
-        '-nostdin',  # <--- ADD THIS LINE
-        '-f', 'concat',
-        '-safe', '0',
-        '-i', str(wav_list_txt),
-        '-c:a', 'aac',
-        '-b:a', '64k',
-        '-progress', 'pipe:1',
-        '-nostats',
-        str(concat_file_path)
-    ]
-
-    logging.info(f"Running FFmpeg concat command: {' '.join(ffmpeg_concat_cmd)}")
-
-    total_duration_seconds = sum(probe_duration(wav_file) for wav_file in chapter_files if wav_file.exists())
-    logging.info(f"Concatenation Total Duration: {total_duration_seconds:.2f} seconds")
-
-    process = subprocess.Popen(
-        ffmpeg_concat_cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1
-    )
-    if should_stop is None:
-        should_stop = lambda: False
-
-    q_stdout = queue.Queue()
-    q_stderr = queue.Queue()
-
-    t_stdout = threading.Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-    t_stderr = threading.Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-    t_stdout.daemon = True
-    t_stderr.daemon = True
-    t_stdout.start()
-    t_stderr.start()
-
-    initial_stderr_lines = []
-    # Drain initial STDERR output for a limited time or until queue is empty
-    # This prevents blocking on large initial stderr bursts
-    timeout_start = time.time()
-    while (t_stderr.is_alive() or not q_stderr.empty()) and (
-            time.time() - timeout_start < 5):  # DRAIN for max 5 seconds
-        try:
-            line = q_stderr.get_nowait().strip()
-            if line:
-                initial_stderr_lines.append(line)
-                logging.error(f"FFmpeg CONCAT Initial STDERR: {line}")
-        except queue.Empty:
-            time.sleep(0.01)  # Small pause to yield CPU
-
-    current_time_seconds = 0.0
-    concat_error_output = initial_stderr_lines  # Start collecting from here
-
-    try:
-        while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-            if should_stop():
-                logging.info("Synthesis interrupted by user (ffmpeg concat). Terminating FFmpeg process.")
-                process.terminate()
-                process.wait()
-                return None
-            # Process stdout for progress
-            try:
-                line_stdout = q_stdout.get(timeout=0.05)
-                line_stdout = line_stdout.strip()
-                # print(f"FFmpeg CONCAT STDOUT: {line_stdout}") # Debugging stdout output
-                if "=" in line_stdout:
-                    key, value = line_stdout.split("=", 1)
-                    if key == "out_time":
-                        try:
-                            h, m, s = map(float, value.split(':'))
-                            current_time_seconds = h * 3600 + m * 60 + s
-                            if total_duration_seconds > 0:
-                                progress = int((current_time_seconds / total_duration_seconds) * 100)
-                                if post_event:
-                                    stats_obj = SimpleNamespace(progress=progress, stage="concat", eta=strfdelta(
-                                        total_duration_seconds - current_time_seconds))
-                                    post_event('CORE_PROGRESS', stats=stats_obj)
-                                # print(f"CONCAT Progress: {progress}% (Time: {current_time_seconds:.2f})") # More debugging
-                        except ValueError:
-                            pass
-                    elif key == "progress" and value == "end":
-                        break
-            except queue.Empty:
-                pass
-
-            # Process stderr for errors/warnings
-            try:
-                line_stderr = q_stderr.get(timeout=0.05)
-                stripped_line = line_stderr.strip()
-                if stripped_line:
-                    logging.error(f"FFmpeg CONCAT STDERR: {stripped_line}")
-                    concat_error_output.append(stripped_line)
-            except queue.Empty:
-                pass
-
-            time.sleep(0.001)  # Small sleep to avoid busy-waiting
-
-    finally:
-        # Final drain of queues
-        while not q_stdout.empty():
-            line_stdout = q_stdout.get_nowait().strip()
-            if "=" in line_stdout:  # Still try to process any last progress updates
-                key, value = line_stdout.split("=", 1)
-                if key == "out_time":
-                    try:
-                        h, m, s = map(float, value.split(':'))
-                        current_time_seconds = h * 3600 + m * 60 + s
-                        if total_duration_seconds > 0:
-                            progress = int((current_time_seconds / total_duration_seconds) * 100)
-                            if post_event:
-                                stats_obj = SimpleNamespace(progress=progress, stage="concat", eta=strfdelta(
-                                    total_duration_seconds - current_time_seconds))
-                                post_event('CORE_PROGRESS', stats=stats_obj)
-                    except ValueError:
-                        pass
-        while not q_stderr.empty():
-            stripped_line = q_stderr.get_nowait().strip()
-            if stripped_line:
-                logging.error(f"FFmpeg CONCAT STDERR (Post-loop): {stripped_line}")
-                concat_error_output.append(stripped_line)
-
-        process.wait()
-
-    Path(wav_list_txt).unlink()
-
-    if process.returncode != 0:
-        error_message = f"FFmpeg concatenation failed with error code {process.returncode}.\nDetails:\n" + "\n".join(
-            concat_error_output[-50:])
-        logging.error(error_message)
-        raise RuntimeError(error_message)
-
-    return concat_file_path
-
-
-def create_m4b(concat_file_path, filename, cover_image, output_folder, post_event=None, should_stop=None):
-    logging.info('Creating M4B file...')
-
-    original_name = Path(filename).with_suffix('').name  # removes old suffix
-
-
-    new_name = f"{original_name}.m4b"
-
-    final_filename = safe_concat_path(output_folder,new_name)
-    chapters_txt_path = Path(output_folder) / "chapters.txt"
+def create_m4b(concat_file_path, filename, cover_image, output_folder, post_event=None, should_stop=None,
+               work_dir=None):
+    """
+    Mux the book's AAC stream with chapters and cover into ``<filename>.m4b``
+    (stream copy). Returns its path, or None if ``should_stop`` cancelled it.
+    """
     logging.info('Creating M4B file...')
+    # chapters.txt and the cover are read from the job's scratch directory
+    work_dir = Path(work_dir or output_folder)
+    final_filename = safe_concat_path(output_folder, f"{Path(filename).with_suffix('').name}.m4b")
 
-    ffmpeg_command = [
-        'ffmpeg',
-        '-y',
-        '-nostdin',  # <--- ADD THIS LINE
-        '-i', str(concat_file_path),
-        '-i', str(chapters_txt_path),
-    ]
-
+    cover_file_path = None
     if cover_image:
-        cover_file_path = Path(output_folder) / 'cover'
-        with open(cover_file_path, 'wb') as f:
-            f.write(cover_image)
-        ffmpeg_command.extend([
-            '-i', str(cover_file_path),
-        ])
-        map_video_index = '2:v'
-        map_metadata_index = '2'
-        map_chapters_index = '2'
-    else:
-        map_video_index = None
-        map_metadata_index = '1'
-        map_chapters_index = '1'
-
-    ffmpeg_command.extend([
-        '-map', '0:a',
-        '-c:a', 'aac',
-        '-b:a', '64k',
-    ])
-
-    if map_video_index:
-        ffmpeg_command.extend([
-            '-map', map_video_index,
-            '-metadata:s:v', 'title="Album cover"',
-            '-metadata:s:v', 'comment="Cover (front)"',
-            '-disposition:v:0', 'attached_pic',
-            '-c:v', 'copy'
-        ])
-
-    ffmpeg_command.extend([
-        '-map_metadata', map_metadata_index,
-        '-map_chapters', map_chapters_index,
-        '-f', 'mp4',
-        '-progress', 'pipe:1',
-        '-nostats',
-        str(final_filename)
-    ])
-
-    logging.info(f"Running FFmpeg command:\n{' '.join(ffmpeg_command)}\n")
-
-    total_duration_seconds = probe_duration(concat_file_path)  # Changed to use Path object directly
-    logging.info(f"M4B Conversion Total Duration: {total_duration_seconds:.2f} seconds")
-
-    process = subprocess.Popen(
-        ffmpeg_command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1
-    )
-    if should_stop is None:
-        should_stop = lambda: False
+        cover_file_path = work_dir / 'cover'
+        cover_file_path.write_bytes(cover_image)
 
-    q_stdout = queue.Queue()
-    q_stderr = queue.Queue()
-
-    t_stdout = threading.Thread(target=enqueue_output, args=(process.stdout, q_stdout))
-    t_stderr = threading.Thread(target=enqueue_output, args=(process.stderr, q_stderr))
-    t_stdout.daemon = True
-    t_stderr.daemon = True
-    t_stdout.start()
-    t_stderr.start()
-
-    initial_stderr_lines = []
-    # Drain initial STDERR output for a limited time or until queue is empty
-    timeout_start = time.time()
-    while (t_stderr.is_alive() or not q_stderr.empty()) and (
-            time.time() - timeout_start < 5):  # DRAIN for max 5 seconds
-        try:
-            line = q_stderr.get_nowait().strip()
-            if line:
-                initial_stderr_lines.append(line)
-                logging.error(f"FFmpeg M4B Initial STDERR: {line}")
-        except queue.Empty:
-            time.sleep(0.01)
-
-    current_time_seconds = 0.0
-    ffmpeg_error_output = initial_stderr_lines
-
-    try:
-        while process.poll() is None or not q_stdout.empty() or not q_stderr.empty():
-            if should_stop():
-                logging.info("Synthesis interrupted by user (ffmpeg m4b). Terminating FFmpeg process.")
-                process.terminate()
-                process.wait()
-                return
-            # Process stdout for progress
-            try:
-                line_stdout = q_stdout.get(timeout=0.05)
-                line_stdout = line_stdout.strip()
-                # print(f"FFmpeg M4B STDOUT: {line_stdout}") # Debugging stdout output
-                if "=" in line_stdout:
-                    key, value = line_stdout.split("=", 1)
-                    if key == "out_time":
-                        try:
-                            h, m, s = map(float, value.split(':'))
-                            current_time_seconds = h * 3600 + m * 60 + s
-                            if total_duration_seconds > 0:
-                                progress = int((current_time_seconds / total_duration_seconds) * 100)
-                                if post_event:
-                                    stats_obj = SimpleNamespace(progress=progress, stage="ffmpeg", eta=strfdelta(
-                                        total_duration_seconds - current_time_seconds))
-                                    post_event('CORE_PROGRESS', stats=stats_obj)
-                                # print(f"M4B Progress: {progress}% (Time: {current_time_seconds:.2f})") # More debugging
-                        except ValueError:
-                            pass
-                    elif key == "progress" and value == "end":
-                        break
-            except queue.Empty:
-                pass
-
-            # Process stderr for errors/warnings
-            try:
-                line_stderr = q_stderr.get(timeout=0.05)
-                stripped_line = line_stderr.strip()
-                if stripped_line:
-                    logging.error(f"FFmpeg M4B STDERR: {stripped_line}")
-                    ffmpeg_error_output.append(stripped_line)
-            except queue.Empty:
-                pass
-
-            time.sleep(0.001)
-
-    finally:
-        # Final drain of queues
-        while not q_stdout.empty():
-            line_stdout = q_stdout.get_nowait().strip()
-            if "=" in line_stdout:
-                key, value = line_stdout.split("=", 1)
-                if key == "out_time":
-                    try:
-                        h, m, s = map(float, value.split(':'))
-                        current_time_seconds = h * 3600 + m * 60 + s
-                        if total_duration_seconds > 0:
-                            progress = int((current_time_seconds / total_duration_seconds) * 100)
-                            if post_event:
-                                stats_obj = SimpleNamespace(progress=progress, stage="ffmpeg", eta=strfdelta(
-                                    total_duration_seconds - current_time_seconds))
-                                post_event('CORE_PROGRESS', stats=stats_obj)
-                    except ValueError:
-                        pass
-        while not q_stderr.empty():
-            stripped_line = q_stderr.get_nowait().strip()
-            if stripped_line:
-                logging.error(f"FFmpeg M4B STDERR (Post-loop): {stripped_line}")
-                ffmpeg_error_output.append(stripped_line)
-
-        process.wait()
+    total_duration_seconds = probe_duration(concat_file_path)
+    logging.info(f"M4B Conversion Total Duration: {total_duration_seconds:.2f} seconds")
 
+    def on_progress(progress):
+        if post_event and progress.fraction is not None:
+            post_event('CORE_PROGRESS', stats=SimpleNamespace(
+                progress=int(progress.fraction * 100), stage="ffmpeg",
+                eta=strfdelta(total_duration_seconds - progress.seconds)))
+
+    # The audio is AAC already (see encoding.py); the m4b is only a remux
+    finished = run_ffmpeg([*m4b_mux_args(concat_file_path, work_dir / "chapters.txt", cover_file_path),
+                           '-f', 'mp4', final_filename],
+                          on_progress=on_progress, total_seconds=total_duration_seconds, should_stop=should_stop)
+    if not finished:
+        logging.info("Synthesis interrupted by user (ffmpeg m4b). FFmpeg was stopped.")
+        return None
     Path(concat_file_path).unlink()
-    if process.returncode == 0:
-        logging.info(f'{final_filename} created. Enjoy your audiobook.')
-    else:
-        error_message = f"FFmpeg process exited with error code {process.returncode}.\nDetails:\n" + "\n".join(
-            ffmpeg_error_output[-50:])
-        logging.error(error_message)
-        raise RuntimeError(error_message)
+    logging.info(f'{final_filename} created. Enjoy your audiobook.')
+    return final_filename
 
 
 def probe_duration(file_name):
@@ -1316,17 +1585,9 @@ def probe_duration(file_name):
         return 0.0
 
 
-def create_index_file(title, creator, chapter_mp3_files, output_folder):
-    with open(Path(output_folder) / "chapters.txt", "w", encoding="ascii", newline="\n") as f:
-        f.write(f";FFMETADATA1\ntitle={title}\nartist={creator}\n\n")
-        start = 0
-        i = 0
-        for c in chapter_mp3_files:
-            duration = probe_duration(c)
-            end = start + (int)(duration * 1000)
-            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle=Chapter {i}\n\n")
-            i += 1
-            start = end
+def create_index_file(title, creator, durations, output_folder):
+    # Durations of the chapters' AAC encodes, not their WAVs (see encoding.py)
+    write_ffmetadata(Path(output_folder) / "chapters.txt", title, creator, durations)
 
 
 def unmark_element(element, stream=None):
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Per-chapter AAC encoding in parallel with synthesis.
+
+Each chapter WAV is encoded to its own ADTS AAC stream as soon as it is
+final, on a pool of ffmpeg processes, while the model moves on to the next
+chapter. ADTS streams concatenate byte for byte, so the book's audio is the
+chapters' encodes back to back, and the m4b only needs a stream-copy mux.
+Each encode carries the encoder's priming and final-frame padding, so
+chapter marks are taken from the encoded streams' frame counts
+(``adts_duration``), not from the WAVs, and stay on the audio however many
+chapters precede them. Encode time therefore scales with core count and mostly hides behind
+synthesis.
+
+The same encodes double as standalone per-chapter files: AAC exports are
+stream copies into .m4a; MP3 and Opus exports are encoded from the chapter
+WAV in the same pool task (never transcoded from the AAC).
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+# Output suffix and codec arguments per export format; None means stream copy of the AAC encode
+EXPORT_FORMATS = {
+    'aac': ('.m4a', None),
+    'mp3': ('.mp3', ['-c:a', 'libmp3lame']),
+    'opus': ('.opus', ['-c:a', 'libopus']),
+}
+# Minimum seconds between progress callbacks of one ffmpeg run
+PROGRESS_INTERVAL = 0.5
+# Seconds between should_stop() checks while ffmpeg runs
+STOP_CHECK_INTERVAL = 0.25
+# stderr lines kept for the error message of a failed run
+STDERR_TAIL_LINES = 50
+# ADTS sampling_frequency_index -> Hz
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+ADTS_HEADER_BYTES = 7
+AAC_FRAME_SAMPLES = 1024
+
+
+def run_ffmpeg(args, on_progress=None, total_seconds=None, should_stop=None, progress_interval=PROGRESS_INTERVAL):
+    """
+    Run ffmpeg with ``args`` and wait for it without polling. Raises
+    RuntimeError with the tail of its stderr on failure.
+
+    ``on_progress(SimpleNamespace(seconds, fraction, speed))`` is called
+    from ffmpeg's ``-progress`` reports at most every ``progress_interval``
+    seconds (``fraction`` needs ``total_seconds``). When ``should_stop()``
+    turns true, ffmpeg is terminated and False is returned; True otherwise.
+    """
+    creation_flags = subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
+    cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-nostats',
+           *(['-progress', 'pipe:1'] if on_progress else []), *map(str, args)]
+    runner = _FFmpegRun(cmd, on_progress, total_seconds, should_stop, progress_interval)
+    returncode = asyncio.run(runner.run(creation_flags))
+    if runner.cancelled:
+        return False
+    if returncode != 0:
+        tail = "\n".join(runner.stderr_tail)
+        raise RuntimeError(f"FFmpeg failed ({returncode}): {' '.join(cmd)}\n{tail}")
+    return True
+
+
+class _FFmpegRun:
+    """One ffmpeg process driven by an asyncio loop: the loop sleeps until ffmpeg writes or exits."""
+
+    def __init__(self, cmd, on_progress, total_seconds, should_stop, progress_interval):
+        self.cmd = cmd
+        self.on_progress = on_progress
+        self.total_seconds = total_seconds
+        self.should_stop = should_stop
+        self.progress_interval = progress_interval
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self.cancelled = False
+        self.last_report = 0.0
+
+    async def run(self, creation_flags):
+        proc = await asyncio.create_subprocess_exec(
+            *self.cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, creationflags=creation_flags)
+        watcher = asyncio.ensure_future(self._watch_stop(proc)) if self.should_stop else None
+        try:
+            await asyncio.gather(self._read_progress(proc.stdout), self._read_stderr(proc.stderr))
+            return await proc.wait()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    async def _read_stderr(self, stream):
+        async for line in stream:
+            line = line.decode(errors='replace').rstrip()
+            if line:
+                logging.debug(f"ffmpeg: {line}")
+                self.stderr_tail.append(line)
+
+    async def _read_progress(self, stream):
+        # -progress writes blocks of key=value lines, each closed by progress=continue|end
+        block = {}
+        async for line in stream:
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+            block[key] = value
+            if key == 'progress':
+                self._report(block, final=value == 'end')
+                block = {}
+
+    def _report(self, block, final):
+        now = time.monotonic()
+        if not self.on_progress or (not final and now - self.last_report < self.progress_interval):
+            return
+        self.last_report = now
+        try:
+            seconds = int(block.get('out_time_us', 0)) / 1e6
+        except ValueError:  # N/A before the first packet
+            return
+        fraction = min(seconds / self.total_seconds, 1.0) if self.total_seconds else None
+        speed = block.get('speed', '').rstrip('x').strip()
+        self.on_progress(SimpleNamespace(seconds=seconds, fraction=fraction,
+                                         speed=float(speed) if speed.replace('.', '', 1).isdigit() else None))
+
+    async def _watch_stop(self, proc):
+        # should_stop is a plain callable, so it is checked on a slow timer rather than per read
+        while not self.should_stop():
+            await asyncio.sleep(STOP_CHECK_INTERVAL)
+        self.cancelled = True
+        if proc.returncode is None:
+            proc.terminate()
+
+
+def encode_aac(wav_path, out_path, bitrate):
+    """Encode one WAV to an ADTS AAC stream at ``out_path``, atomically."""
+    tmp_path = Path(out_path).with_suffix('.tmp')
+    run_ffmpeg(['-i', wav_path, '-c:a', 'aac', '-b:a', bitrate, '-f', 'adts', tmp_path])
+    os.replace(tmp_path, out_path)
+
+
+def adts_duration(path):
+    """Playing time in seconds of an ADTS AAC stream, priming and padding included, from its frame headers."""
+    data = Path(path).read_bytes()
+    pos = samples = 0
+    sample_rate = None
+    while pos + ADTS_HEADER_BYTES <= len(data):
+        header = data[pos:pos + ADTS_HEADER_BYTES]
+        frame_length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+        if header[0] != 0xFF or header[1] & 0xF0 != 0xF0 or frame_length < ADTS_HEADER_BYTES:
+            raise ValueError(f"{path}: no ADTS frame at byte {pos}")
+        sample_rate = ADTS_SAMPLE_RATES[(header[2] >> 2) & 0x0F]
+        samples += AAC_FRAME_SAMPLES * ((header[6] & 0x03) + 1)
+        pos += frame_length
+    return samples / sample_rate if sample_rate else 0.0
+
+
+def write_ffmetadata(path, title, creator, durations):
+    """FFMETADATA chapter list for consecutive chapters of ``durations`` seconds."""
+    with open(path, "w", encoding="ascii", errors="replace", newline="\n") as f:
+        f.write(f";FFMETADATA1\ntitle={title}\nartist={creator}\n\n")
+        start = elapsed = 0
+        for i, duration in enumerate(durations):
+            # Rounded from the running total, so millisecond rounding does not add up over a book
+            elapsed += duration
+            end = round(elapsed * 1000)
+            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle=Chapter {i}\n\n")
+            start = end
+
+
+def m4b_mux_args(audio_path, metadata_path, cover_path=None):
+    """
+    ffmpeg input, map and codec arguments that stream-copy the ADTS stream
+    at ``audio_path`` into an m4b with the FFMETADATA tags and chapters of
+    ``metadata_path`` and, optionally, ``cover_path`` as its cover.
+    """
+    inputs = ['-i', audio_path, '-i', metadata_path]
+    maps = ['-map', '0:a']
+    if cover_path:
+        inputs += ['-i', cover_path]
+        maps += ['-map', '2:v',
+                 '-metadata:s:v', 'title="Album cover"',
+                 '-metadata:s:v', 'comment="Cover (front)"',
+                 '-disposition:v:0', 'attached_pic']
+    # Tags and chapters always come from the FFMETADATA input (1), never from the cover
+    return [*inputs, *maps, '-c', 'copy', '-bsf:a', 'aac_adtstoasc', '-map_metadata', '1', '-map_chapters', '1']
+
+
+def _read_sidecar(path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class ChapterEncoder:
+    """
+    Encodes chapter WAVs into ``work_dir`` on ``jobs`` concurrent ffmpeg
+    processes (default: one per core). An encode left by an interrupted run
+    is reused if its sidecar shows it was made from the same WAV (size and
+    mtime) at the same bitrate. With ``export_format``, every chapter is also written to
+    ``export_dir`` as a standalone file.
+    """
+
+    def __init__(self, work_dir, bitrate, jobs=None, export_format=None, export_dir=None):
+        if export_format is not None and export_format not in EXPORT_FORMATS:
+            raise ValueError(f"export_format must be one of {sorted(EXPORT_FORMATS)}, got {export_format!r}")
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.bitrate = bitrate
+        self.export_format = export_format
+        self.export_dir = Path(export_dir) if export_dir else None
+        if self.export_format:
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1, thread_name_prefix="encode")
+        self.futures = {}
+
+    def _encode(self, wav_path):
+        wav_path = Path(wav_path)
+        encoded = self.work_dir / (wav_path.stem + ".aac")
+        sidecar = encoded.with_suffix(".json")
+        st = wav_path.stat()
+        key = {"wav_size": st.st_size, "wav_mtime_ns": st.st_mtime_ns, "bitrate": self.bitrate}
+        if not (encoded.exists() and _read_sidecar(sidecar) == key):
+            sidecar.unlink(missing_ok=True)
+            encode_aac(wav_path, encoded, self.bitrate)
+            sidecar.write_text(json.dumps(key), encoding="utf-8")
+        if self.export_format:
+            suffix, codec = EXPORT_FORMATS[self.export_format]
+            exported = self.export_dir / (wav_path.stem + suffix)
+            if codec is None:
+                run_ffmpeg(['-i', encoded, '-c', 'copy', '-bsf:a', 'aac_adtstoasc', exported])
+            else:
+                run_ffmpeg(['-i', wav_path, *codec, '-b:a', self.bitrate, exported])
+        return encoded
+
+    def submit(self, wav_path):
+        """Start encoding a final chapter WAV; returns a future for its AAC stream's path."""
+        key = str(wav_path)
+        if key not in self.futures:
+            self.futures[key] = self.pool.submit(self._encode, wav_path)
+        return self.futures[key]
+
+    def duration(self, wav_path):
+        """Wait for a chapter's encode; returns its playing time in the book's AAC stream."""
+        return adts_duration(self.submit(wav_path).result())
+
+    def concat(self, wav_paths, out_path):
+        """Wait for the chapters' encodes and join them, in order, into one AAC stream at ``out_path``."""
+        with open(out_path, "wb") as out:
+            for wav_path in wav_paths:
+                with open(self.submit(wav_path).result(), "rb") as f:
+                    shutil.copyfileobj(f, out)
+        return Path(out_path)
+
+    def close(self, remove=False, cancel=False):
+        """Stop the pool; ``remove`` deletes the encodes once the book is done, ``cancel`` drops queued ones."""
+        self.pool.shutdown(wait=True, cancel_futures=cancel)
+        if remove:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Chapter intermediates: the per-chapter audio files between synthesis and
+the AAC encode (``--intermediate-format``).
+
+A chapter used to be written as a WAV and then rewritten in full by each
+post-processing step (silence trimming, voice speed), so every chapter
+crossed scratch storage three to five times. Now post-processing runs in
+memory and the result is written once, as 16-bit WAV or FLAC (lossless,
+about half the size), by a background thread while the next chapter is
+synthesized. The encoder and the mux read these files directly.
+
+Writes and the bookkeeping that follows them run in book order on a single
+thread, so chapters reach the encoder (and the progressive file) in order.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+# Output suffix and soundfile format per intermediate format; both hold 16-bit PCM
+INTERMEDIATE_FORMATS = {
+    'wav': ('.wav', 'WAV'),
+    'flac': ('.flac', 'FLAC'),
+}
+DEFAULT_INTERMEDIATE_FORMAT = 'wav'
+WAV_HEADER_BYTES = 44
+
+
+def wav_bytes(samples):
+    """Size of a 16-bit mono WAV of ``samples`` samples."""
+    return WAV_HEADER_BYTES + 2 * samples
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+class ChapterWriter:
+    """
+    Post-processes and writes finished chapters on a background thread.
+    At most ``max_pending`` chapters wait in memory; beyond that, ``write``
+    blocks until the oldest one is on disk.
+    """
+
+    def __init__(self, intermediate_format=DEFAULT_INTERMEDIATE_FORMAT, max_pending=2):
+        if intermediate_format not in INTERMEDIATE_FORMATS:
+            raise ValueError(f"intermediate_format must be one of {sorted(INTERMEDIATE_FORMATS)}, "
+                             f"got {intermediate_format!r}")
+        self.intermediate_format = intermediate_format
+        self.suffix, self.format = INTERMEDIATE_FORMATS[intermediate_format]
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chapter-writer")
+        self.pending = []
+        self.chapters = 0
+        self.bytes_written = 0
+        self.wav_bytes = 0
+        self.legacy_io_bytes = 0
+        self.write_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn`` on the writer thread after every chapter queued so far."""
+        self._throttle()
+        self.pending.append(self.pool.submit(fn, *args, **kwargs))
+
+    def write(self, path, audio, sample_rate, steps=(), on_written=None):
+        """
+        Queue ``audio`` for ``path``: apply each of ``steps`` (audio -> audio),
+        write it atomically, then call ``on_written(path, duration)``.
+        """
+        self.call(self._write, Path(path), audio, sample_rate, steps, on_written)
+
+    def _write(self, path, audio, sample_rate, steps, on_written):
+        # The old path wrote the raw chapter, then every step read it back and rewrote it
+        legacy = wav_bytes(len(audio))
+        for step in steps:
+            processed = step(audio)
+            legacy += wav_bytes(len(audio)) + wav_bytes(len(processed))
+            audio = processed
+        start = time.perf_counter()
+        tmp_path = path.with_name(path.name + '.tmp')
+        soundfile.write(tmp_path, np.clip(audio, -1.0, 1.0), sample_rate, format=self.format, subtype='PCM_16')
+        os.replace(tmp_path, path)
+        self.write_seconds += time.perf_counter() - start
+        self.chapters += 1
+        self.bytes_written += path.stat().st_size
+        self.wav_bytes += wav_bytes(len(audio))
+        self.legacy_io_bytes += legacy
+        if on_written is not None:
+            on_written(path, len(audio) / sample_rate)
+
+    def _throttle(self):
+        self.pending = [f for f in self.pending if not f.done() or f.exception()]
+        while len(self.pending) >= self.max_pending:
+            self._wait_for(self.pending.pop(0))
+
+    def _wait_for(self, future):
+        start = time.perf_counter()
+        try:
+            future.result()
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+
+    def close(self):
+        """Wait until every queued chapter is written; re-raises the first failure."""
+        try:
+            while self.pending:
+                self._wait_for(self.pending.pop(0))
+        finally:
+            self.pool.shutdown(wait=True)
+
+    def abort(self):
+        """Drop chapters not yet being written and stop the thread, after a failure."""
+        self.pending = []
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def report(self):
+        """Log this book's scratch space and I/O against the old write-then-rewrite path."""
+        if not self.chapters:
+            return
+        if self.intermediate_format == 'wav':
+            space = f"{format_bytes(self.bytes_written)} on disk"
+        else:
+            saved = 1 - self.bytes_written / self.wav_bytes
+            space = (f"{format_bytes(self.bytes_written)} on disk vs {format_bytes(self.wav_bytes)} "
+                     f"as WAV ({saved:.0%} less scratch space)")
+        io_saved = 1 - self.bytes_written / self.legacy_io_bytes
+        logging.info(f"Intermediates ({self.intermediate_format}, {self.chapters} chapters): {space}; "
+                     f"{format_bytes(self.bytes_written)} of scratch I/O vs {format_bytes(self.legacy_io_bytes)} "
+                     f"by rewriting per step ({io_saved:.0%} less); {self.write_seconds:.1f}s of writing in the "
+                     f"background, synthesis waited {self.wait_seconds:.1f}s")
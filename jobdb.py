@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Crash-safe record of a batch run in SQLite (WAL mode).
+
+Every book, chapter and synthesis batch gets a row with its status, start
+and end times, character and byte counts and output path. A restarted run
+consults it to continue exactly where the last one stopped:
+
+    - finished books are skipped without opening the file again
+    - finished chapters are reused with their stored durations
+    - finished batches of an unfinished chapter are reloaded from their
+      saved audio instead of being synthesized again
+
+A book whose file (size or mtime) or render settings (voice, sampling,
+speed, seed, post-processing; see ``core.book_fingerprint``) changed since
+it was recorded starts over, and a chapter or batch whose text changed is
+synthesized again.
+The database lives in the output folder (JOB_DB_NAME) and is safe to share
+between the forked workers of one batch run.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+JOB_DB_NAME = ".chatterblez-jobs.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL UNIQUE,
+    file_size INTEGER NOT NULL,
+    file_mtime_ns INTEGER NOT NULL,
+    settings_hash TEXT,
+    title TEXT,
+    status TEXT NOT NULL,
+    started REAL,
+    ended REAL,
+    output_path TEXT,
+    output_bytes INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT,
+    chars INTEGER,
+    text_hash TEXT,
+    status TEXT NOT NULL,
+    started REAL,
+    ended REAL,
+    wav_path TEXT,
+    wav_bytes INTEGER,
+    duration REAL,
+    UNIQUE (book_id, name)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    chars INTEGER,
+    text_hash TEXT,
+    status TEXT NOT NULL,
+    started REAL,
+    ended REAL,
+    audio_path TEXT,
+    audio_bytes INTEGER,
+    UNIQUE (chapter_id, idx)
+);
+"""
+# Columns added after the first release, for databases created without them
+ADDED_COLUMNS = (
+    ("books", "settings_hash TEXT"),
+    ("chapters", "text_hash TEXT"),
+    ("batches", "text_hash TEXT"),
+)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class JobDB:
+    """
+    Thin wrapper over one SQLite file. Safe to use from several threads; a
+    forked child opens its own connection on first use.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            for table, column in ADDED_COLUMNS:
+                if column.split()[0] not in {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    try:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+                    except sqlite3.OperationalError:
+                        pass  # another worker added it first
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _one(self, sql, params=()):
+        rows = self._execute(sql, params)
+        return rows[0] if rows else None
+
+    # ----------------- Books -----------------
+
+    def _book_row(self, file_path):
+        return self._one("SELECT * FROM books WHERE file_path = ?", (str(Path(file_path).resolve()),))
+
+    @staticmethod
+    def _book_current(row, file_path, settings_hash):
+        st = Path(file_path).stat()
+        return ((row["file_size"], row["file_mtime_ns"], row["settings_hash"])
+                == (st.st_size, st.st_mtime_ns, settings_hash))
+
+    def is_book_finished(self, file_path, settings_hash=None):
+        """True if ``file_path`` was fully synthesized with ``settings_hash`` and has not changed since."""
+        row = self._book_row(file_path)
+        if row is None or row["status"] != "finished":
+            return False
+        return self._book_current(row, file_path, settings_hash)
+
+    def start_book(self, file_path, title=None, settings_hash=None):
+        """Book id for ``file_path``, keeping its progress unless the file or ``settings_hash`` changed."""
+        path = str(Path(file_path).resolve())
+        st = Path(file_path).stat()
+        row = self._book_row(file_path)
+        if row is not None and not self._book_current(row, file_path, settings_hash):
+            self._execute("DELETE FROM books WHERE id = ?", (row["id"],))
+            row = None
+        if row is None:
+            self._execute(
+                "INSERT OR IGNORE INTO books (file_path, file_size, file_mtime_ns, settings_hash, title, status, "
+                "started) VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                (path, st.st_size, st.st_mtime_ns, settings_hash, title, time.time()))
+        else:
+            self._execute("UPDATE books SET status = 'running', error = NULL WHERE id = ? AND status != 'finished'",
+                          (row["id"],))
+        return self._book_row(file_path)["id"]
+
+    def finish_book(self, book_id, output_path):
+        self._execute("UPDATE books SET status = 'finished', ended = ?, output_path = ?, output_bytes = ? "
+                      "WHERE id = ?", (time.time(), str(output_path), Path(output_path).stat().st_size, book_id))
+
+    def fail_book(self, book_id, error):
+        self._execute("UPDATE books SET status = 'failed', ended = ?, error = ? WHERE id = ?",
+                      (time.time(), str(error), book_id))
+
+    # ----------------- Chapters -----------------
+
+    def finished_chapter(self, book_id, name, text):
+        """Row of a finished chapter of ``text`` whose audio is still on disk, else None."""
+        row = self._one("SELECT * FROM chapters WHERE book_id = ? AND name = ? AND status = 'finished'",
+                        (book_id, name))
+        if row is None or row["text_hash"] != text_hash(text):
+            return None
+        if not row["wav_path"] or not Path(row["wav_path"]).exists():
+            return None
+        return row
+
+    def start_chapter(self, book_id, name, idx, text, wav_path):
+        """
+        Chapter id for ``name``, keeping its finished batches. Chapters are
+        keyed by name, not position, since parts of a split book each see
+        only some of the chapters.
+        """
+        self._execute(
+            "INSERT INTO chapters (book_id, idx, name, chars, text_hash, status, started, wav_path) "
+            "VALUES (?, ?, ?, ?, ?, 'running', ?, ?) "
+            "ON CONFLICT (book_id, name) DO UPDATE SET idx = excluded.idx, chars = excluded.chars, "
+            "text_hash = excluded.text_hash, status = 'running', started = excluded.started, "
+            "wav_path = excluded.wav_path",
+            (book_id, idx, name, len(text), text_hash(text), time.time(), str(wav_path)))
+        return self._one("SELECT id FROM chapters WHERE book_id = ? AND name = ?", (book_id, name))["id"]
+
+    def finish_chapter(self, chapter_id, wav_path, duration):
+        self._execute("UPDATE chapters SET status = 'finished', ended = ?, wav_path = ?, wav_bytes = ?, "
+                      "duration = ? WHERE id = ?",
+                      (time.time(), str(wav_path), Path(wav_path).stat().st_size, duration, chapter_id))
+
+    # ----------------- Batches -----------------
+
+    def load_batch(self, chapter_id, idx, text):
+        """Saved audio of a finished batch of ``text``, or None."""
+        row = self._one("SELECT audio_path, text_hash FROM batches "
+                        "WHERE chapter_id = ? AND idx = ? AND status = 'finished'", (chapter_id, idx))
+        if row is None or row["text_hash"] != text_hash(text) or not Path(row["audio_path"]).exists():
+            return None
+        return np.load(row["audio_path"])
+
+    def start_batch(self, chapter_id, idx, text):
+        self._execute(
+            "INSERT INTO batches (chapter_id, idx, chars, text_hash, status, started) "
+            "VALUES (?, ?, ?, ?, 'running', ?) "
+            "ON CONFLICT (chapter_id, idx) DO UPDATE SET chars = excluded.chars, text_hash = excluded.text_hash, "
+            "status = 'running', started = excluded.started",
+            (chapter_id, idx, len(text), text_hash(text), time.time()))
+
+    def finish_batch(self, chapter_id, idx, audio, parts_dir):
+        """Save a batch's audio under ``parts_dir`` and mark it finished."""
+        parts_dir = Path(parts_dir)
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        audio_path = parts_dir / f"{chapter_id}-{idx}.npy"
+        tmp_path = audio_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+        os.replace(tmp_path, audio_path)
+        self._execute("UPDATE batches SET status = 'finished', ended = ?, audio_path = ?, audio_bytes = ? "
+                      "WHERE chapter_id = ? AND idx = ?",
+                      (time.time(), str(audio_path), audio_path.stat().st_size, chapter_id, idx))
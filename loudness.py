@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Chapter loudness normalization (``--normalize-loudness``).
+
+Integrated loudness is measured as in ITU-R BS.1770-4: K-weighting (a
+high shelf and a high pass, run as one second-order-sections filter with
+carried state), mean square over 400 ms blocks at 75% overlap, then the
+absolute (-70 LUFS) and relative (-10 LU) gates. The measurement streams
+over the chapter buffer in fixed-size pieces, keeping only ten numbers per
+second of audio, so a chapter is read once and scaled once, in memory,
+before it is written. There is no second pass over the files and no ffmpeg
+``loudnorm`` over the finished book.
+"""
+import logging
+
+import numpy as np
+
+DEFAULT_TARGET_LUFS = -18.0
+# Gains are reduced so no sample peaks above this
+PEAK_CEILING_DBFS = -1.0
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Gating blocks are 400 ms long, every 100 ms
+STEP_SECONDS = 0.1
+STEPS_PER_BLOCK = 4
+STREAM_SECONDS = 10
+
+
+def _biquad(kind, fc, gain_db, q, sr):
+    """RBJ cookbook biquad as one normalized second-order section."""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * fc / sr
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    if kind == 'high_shelf':
+        b = [a * ((a + 1) + (a - 1) * cos_w0 + 2 * np.sqrt(a) * alpha),
+             -2 * a * ((a - 1) + (a + 1) * cos_w0),
+             a * ((a + 1) + (a - 1) * cos_w0 - 2 * np.sqrt(a) * alpha)]
+        den = [(a + 1) - (a - 1) * cos_w0 + 2 * np.sqrt(a) * alpha,
+               2 * ((a - 1) - (a + 1) * cos_w0),
+               (a + 1) - (a - 1) * cos_w0 - 2 * np.sqrt(a) * alpha]
+    else:  # high_pass
+        # BS.1770 uses a [1, -2, 1] numerator rather than the cookbook's unity-gain one
+        b = [1 + alpha, -2 * (1 + alpha), 1 + alpha]
+        den = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return np.array(b + den) / den[0]
+
+
+def k_weighting_sos(sr):
+    """BS.1770 K-weighting at sample rate ``sr``: the 'head' high shelf, then the RLB high pass."""
+    return np.vstack([_biquad('high_shelf', 1500.0, 4.0, 1 / np.sqrt(2), sr),
+                      _biquad('high_pass', 38.0, 0.0, 0.5, sr)])
+
+
+class LoudnessMeter:
+    """Integrated loudness of mono audio fed in consecutive pieces with ``update``."""
+
+    def __init__(self, sr):
+        self.sos = k_weighting_sos(sr)
+        self.state = np.zeros((len(self.sos), 2))
+        self.step = int(round(STEP_SECONDS * sr))
+        self.tail = np.zeros(0)
+        self.step_powers = []
+
+    def update(self, samples):
+        from scipy.signal import sosfilt
+
+        weighted, self.state = sosfilt(self.sos, samples, zi=self.state)
+        weighted = np.concatenate([self.tail, weighted])
+        n = len(weighted) // self.step * self.step
+        self.step_powers.append(np.mean(weighted[:n].reshape(-1, self.step) ** 2, axis=1))
+        self.tail = weighted[n:]
+
+    def integrated(self):
+        """Gated integrated loudness in LUFS; -inf for silence or audio shorter than one block."""
+        steps = np.concatenate(self.step_powers) if self.step_powers else np.zeros(0)
+        if len(steps) < STEPS_PER_BLOCK:
+            return float('-inf')
+        blocks = np.convolve(steps, np.full(STEPS_PER_BLOCK, 1 / STEPS_PER_BLOCK), 'valid')
+        with np.errstate(divide='ignore'):
+            block_lufs = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[block_lufs > ABSOLUTE_GATE_LUFS]
+        if not len(gated):
+            return float('-inf')
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+        gated = blocks[(block_lufs > ABSOLUTE_GATE_LUFS) & (block_lufs > relative_gate)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def integrated_loudness(audio, sr):
+    """Integrated loudness of mono ``audio``, measured in STREAM_SECONDS pieces."""
+    meter = LoudnessMeter(sr)
+    piece = int(STREAM_SECONDS * sr)
+    for start in range(0, len(audio), piece):
+        meter.update(audio[start:start + piece])
+    return meter.integrated()
+
+
+class LoudnessNormalizer:
+    """
+    A ChapterWriter step that brings every chapter to ``target`` LUFS,
+    capped so peaks stay under PEAK_CEILING_DBFS. ``report`` logs the
+    spread before and after for the book.
+    """
+
+    def __init__(self, sr, target=DEFAULT_TARGET_LUFS):
+        self.sr = sr
+        self.target = target
+        self.measured = []
+        self.normalized = []
+
+    def __call__(self, audio):
+        loudness = integrated_loudness(audio, self.sr)
+        if not np.isfinite(loudness):
+            logging.info("Loudness: chapter is silent; left as is")
+            return audio
+        gain_db = self.target - loudness
+        peak = float(np.max(np.abs(audio)))
+        peak_room_db = PEAK_CEILING_DBFS - 20 * np.log10(peak) if peak > 0 else gain_db
+        if gain_db > peak_room_db:
+            logging.info(f"Loudness: gain limited from {gain_db:+.1f} dB to {peak_room_db:+.1f} dB by peaks")
+            gain_db = peak_room_db
+        self.measured.append(loudness)
+        self.normalized.append(loudness + gain_db)
+        logging.info(f"Loudness: chapter at {loudness:.1f} LUFS, gain {gain_db:+.1f} dB")
+        return (audio * np.float32(10 ** (gain_db / 20))).astype(np.float32)
+
+    def report(self):
+        if not self.measured:
+            return
+        logging.info(f"Loudness ({len(self.measured)} chapters, target {self.target:.1f} LUFS): "
+                     f"{min(self.measured):.1f} to {max(self.measured):.1f} LUFS before, "
+                     f"{min(self.normalized):.1f} to {max(self.normalized):.1f} LUFS after")
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Per-book render manifest for incremental re-renders (``--incremental``).
+
+Every rendered chapter is recorded under a hash of its cleaned text, the
+voice and every setting that shapes its audio, together with a lossless
+FLAC copy of its final audio. When a corrected edition of the book is run
+again, chapters whose hash is already in the manifest are restored from
+their FLAC instead of being synthesized, even if they were renamed or moved;
+only new or changed chapters are rendered. ``--dry-run`` prints the diff.
+
+The manifest and its artifacts live in RENDER_STORE/<book stem>/ inside the
+output folder. Only one process may record into a manifest at a time (the
+parts of a split book only read it; the final mux run records); files are
+replaced through uniquely named temporaries, so readers never see a
+partial write.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+import soundfile
+
+RENDER_STORE = ".chatterblez-renders"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def render_fingerprint(voice_wav, settings):
+    """Hash of the voice and the render ``settings`` dict; any change re-renders every chapter."""
+    voice = file_digest(voice_wav) if voice_wav else "built-in"
+    payload = json.dumps({"version": MANIFEST_VERSION, "voice": voice, **settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _tmp_path(path):
+    # Unique per call, so concurrent writers never move each other's temporary away
+    return path.with_name(f"{path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+
+
+class RenderManifest:
+    def __init__(self, store_dir, fingerprint):
+        self.store_dir = Path(store_dir)
+        self.path = self.store_dir / "manifest.json"
+        self.fingerprint = fingerprint
+        self.entries = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = {entry["hash"]: entry for entry in data["chapters"]}
+
+    def chapter_hash(self, text):
+        return hashlib.sha256(f"{self.fingerprint}\n{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, chapter_hash):
+        """The recorded entry for ``chapter_hash`` if its audio is still stored, else None."""
+        entry = self.entries.get(chapter_hash)
+        if entry is None or not (self.store_dir / entry["artifact"]).exists():
+            return None
+        return entry
+
+    def restore(self, chapter_hash, wav_path):
+        """Write the stored audio of ``chapter_hash`` to ``wav_path``; False if there is none."""
+        entry = self.lookup(chapter_hash)
+        if entry is None:
+            return False
+        audio, sr = soundfile.read(self.store_dir / entry["artifact"], dtype="float32")
+        soundfile.write(wav_path, audio, sr)
+        return True
+
+    def record(self, chapter_hash, name, index, wav_path, duration):
+        """Keep a FLAC copy of a finished chapter and save the manifest."""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        artifact = f"{chapter_hash[:32]}.flac"
+        if not (self.store_dir / artifact).exists():
+            audio, sr = soundfile.read(wav_path, dtype="float32")
+            tmp_path = _tmp_path(self.store_dir / artifact)
+            soundfile.write(tmp_path, audio, sr, format="FLAC", subtype="PCM_24")
+            os.replace(tmp_path, self.store_dir / artifact)
+        self.entries[chapter_hash] = {"hash": chapter_hash, "name": name, "index": index, "artifact": artifact,
+                                      "duration": duration, "rendered": time.time()}
+        self.save()
+
+    def save(self):
+        tmp_path = _tmp_path(self.path)
+        tmp_path.write_text(json.dumps({"version": MANIFEST_VERSION, "fingerprint": self.fingerprint,
+                                        "chapters": list(self.entries.values())}, indent=1), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def prune(self, keep_hashes):
+        """Forget chapters the current edition no longer has and delete their audio."""
+        for chapter_hash in set(self.entries) - set(keep_hashes):
+            entry = self.entries.pop(chapter_hash)
+            (self.store_dir / entry["artifact"]).unlink(missing_ok=True)
+        self.save()
+
+    def diff(self, chapters):
+        """
+        Compare ``chapters``, ``(name, text)`` pairs in book order, with the
+        manifest. Returns ``(status, name, detail)`` lines: status is
+        'reuse', 'changed', 'new' or 'dropped'.
+        """
+        lines = []
+        seen = set()
+        by_name = {entry["name"]: entry for entry in self.entries.values()}
+        for i, (name, text) in enumerate(chapters, start=1):
+            entry = self.lookup(self.chapter_hash(text))
+            if entry is not None:
+                seen.add(entry["hash"])
+                moved = [] if entry["name"] == name else [f"was {entry['name']}"]
+                moved += [] if entry["index"] == i else [f"was #{entry['index']}"]
+                lines.append(("reuse", name, ", ".join(moved)))
+            elif name in by_name:
+                seen.add(by_name[name]["hash"])
+                lines.append(("changed", name, f"{len(text):,} chars"))
+            else:
+                lines.append(("new", name, f"{len(text):,} chars"))
+        for entry in self.entries.values():
+            if entry["hash"] not in seen:
+                lines.append(("dropped", entry["name"], ""))
+        return lines
+
+
+def log_diff(lines):
+    marks = {"reuse": "=", "changed": "~", "new": "+", "dropped": "-"}
+    for status, name, detail in lines:
+        logging.info(f"  {marks[status]} {name}" + (f" ({detail})" if detail else ""))
+    counts = {status: sum(1 for line in lines if line[0] == status) for status in marks}
+    logging.info(f"Re-render plan: {counts['reuse']} reused, {counts['changed']} changed, "
+                 f"{counts['new']} new, {counts['dropped']} dropped")
+    return counts
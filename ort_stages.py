@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime execution of the fixed-shape parts of S3Gen on CPU.
+
+Two networks dominate S3Gen's CPU time and have no state between calls:
+
+    estimator - the flow-matching decoder, run once per Euler step on a
+                CFG pair of mel spectrograms
+    hift      - the HiFi-GAN convolution stack between the source STFT and
+                the iSTFT
+
+Each is exported to ONNX once, cached on disk next to a fingerprint of the
+checkpoint it came from, and run through an onnxruntime session with full
+graph optimizations. The STFT/iSTFT, the f0 source module (which draws
+noise from the torch RNG) and T3 stay in torch.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+from precision import checkpoint_fingerprint
+
+ONNX_CACHE_DIR = Path(os.environ.get(
+    "CHATTERBLEZ_ONNX_CACHE", Path.home() / ".cache" / "chatterblez" / "onnx"))
+ONNX_OPSET = 17
+
+
+def make_session(onnx_path, threads=0):
+    """onnxruntime CPU session for ``onnx_path``; ``threads=0`` lets onnxruntime pick."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _run(session, **inputs):
+    feeds = {name: tensor.detach().float().contiguous().cpu().numpy() for name, tensor in inputs.items()}
+    return torch.from_numpy(session.run(None, feeds)[0])
+
+
+class _HiftFilter(torch.nn.Module):
+    """``HiFTGenerator.decode`` between the source STFT and the iSTFT."""
+
+    def __init__(self, hift):
+        super().__init__()
+        self.hift = hift
+
+    def forward(self, x, s_stft):
+        h = self.hift
+        x = h.conv_pre(x)
+        for i in range(h.num_upsamples):
+            x = F.leaky_relu(x, h.lrelu_slope)
+            x = h.ups[i](x)
+            if i == h.num_upsamples - 1:
+                x = h.reflection_pad(x)
+            si = h.source_downs[i](s_stft)
+            si = h.source_resblocks[i](si)
+            x = x + si
+            xs = None
+            for j in range(h.num_kernels):
+                if xs is None:
+                    xs = h.resblocks[i * h.num_kernels + j](x)
+                else:
+                    xs = xs + h.resblocks[i * h.num_kernels + j](x)
+            x = xs / h.num_kernels
+        x = F.leaky_relu(x)
+        return h.conv_post(x)
+
+
+def _source_stft(hift, mel):
+    """Source excitation STFT for ``mel``, as computed by ``HiFTGenerator.inference``/``decode``."""
+    f0 = hift.f0_predictor(mel)
+    s = hift.f0_upsamp(f0[:, None]).transpose(1, 2)
+    s, _, _ = hift.m_source(s)
+    s_stft_real, s_stft_imag = hift._stft(s.transpose(1, 2).squeeze(1))
+    return torch.cat([s_stft_real, s_stft_imag], dim=1)
+
+
+def _export(module, example_inputs, input_names, dynamic_axes, onnx_path):
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = onnx_path.with_suffix(".tmp")
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            module, example_inputs, str(tmp_path),
+            input_names=input_names,
+            output_names=["out"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+        )
+    os.replace(tmp_path, onnx_path)
+    logging.info(f"Exported {onnx_path.name} in {time.perf_counter() - start:.1f}s")
+
+
+def export_estimator(s3gen, onnx_path):
+    estimator = s3gen.flow.decoder.estimator
+    n_time = 200
+    example = (
+        torch.randn(2, 80, n_time), torch.ones(2, 1, n_time), torch.randn(2, 80, n_time),
+        torch.rand(2), torch.randn(2, 80), torch.randn(2, 80, n_time),
+    )
+    names = ["x", "mask", "mu", "t", "spks", "cond"]
+    axes = {"x": {2: "T"}, "mask": {2: "T"}, "mu": {2: "T"}, "cond": {2: "T"}, "out": {2: "T"}}
+    _export(estimator, example, names, axes, onnx_path)
+
+
+def export_hift(s3gen, onnx_path):
+    hift = s3gen.mel2wav
+    with torch.no_grad():
+        mel = torch.randn(1, 80, 100)
+        example = (mel, _source_stft(hift, mel))
+    axes = {"x": {2: "T"}, "s_stft": {2: "F"}, "out": {2: "F"}}
+    _export(_HiftFilter(hift), example, ["x", "s_stft"], axes, onnx_path)
+
+
+class OrtEstimator(torch.nn.Module):
+    """Drop-in for the flow decoder's estimator; ``ConditionalCFM`` calls ``forward`` on it."""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def forward(self, x, mask, mu, t, spks=None, cond=None):
+        return _run(self.session, x=x, mask=mask, mu=mu, t=t, spks=spks, cond=cond).to(x.dtype)
+
+
+def _ort_hift_decode(hift, session):
+    n_mag = hift.istft_params["n_fft"] // 2 + 1
+
+    def decode(x, s=torch.zeros(1, 1, 0)):
+        s_stft_real, s_stft_imag = hift._stft(s.squeeze(1))
+        s_stft = torch.cat([s_stft_real, s_stft_imag], dim=1)
+        out = _run(session, x=x, s_stft=s_stft)
+        magnitude = torch.exp(out[:, :n_mag, :])
+        phase = torch.sin(out[:, n_mag:, :])
+        wav = hift._istft(magnitude, phase)
+        return torch.clamp(wav, -hift.audio_limit, hift.audio_limit)
+    return decode
+
+
+_GRAPHS = (
+    ("s3gen-estimator", export_estimator),
+    ("s3gen-hift", export_hift),
+)
+
+
+def accelerate_s3gen(s3gen, threads=0, cache_dir=ONNX_CACHE_DIR):
+    """
+    Route ``s3gen``'s estimator and HiFi-GAN stack through onnxruntime, in
+    place. Graphs are exported on first use and reused from ``cache_dir``.
+    """
+    fingerprint = checkpoint_fingerprint("s3gen.safetensors", f"onnx{ONNX_OPSET}")
+    sessions = {}
+    for name, export in _GRAPHS:
+        onnx_path = Path(cache_dir) / f"{name}-{fingerprint}.onnx"
+        if not onnx_path.exists():
+            export(s3gen, onnx_path)
+        sessions[name] = make_session(onnx_path, threads)
+    s3gen.flow.decoder.estimator = OrtEstimator(sessions["s3gen-estimator"])
+    s3gen.mel2wav.decode = _ort_hift_decode(s3gen.mel2wav, sessions["s3gen-hift"])
+    logging.info(f"S3Gen running on onnxruntime (graphs: {cache_dir})")
+    return s3gen
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Low-precision CPU inference for ChatterboxTTS.
+
+Modes:
+    fp32       - unchanged (default)
+    bf16       - bf16 autocast around T3 and the S3Gen flow model
+    int8       - int8 dynamic quantization of the T3 backbone and S3Gen flow
+                 Linear layers
+    int8-bf16  - both
+
+Quantized modules are cached on disk, keyed by the source checkpoint and the
+torch version, so only the first run on a node pays for quantization. All
+modes are CPU-only; on CUDA the model is left in fp32.
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+
+import torch
+
+PRECISION_MODES = ('fp32', 'bf16', 'int8', 'int8-bf16')
+QUANT_CACHE_DIR = Path(os.environ.get(
+    "CHATTERBLEZ_QUANT_CACHE", Path.home() / ".cache" / "chatterblez" / "quantized"))
+
+# (attribute path on ChatterboxTTS, checkpoint file it is loaded from).
+# T3's speech_head and the HiFi-GAN vocoder stay in fp32: T3 reads
+# speech_head.weight.device, and the vocoder is conv/STFT bound.
+_QUANT_TARGETS = (
+    ("t3.tfmr", "t3_cfg.safetensors"),
+    ("s3gen.flow", "s3gen.safetensors"),
+)
+
+
+def uses_int8(mode):
+    return mode in ('int8', 'int8-bf16')
+
+
+def uses_bf16(mode):
+    return mode in ('bf16', 'int8-bf16')
+
+
+def autocast_context(cb_model):
+    """Autocast context for the model's precision mode (a no-op unless bf16)."""
+    if uses_bf16(getattr(cb_model, "precision", "fp32")):
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def checkpoint_fingerprint(filename, tag):
+    """Short hash identifying a downloaded checkpoint file, the torch version and ``tag``."""
+    from huggingface_hub import hf_hub_download
+    from chatterbox.tts import REPO_ID
+
+    path = Path(hf_hub_download(repo_id=REPO_ID, filename=filename))
+    st = path.stat()
+    key = f"{filename}:{st.st_size}:{st.st_mtime_ns}:{torch.__version__}:{tag}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _get_attr_path(obj, path):
+    for name in path.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _set_attr_path(obj, path, value):
+    parent, _, name = path.rpartition(".")
+    setattr(_get_attr_path(obj, parent) if parent else obj, name, value)
+
+
+def quantize_module(module, cache_path):
+    """int8 dynamic quantization of ``module``'s Linear layers, cached at ``cache_path``."""
+    if cache_path.exists():
+        try:
+            return torch.load(cache_path, weights_only=False)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable quantized cache {cache_path}: {e}")
+    quantized = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        torch.save(quantized, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache quantized weights at {cache_path}: {e}")
+    return quantized
+
+
+def apply_precision(cb_model, mode, cache_dir=QUANT_CACHE_DIR):
+    """Switch a loaded ChatterboxTTS to ``mode`` (one of PRECISION_MODES) in place."""
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"precision must be one of {PRECISION_MODES}, got {mode!r}")
+    cb_model.precision = 'fp32'
+    if mode == 'fp32':
+        return cb_model
+    if str(cb_model.device) != 'cpu':
+        logging.warning(f"Precision mode {mode!r} is CPU-only; running {cb_model.device} in fp32")
+        return cb_model
+
+    if uses_int8(mode):
+        start = time.perf_counter()
+        for attr_path, checkpoint in _QUANT_TARGETS:
+            cache_path = Path(cache_dir) / f"{attr_path}-{checkpoint_fingerprint(checkpoint, 'int8')}.pt"
+            module = _get_attr_path(cb_model, attr_path)
+            _set_attr_path(cb_model, attr_path, quantize_module(module, cache_path).eval())
+        logging.info(f"int8 weights ready in {time.perf_counter() - start:.1f}s (cache: {cache_dir})")
+    cb_model.precision = mode
+    return cb_model
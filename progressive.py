@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Progressive audiobook output (``--progressive``): the book is listenable
+while it is still rendering.
+
+Chapters are encoded by a ``ChapterEncoder`` (see encoding.py) as they are
+finished. Their ADTS AAC streams concatenate byte for byte, so the book's
+audio grows by appending each encode in order, from the encode's done
+callback, as soon as it and every chapter before it are encoded. Whenever
+chapters have been appended, ``<book>.partial.m4b`` is rewritten from that stream with
+``-c copy`` as a fragmented MP4 with the chapter list so far, so the partial
+file plays in standard players at any time. At the end, the same stream is
+muxed, again with stream copy only, into the normal m4b with cover and
+chapters. A partial file that cannot be replaced (a player on Windows may
+hold it open) is retried with the next chapter and never stops the render.
+"""
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from encoding import adts_duration, m4b_mux_args, run_ffmpeg, write_ffmetadata
+
+# Fragment every ~10 s of audio; AAC frames are all keyframes, so frag_keyframe would fragment per frame
+FRAGMENT_MICROSECONDS = 10_000_000
+
+
+class ProgressiveM4B:
+    """
+    A book assembled chapter by chapter from ``encoder``'s encodes.
+    Chapters must be added in book order; they are appended in that order
+    as their encodes finish.
+    """
+
+    def __init__(self, encoder, partial_path, title, creator):
+        self.encoder = encoder
+        self.partial_path = Path(partial_path)
+        self.title = title
+        self.creator = creator
+        self.audio_path = encoder.work_dir / "book.aac"
+        self.metadata_path = encoder.work_dir / "progressive_chapters.txt"
+        self.pending = []
+        self.durations = []
+        # Done callbacks run on the encode threads
+        self._lock = threading.Lock()
+        # Rebuilt from the chapters added in this run, in order
+        self.audio_path.unlink(missing_ok=True)
+
+    def add_chapter(self, wav_path):
+        """Queue a final chapter WAV; it reaches the partial file as soon as it and its predecessors are encoded."""
+        future = self.encoder.submit(wav_path)
+        with self._lock:
+            self.pending.append(future)
+        future.add_done_callback(lambda _: self._append_ready())
+
+    def _append_ready(self, wait=False):
+        with self._lock:
+            appended = False
+            while self.pending and (wait or self.pending[0].done()):
+                future = self.pending[0]
+                if not wait and (future.cancelled() or future.exception() is not None):
+                    # A failed encode stays at the head, holding back later chapters; finalize re-raises it
+                    break
+                encoded = future.result()
+                with open(self.audio_path, "ab") as out, open(encoded, "rb") as f:
+                    shutil.copyfileobj(f, out)
+                self.pending.pop(0)
+                # The encode's own length (priming and padding included) keeps the marks on the audio
+                self.durations.append(adts_duration(encoded))
+                appended = True
+            if appended and not wait:
+                self._write_partial()
+
+    def close(self):
+        """Stop appending, after a failure; the partial file keeps the chapters appended so far."""
+        with self._lock:
+            self.pending = []
+        if self.durations:
+            logging.info(f"The chapters so far stay playable in {self.partial_path}")
+
+    def _write_partial(self):
+        write_ffmetadata(self.metadata_path, self.title, self.creator, self.durations)
+        tmp_path = self.partial_path.with_suffix('.tmp')
+        try:
+            run_ffmpeg(['-i', self.audio_path, '-i', self.metadata_path,
+                        '-map', '0:a', '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+                        '-map_metadata', '1', '-map_chapters', '1',
+                        '-movflags', '+empty_moov+default_base_moof', '-frag_duration', FRAGMENT_MICROSECONDS,
+                        '-f', 'mp4', tmp_path])
+            os.replace(tmp_path, self.partial_path)
+        except (OSError, RuntimeError) as e:
+            # The partial file is only a preview; the next chapter rewrites it from scratch
+            logging.warning(f"Progressive output: could not update {self.partial_path} ({e}); "
+                            f"retrying with the next chapter")
+            return
+        logging.info(f"Progressive output: {len(self.durations)} chapters, "
+                     f"{sum(self.durations) / 3600:.2f}h playable in {self.partial_path}")
+
+    def finalize(self, final_path, cover_image=b""):
+        """Mux all chapters into a regular m4b at ``final_path`` (stream copy) and drop the partial file."""
+        self._append_ready(wait=True)
+        write_ffmetadata(self.metadata_path, self.title, self.creator, self.durations)
+        cover_path = None
+        if cover_image:
+            cover_path = self.encoder.work_dir / "cover"
+            cover_path.write_bytes(cover_image)
+        tmp_path = Path(final_path).with_suffix('.tmp')
+        run_ffmpeg([*m4b_mux_args(self.audio_path, self.metadata_path, cover_path),
+                    '-movflags', '+faststart', '-f', 'mp4', tmp_path])
+        os.replace(tmp_path, final_path)
+        self.partial_path.unlink(missing_ok=True)
+        logging.info(f'{final_path} created. Enjoy your audiobook.')
+        return Path(final_path)
@@ -6,17 +6,16 @@ from __future__ import annotations
 
 import logging
 import os
-import platform
 import re
-import subprocess
 import sys
 import threading
 import PyPDF2
+from contextlib import contextmanager
 import time
 from pathlib import Path
 from types import SimpleNamespace
 
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject, QSettings
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject, QSettings, QTimer
 from PyQt6.QtGui import QAction
 from PyQt6.QtWidgets import (
     QApplication,
@@ -87,6 +86,127 @@ class CoreThread(QThread):
             self.error.emit(str(exc))
 
 
+class PreviewModel:
+    """
+    The preview's TTS backend, loaded once (in the background at app start)
+    and kept warm across previews. Only re-conditioned when the voice WAV
+    changes, and only reloaded when the backend changes or the voice is
+    cleared. ``session`` holds the model for one preview at a time.
+    """
+
+    def __init__(self):
+        self.tts = None
+        self.voice = None
+        self.lock = threading.Lock()
+
+    def _prepare(self, backend, voice):
+        import backends
+
+        if self.tts is None or self.tts.name != backend or (self.voice and not voice):
+            start = time.perf_counter()
+            self.tts = backends.get_backend(backend)
+            self.tts.load()
+            self.voice = None
+            logging.info(f"Preview model ({backend}) loaded in {time.perf_counter() - start:.1f}s")
+        if voice and voice != self.voice:
+            self.tts.condition(voice)
+            self.voice = voice
+
+    def warm_up(self, backend, voice):
+        """Load and condition in a background thread, so the first preview finds the model ready."""
+        def run():
+            try:
+                with self.lock:
+                    self._prepare(backend, voice)
+            except Exception as e:
+                logging.error(f"Preview model warm-up failed: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    @contextmanager
+    def session(self, backend, voice):
+        with self.lock:
+            self._prepare(backend, voice)
+            yield self.tts
+
+
+class PreviewPlayer(QObject):
+    """
+    One audio output that plays PCM chunks back to back, in the order they
+    were queued. ``queue_audio`` may be called from any thread; playback
+    and ``stop`` happen on the GUI thread. ``first_audio`` fires when the
+    first chunk after a ``stop`` reaches the device.
+    """
+    first_audio = pyqtSignal()
+    _chunk = pyqtSignal(bytes, int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sink = None
+        self.device = None
+        self.sample_rate = None
+        self.pending = bytearray()
+        self.started = False
+        # Bumped by stop(), so chunks queued before it are dropped on arrival
+        self.generation = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(20)
+        self.timer.timeout.connect(self._drain)
+        self._chunk.connect(self._enqueue)
+
+    def queue_audio(self, wav, sample_rate):
+        import numpy as np
+
+        pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+        self._chunk.emit(pcm, sample_rate, self.generation)
+
+    def _enqueue(self, pcm, sample_rate, generation):
+        if generation != self.generation:
+            return
+        try:
+            from PyQt6.QtMultimedia import QAudioFormat, QAudioSink, QMediaDevices
+        except ImportError as e:
+            logging.error(f"Preview playback needs PyQt6 QtMultimedia: {e}")
+            return
+
+        if self.sink is None or sample_rate != self.sample_rate:
+            if self.sink is not None:
+                self.sink.stop()
+            fmt = QAudioFormat()
+            fmt.setSampleRate(sample_rate)
+            fmt.setChannelCount(1)
+            fmt.setSampleFormat(QAudioFormat.SampleFormat.Int16)
+            self.sink = QAudioSink(QMediaDevices.defaultAudioOutput(), fmt, self)
+            self.sample_rate = sample_rate
+            self.device = None
+        if self.device is None:
+            self.device = self.sink.start()
+        self.pending += pcm
+        self.timer.start()
+        self._drain()
+
+    def _drain(self):
+        if self.device is None:
+            return
+        if self.pending:
+            written = self.device.write(bytes(self.pending[:self.sink.bytesFree()]))
+            if written > 0:
+                del self.pending[:written]
+                if not self.started:
+                    self.started = True
+                    self.first_audio.emit()
+        else:
+            self.timer.stop()
+
+    def stop(self):
+        self.generation += 1
+        self.timer.stop()
+        self.pending.clear()
+        self.started = False
+        if self.sink is not None:
+            self.sink.stop()
+        self.device = None
+
+
 
 # Move open_file_dialog back to MainWindow
     # ----------------- Menu slots -----------------
@@ -112,6 +232,7 @@ class MainWindow(QMainWindow):
         output_folder = self.settings.value("output_folder", "", type=str)
         if output_folder:
             self.output_dir_edit.setText(output_folder)
+        self.warm_preview_model()
 
         # ----------------- UI BUILD -----------------
 
@@ -188,6 +309,10 @@ class MainWindow(QMainWindow):
         controls_layout.addWidget(self.preview_btn)
         self.preview_thread = None
         self.preview_stop_flag = threading.Event()
+        self.preview_model = PreviewModel()
+        self.preview_player = PreviewPlayer(self)
+        self.preview_player.first_audio.connect(self.on_preview_first_audio)
+        self.preview_clicked_at = None
 
         # WAV button
         self.wav_button = QPushButton("Select Voice WAV")
@@ -412,23 +537,38 @@ class MainWindow(QMainWindow):
         if 0 <= row < len(self.document_chapters):
             self.text_edit.setPlainText(self.document_chapters[row].extracted_text)
 
+    def preview_backend(self):
+        import backends
+        return self.settings.value("tts_backend", backends.DEFAULT_BACKEND, type=str)
+
+    def warm_preview_model(self):
+        self.preview_model.warm_up(self.preview_backend(), self.selected_wav_path)
+
     def handle_preview_button(self):
         if self.preview_thread and self.preview_thread.is_alive():
             # Stop preview
             self.preview_stop_flag.set()
+            self.preview_player.stop()
             self.preview_btn.setText("Preview")
         else:
-            # Start preview
-            self.preview_stop_flag.clear()
+            # Start preview; each preview gets its own flag so a stopped one cannot resume
+            self.preview_player.stop()
+            self.preview_stop_flag = threading.Event()
+            self.preview_clicked_at = time.perf_counter()
             self.preview_btn.setText("Stop Preview")
-            self.preview_thread = threading.Thread(target=self.preview_chapter_thread)
+            self.preview_thread = threading.Thread(target=self.preview_chapter_thread,
+                                                   args=(self.preview_stop_flag,))
             self.preview_thread.start()
 
-    def preview_chapter_thread(self):
+    def on_preview_first_audio(self):
+        if self.preview_clicked_at is not None:
+            seconds = time.perf_counter() - self.preview_clicked_at
+            logging.info(f"Preview time to first audio: {seconds:.2f}s")
+            self.statusBar().showMessage(f"Preview started after {seconds:.2f}s", 5000)
+            self.preview_clicked_at = None
+
+    def preview_chapter_thread(self, stop_flag):
         try:
-            from tempfile import NamedTemporaryFile
-            import torch
-            from chatterbox.tts import ChatterboxTTS
             import core
 
             row = self.chapter_list.currentRow()
@@ -452,32 +592,19 @@ class MainWindow(QMainWindow):
                 self.preview_btn.setText("Preview")
                 return
 
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            cb_model = ChatterboxTTS.from_pretrained(device=device)
-            if self.selected_wav_path:
-                cb_model.prepare_conditionals(wav_fpath=self.selected_wav_path)
-            torch.manual_seed(12345)
             sentences = re.split(r'(?<=[.!?])\s+', text)
             chunks = [sent.strip() for sent in sentences if sent.strip()]
             if not chunks:
                 chunks = [text[i:i+50] for i in range(0, len(text), 50)]
-            for chunk in chunks:
-                if self.preview_stop_flag.is_set():
-                    break
-                wav = cb_model.generate(chunk)
-                with NamedTemporaryFile(suffix=".wav", delete=False) as tmpf:
-                    import torchaudio as ta
-                    ta.save(tmpf.name, wav, cb_model.sr)
-                    tmpf.flush()
-                    # Play using OS default player
-                    if self.preview_stop_flag.is_set():
+            # The warm model plays each sentence as soon as it is generated, while the next one renders
+            with self.preview_model.session(self.preview_backend(), self.selected_wav_path) as tts:
+                for chunk in chunks:
+                    if stop_flag.is_set():
+                        break
+                    wav = tts.generate(chunk, seed=core.DEFAULT_SEED)
+                    if stop_flag.is_set():
                         break
-                    if platform.system() == "Windows":
-                        os.startfile(tmpf.name)
-                    elif platform.system() == "Darwin":
-                        subprocess.Popen(["afplay", tmpf.name])
-                    else:
-                        subprocess.Popen(["aplay", tmpf.name])
+                    self.preview_player.queue_audio(wav, tts.sample_rate)
         except Exception as e:
             logging.error(f"Preview Error: {e}")
             QMessageBox.critical(self, "Preview Error", f"Preview failed: {e}")
@@ -493,6 +620,7 @@ class MainWindow(QMainWindow):
             self.wav_button.setText(Path(wav_path).name)
             # Save to persistent settings
             self.settings.setValue("selected_wav_path", wav_path)
+            self.warm_preview_model()
 
     def select_output_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select output folder")
@@ -563,6 +691,7 @@ class MainWindow(QMainWindow):
                     silence_thresh=self.settings.value('silence_thresh', -50, type=float),
                     min_silence_len=self.settings.value('min_silence_len', 500, type=int),
                     keep_silence=self.settings.value('keep_silence', 100, type=int),
+                    draft=self.settings.value('draft_mode', False, type=bool),
                 )
                 self.batch_worker.progress_update.connect(self.on_batch_progress_update)
                 self.batch_worker.chapter_progress.connect(self.on_core_progress)
@@ -609,6 +738,7 @@ class MainWindow(QMainWindow):
                 silence_thresh=self.settings.value('silence_thresh', -50, type=float),
                 min_silence_len=self.settings.value('min_silence_len', 500, type=int),
                 keep_silence=self.settings.value('keep_silence', 100, type=int),
+                draft=self.settings.value('draft_mode', False, type=bool),
             )
             logging.info(params)
             try:
@@ -723,24 +853,6 @@ class MainWindow(QMainWindow):
         self.start_btn.setText("Start Synthesis")
         self.set_task_label("")
 
-        out_dir = os.path.abspath(self.output_dir_edit.text())
-        logging.debug(f"Output directory: {out_dir}")
-        if not os.path.isdir(out_dir):
-            logging.debug(f"Output directory does not exist: {out_dir}")
-        else:
-            all_files = os.listdir(out_dir)
-            logging.debug(f"Files in output directory before deletion: {all_files}")
-            wav_files = [os.path.join(out_dir, f) for f in all_files if f.lower().endswith('.wav')]
-            logging.debug(f".wav files to delete: {wav_files}")
-            for wav_file in wav_files:
-                try:
-                    os.remove(wav_file)
-                    logging.debug(f"Deleted: {wav_file}")
-                except Exception as e:
-                    logging.debug(f"Failed to delete {wav_file}: {e}")
-            all_files_after = os.listdir(out_dir)
-            logging.debug(f"Files in output directory after deletion: {all_files_after}")
-
         elapsed_time = self.time_label.text().split(" | ")[0]
         QMessageBox.information(self, "All files completed", f"All files completed in {elapsed_time}")
 
@@ -793,7 +905,7 @@ class BatchWorker(QThread):
     chapter_progress = pyqtSignal(object)  # stats object from core
     finished = pyqtSignal()
 
-    def __init__(self, selected_files, output_dir, ignore_list, wav_path, voice_speed, repetition_penalty, min_p, top_p, exaggeration, cfg_weight, temperature, enable_silence_trimming, silence_thresh, min_silence_len, keep_silence):
+    def __init__(self, selected_files, output_dir, ignore_list, wav_path, voice_speed, repetition_penalty, min_p, top_p, exaggeration, cfg_weight, temperature, enable_silence_trimming, silence_thresh, min_silence_len, keep_silence, draft=False):
         super().__init__()
         self.selected_files = selected_files
         self.output_dir = output_dir
@@ -810,6 +922,7 @@ class BatchWorker(QThread):
         self.silence_thresh = silence_thresh
         self.min_silence_len = min_silence_len
         self.keep_silence = keep_silence
+        self.draft = draft
         self._should_stop = False
         self.completed = 0
         self.current_file_progress = 0.0
@@ -821,9 +934,16 @@ class BatchWorker(QThread):
     def run(self):
         import core
         import time
+        from scheduler import estimate_book, plan_units, log_schedule, report_makespan
+        from jobdb import JOB_DB_NAME
         self.completed = 0
         total = len(self.selected_files)
         batch_start_time = time.time()
+        # Resume where an interrupted batch stopped: core.main skips books finished with the same settings
+        job_db = Path(self.output_dir) / JOB_DB_NAME
+        # Longest books first, with a predicted finish time to compare against
+        units = plan_units([estimate_book(f, self.ignore_list) for f in self.selected_files], 1)
+        predicted = log_schedule(units, 1, core.expected_throughput(self.draft))
 
         def post_event(evt_name, **kwargs):
             if evt_name == "CORE_PROGRESS":
@@ -832,7 +952,7 @@ class BatchWorker(QThread):
                     self.current_file_progress = stats.progress / 100.0
                 self.chapter_progress.emit(stats)
 
-        for file_path in self.selected_files:
+        for file_path in [unit.book.file_path for unit in units]:
             if self._should_stop:
                 logging.debug("BatchWorker.run() detected stop, breaking batch loop")
                 break
@@ -888,6 +1008,8 @@ class BatchWorker(QThread):
                 silence_thresh=self.silence_thresh,
                 min_silence_len=self.min_silence_len,
                 keep_silence=self.keep_silence,
+                draft=self.draft,
+                job_db=job_db,
             )
             self.completed += 1
             now = time.time()
@@ -902,15 +1024,16 @@ class BatchWorker(QThread):
                 elapsed_str = f"{int(hours):02d}h {int(minutes):02d}m"
             else:
                 elapsed_str = f"{int(minutes):02d}:{int(seconds):02d}"
-            if self.completed > 0:
+            if self.completed:
                 total_est = elapsed / self.completed
-                eta = int(total_est * total - elapsed)
+                eta = int(total_est * (total - self.completed))
                 eta_min = eta // 60
                 eta_sec = eta % 60
                 eta_str = f"{eta_min:02d}:{eta_sec:02d}"
             else:
                 eta_str = "--:--"
             self.progress_update.emit(self.completed, total, elapsed_str, eta_str)
+        report_makespan(predicted, time.time() - batch_start_time)
         self.finished.emit()
 
 def on_batch_progress_update(self, completed, total, elapsed_str, eta_str):
@@ -1056,6 +1179,10 @@ class SettingsDialog(QDialog):
         self.voice_speed_spinbox.setValue(self.settings.value("voice_speed", 1.0, type=float))
         self.voice_speed_spinbox.valueChanged.connect(self.update_voice_speed)
         voice_layout.addRow("Voice Speed:", self.voice_speed_spinbox)
+        self.draft_checkbox = QCheckBox("Draft quality (fast proofing render)")
+        self.draft_checkbox.setChecked(self.settings.value("draft_mode", False, type=bool))
+        self.draft_checkbox.stateChanged.connect(self.save_draft_mode)
+        voice_layout.addRow(self.draft_checkbox)
         layout.addWidget(voice_group)
 
         # Silence Trimming Settings
@@ -1120,6 +1247,7 @@ class SettingsDialog(QDialog):
         self.min_silence_len_spinbox.setValue(self.settings.value("min_silence_len", 500, type=int))
         self.keep_silence_spinbox.setValue(self.settings.value("keep_silence", 100, type=int))
         self.voice_speed_spinbox.setValue(self.settings.value("voice_speed", 1.0, type=float))
+        self.draft_checkbox.setChecked(self.settings.value("draft_mode", False, type=bool))
 
         # Update labels to reflect the loaded values
         self.update_repetition_penalty(self.repetition_penalty_slider.value())
@@ -1165,6 +1293,9 @@ class SettingsDialog(QDialog):
     def update_voice_speed(self, value: float):
         self.settings.setValue("voice_speed", float(value))
 
+    def save_draft_mode(self):
+        self.settings.setValue("draft_mode", self.draft_checkbox.isChecked())
+
 class BatchFilesPanel(QWidget):
     def __init__(self, batch_files, parent=None):
         super().__init__(parent)
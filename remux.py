@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Metadata-, chapter- and cover-only fixes to finished audiobooks (``--remux``).
+
+Only the container is rewritten: audio (and a kept cover) are stream
+copied, so a fix takes seconds per book instead of a re-render or
+re-encode. Changes come from the command line (applied to every book) and
+from sidecar files next to each book, which take precedence:
+
+    <book>.chapters.txt   FFMETADATA chapter list, as written to chapters.txt
+    <book>.jpg / .png     new cover image
+    <book>.json           {"title": ..., "artist": ..., ...} container metadata
+
+A library folder is processed recursively, several books at a time.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from encoding import run_ffmpeg
+
+COVER_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+
+def find_sidecars(m4b_path):
+    """Chapter list, cover and metadata files that sit next to ``m4b_path``."""
+    m4b_path = Path(m4b_path)
+    chapters = m4b_path.with_suffix('.chapters.txt')
+    covers = [m4b_path.with_suffix(suffix) for suffix in COVER_SUFFIXES]
+    meta = m4b_path.with_suffix('.json')
+    return {
+        'chapters_file': chapters if chapters.exists() else None,
+        'cover': next((c for c in covers if c.exists()), None),
+        'metadata': json.loads(meta.read_text(encoding='utf-8')) if meta.exists() else {},
+    }
+
+
+def remux_audiobook(m4b_path, metadata=None, chapters_file=None, cover=None, output_path=None):
+    """
+    Rewrite ``m4b_path`` (in place unless ``output_path`` is given) with new
+    container ``metadata``, chapters from an FFMETADATA ``chapters_file`` and
+    a new ``cover`` image. Anything not given is kept from the original.
+    """
+    m4b_path = Path(m4b_path)
+    output_path = Path(output_path or m4b_path)
+    inputs = ['-i', m4b_path]
+    maps = ['-map', '0:a']
+    chapters_index = 0
+    if chapters_file:
+        inputs += ['-i', chapters_file]
+        chapters_index = 1
+    if cover:
+        inputs += ['-i', cover]
+        maps += ['-map', f'{inputs.count("-i") - 1}:v', '-disposition:v:0', 'attached_pic']
+    else:
+        maps += ['-map', '0:v?']
+    tags = [arg for key, value in (metadata or {}).items() for arg in ('-metadata', f'{key}={value}')]
+
+    tmp_path = output_path.with_name(output_path.stem + '.remux.tmp')
+    try:
+        run_ffmpeg([*inputs, *maps, '-c', 'copy', '-map_metadata', '0', '-map_chapters', chapters_index,
+                    *tags, '-movflags', '+faststart', '-f', 'mp4', tmp_path])
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def remux_library(path, jobs=None, metadata=None, chapters_file=None, cover=None):
+    """
+    Remux one m4b or every m4b under a folder, ``jobs`` books at a time,
+    with the given changes plus each book's sidecars. Books with nothing to
+    change are skipped. Returns the books that failed.
+    """
+    path = Path(path)
+    books = [path] if path.is_file() else sorted(p for p in path.rglob('*.m4b') if not p.name.endswith('.partial.m4b'))
+
+    def remux_one(book):
+        sidecars = find_sidecars(book)
+        changes = {
+            'metadata': {**(metadata or {}), **sidecars['metadata']},
+            'chapters_file': sidecars['chapters_file'] or chapters_file,
+            'cover': sidecars['cover'] or cover,
+        }
+        if not any(changes.values()):
+            logging.info(f"Remux: nothing to change for {book}")
+            return
+        start = time.perf_counter()
+        remux_audiobook(book, **changes)
+        logging.info(f"Remuxed {book} in {time.perf_counter() - start:.1f}s "
+                     f"({', '.join(k for k, v in changes.items() if v)})")
+
+    failed = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        for book, future in [(book, pool.submit(remux_one, book)) for book in books]:
+            try:
+                future.result()
+            except Exception as e:
+                # A broken sidecar or an unreadable book must not stop the rest of the library
+                logging.error(f"Remux of {book} failed: {type(e).__name__}: {e}")
+                failed.append(book)
+    logging.info(f"Remuxed {len(books) - len(failed)}/{len(books)} audiobooks in {time.perf_counter() - start:.1f}s")
+    return failed
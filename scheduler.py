@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Longest-processing-time-first (LPT) scheduling of a batch folder.
+
+Each book's work is estimated before synthesis from the characters
+``core.main`` would synthesize for it. Books bigger than an even share of
+the batch are split into parts of whole chapters, so a single long book
+cannot dominate the makespan; parts are rendered independently and the book
+is muxed once all its chapters exist. Work units are handed to workers
+longest first, each to whichever worker frees up next.
+"""
+import heapq
+import logging
+import math
+from pathlib import Path
+from types import SimpleNamespace
+
+
+def chapter_chars(chapter):
+    """Characters ``core.main`` synthesizes for ``chapter`` after cleaning."""
+    import core
+
+    return len(core.clean_chapter_text(chapter.extracted_text))
+
+
+def estimate_book(file_path, ignore_list=None):
+    """
+    Chapters ``core.main`` would pick for ``file_path`` without user input,
+    with their character counts. PDFs are estimated as a whole and are not
+    split (``chapters`` is None).
+    """
+    if Path(file_path).suffix.lower() == '.pdf':
+        import PyPDF2
+
+        pages = PyPDF2.PdfReader(file_path).pages
+        chars = sum(len(page.extract_text() or "") for page in pages)
+        return SimpleNamespace(file_path=file_path, chapters=None, sizes=None, chars=chars, split=False)
+
+    from ebooklib import epub
+    import core
+
+    book = epub.read_epub(file_path)
+    chapters = core.find_good_chapters(core.find_document_chapters_and_extract_texts(book))
+    if ignore_list:
+        chapters = [c for c in chapters
+                    if not any(ignore.lower() in c.get_name().lower() for ignore in ignore_list)]
+    sizes = [chapter_chars(c) for c in chapters]
+    return SimpleNamespace(file_path=file_path, chapters=chapters, sizes=sizes, chars=sum(sizes), split=False)
+
+
+def lpt_assign(items, n_bins):
+    """
+    Greedy LPT: place ``(size, payload)`` items, largest first, into the
+    least-loaded of ``n_bins`` bins. Returns bins with ``load`` and ``items``.
+    """
+    bins = [SimpleNamespace(load=0, items=[]) for _ in range(n_bins)]
+    heap = [(0, i) for i in range(n_bins)]
+    for size, payload in sorted(items, key=lambda item: item[0], reverse=True):
+        load, i = heapq.heappop(heap)
+        bins[i].load += size
+        bins[i].items.append(payload)
+        heapq.heappush(heap, (bins[i].load, i))
+    return bins
+
+
+def plan_units(books, n_workers):
+    """
+    Work units for ``books`` on ``n_workers``, longest first. A unit is a
+    whole book (``chapters`` None) or a part of a split book (``chapters``
+    lists the chapters to render).
+    """
+    total = sum(book.chars for book in books)
+    share = total / n_workers if n_workers > 1 else math.inf
+    units = []
+    for book in books:
+        if book.chapters and len(book.chapters) > 1 and book.chars > share:
+            n_parts = min(len(book.chapters), math.ceil(book.chars / share))
+            for part in lpt_assign(list(zip(book.sizes, book.chapters)), n_parts):
+                units.append(SimpleNamespace(book=book, chapters=part.items, chars=part.load))
+            book.split = True
+        else:
+            units.append(SimpleNamespace(book=book, chapters=None, chars=book.chars))
+    return sorted(units, key=lambda unit: unit.chars, reverse=True)
+
+
+def log_schedule(units, n_workers, chars_per_sec):
+    """Log the planned assignment and return the predicted makespan in seconds."""
+    bins = lpt_assign([(unit.chars, unit) for unit in units], n_workers)
+    n_split = len({id(unit.book) for unit in units if unit.chapters is not None})
+    logging.info(f"Batch plan: {len(units)} work units on {n_workers} workers"
+                 + (f", {n_split} long books split by chapter" if n_split else ""))
+    for i, b in enumerate(bins):
+        names = ", ".join(Path(unit.book.file_path).name + (" (part)" if unit.chapters is not None else "")
+                          for unit in b.items)
+        logging.info(f"  worker {i}: {b.load:,} chars, ~{b.load / chars_per_sec / 3600:.1f}h: {names}")
+    predicted = max(b.load for b in bins) / chars_per_sec
+    logging.info(f"Predicted makespan: {predicted / 3600:.2f}h at {chars_per_sec:.1f} chars/sec per worker")
+    return predicted
+
+
+def report_makespan(predicted, actual):
+    error = (actual - predicted) / predicted if predicted > 0 else 0.0
+    logging.info(f"Batch makespan: {actual / 3600:.2f}h actual vs {predicted / 3600:.2f}h predicted ({error:+.0%})")
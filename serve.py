@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Synthesis daemon: keeps one backend loaded and conditioned, and runs
+submitted books through ``core.main`` one at a time, highest priority first.
+
+Start it with ``python cli.py --serve`` and submit with
+``python cli.py --file book.epub --server ADDRESS``. ADDRESS is
+``http://127.0.0.1:PORT`` (localhost only) or ``unix:/path/to/socket``.
+
+HTTP API (JSON):
+    POST   /jobs              {"file_path", "output_folder"?, "priority"?, "audio_prompt_wav"?, "options"?}
+                              -> the new job; lower priority numbers run first
+    GET    /jobs              all jobs
+    GET    /jobs/<id>         one job: status, progress, output_path, error
+    GET    /jobs/<id>/result  the finished audiobook
+    DELETE /jobs/<id>         cancel a queued or running job
+    POST   /stream            {"text", "audio_prompt_wav"?, "options"?}
+                              -> audio/wav, sent chunk by chunk as batches are synthesized
+                              (options: core.STREAM_PARAMS and "seed"); 503 if a job holds the
+                              model for longer than STREAM_LOCK_TIMEOUT
+
+The stream's WAV header carries no length (sizes are 0xFFFFFFFF); read
+until the chunked response ends.
+"""
+import heapq
+import http.client
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+DEFAULT_ADDRESS = "http://127.0.0.1:8765"
+# Seconds a stream request waits for the model before it is turned away
+STREAM_LOCK_TIMEOUT = 5.0
+# core.main parameters a job may set; the model settings are fixed by the daemon
+JOB_OPTIONS = (
+    'speed', 'repetition_penalty', 'min_p', 'top_p', 'exaggeration', 'cfg_weight', 'temperature',
+    'enable_silence_trimming', 'silence_thresh', 'min_silence_len', 'keep_silence',
+    'seed', 'draft', 'watermark', 'ignore_list', 'max_chapters', 'progressive',
+    'export_chapters', 'incremental', 'loudness_target',
+)
+
+
+class Job:
+    def __init__(self, file_path, output_folder, priority=0, audio_prompt_wav=None, options=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.file_path = file_path
+        self.output_folder = output_folder
+        self.priority = priority
+        self.audio_prompt_wav = audio_prompt_wav
+        self.options = options or {}
+        self.status = 'queued'
+        self.progress = 0
+        self.eta = None
+        self.chapters_done = 0
+        self.output_path = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.ended = None
+        self.cancelled = False
+
+    def to_dict(self):
+        return {k: v for k, v in vars(self).items() if k != 'cancelled'}
+
+
+class JobRunner(threading.Thread):
+    """Owns the warm backend and runs queued jobs one by one."""
+
+    def __init__(self, tts, default_wav=None, output_folder='.', scratch_dir=None):
+        super().__init__(daemon=True)
+        self.tts = tts
+        self.default_wav = default_wav
+        self.current_wav = default_wav
+        self.output_folder = output_folder
+        self.scratch_dir = scratch_dir
+        self.jobs = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        # Jobs and streams take turns on the one model
+        self.tts_lock = threading.Lock()
+
+    def submit(self, file_path, output_folder=None, priority=0, audio_prompt_wav=None, options=None):
+        unknown = set(options or {}) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"unsupported job options: {sorted(unknown)}")
+        if not os.path.isfile(file_path):
+            raise ValueError(f"file does not exist: {file_path}")
+        job = Job(file_path, output_folder or self.output_folder, int(priority), audio_prompt_wav, options)
+        with self._cond:
+            self.jobs[job.id] = job
+            heapq.heappush(self._heap, (job.priority, next(self._order), job.id))
+            self._cond.notify()
+        logging.info(f"Queued job {job.id} (priority {job.priority}): {file_path}")
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        job.cancelled = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+        return job
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+            job = self.jobs[job_id]
+            if job.cancelled:
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        import core
+
+        def post_event(evt_name, **kwargs):
+            if evt_name == 'CORE_PROGRESS':
+                job.progress = kwargs['stats'].progress
+                job.eta = kwargs['stats'].eta
+            elif evt_name == 'CORE_CHAPTER_FINISHED':
+                job.chapters_done += 1
+            elif evt_name == 'CORE_FINISHED':
+                job.output_path = kwargs.get('output_path')
+            elif evt_name == 'CORE_ERROR':
+                job.error = kwargs.get('message')
+
+        job.status, job.started = 'running', time.time()
+        logging.info(f"Starting job {job.id}: {job.file_path}")
+        try:
+            with self.tts_lock:
+                self._use_voice(job.audio_prompt_wav)
+                # The model is conditioned already; main needs the voice for its resume and manifest fingerprints
+                core.main(job.file_path, pick_manually=False, output_folder=job.output_folder,
+                          audio_prompt_wav=job.audio_prompt_wav or self.default_wav,
+                          post_event=post_event, should_stop=lambda: job.cancelled, tts=self.tts,
+                          scratch_dir=self.scratch_dir,
+                          **{'speed': 1.0, **job.options})
+            if job.cancelled:
+                job.status = 'cancelled'
+            elif job.output_path:
+                job.status, job.progress = 'finished', 100
+            else:
+                job.status = 'failed'
+                job.error = job.error or 'no audiobook was produced'
+        except Exception as e:
+            logging.error(f"Job {job.id} failed:\n{traceback.format_exc()}")
+            job.status, job.error = 'failed', f"{type(e).__name__}: {e}"
+        job.ended = time.time()
+        logging.info(f"Job {job.id} {job.status} in {job.ended - job.started:.0f}s")
+
+    def _use_voice(self, wav):
+        wav = wav or self.default_wav
+        if wav and wav != self.current_wav:
+            self.tts.condition(wav)
+            self.current_wav = wav
+        elif not wav and self.current_wav:
+            logging.info(f"Built-in voice requested; dropping {self.current_wav}")
+            self.tts.reset_voice()
+            self.current_wav = None
+
+    def stream(self, text, audio_prompt_wav=None, options=None):
+        """
+        Validate a stream request, take the model and return a generator of
+        its audio chunks, which releases the model when closed. Raises
+        TimeoutError if the model stays busy for STREAM_LOCK_TIMEOUT.
+        """
+        import core
+
+        params = dict(options or {})
+        seed = int(params.pop('seed', core.DEFAULT_SEED))
+        unknown = set(params) - set(core.STREAM_PARAMS)
+        if unknown:
+            raise ValueError(f"unsupported stream options: {sorted(unknown)}")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("text must be a non-empty string")
+
+        if not self.tts_lock.acquire(timeout=STREAM_LOCK_TIMEOUT):
+            raise TimeoutError("the model is busy with another job or stream; try again later")
+
+        def chunks():
+            try:
+                yield None
+                self._use_voice(audio_prompt_wav)
+                yield from core.synthesize_stream(text, params=params, tts=self.tts, seed=seed)
+            finally:
+                self.tts_lock.release()
+        stream = chunks()
+        # Started, so closing it (or dropping it) releases the lock even before the first chunk
+        next(stream)
+        return stream
+
+
+def wav_stream_header(sample_rate, channels=1, bits=16):
+    """RIFF/WAVE header for 16-bit PCM of unknown length."""
+    block_align = channels * bits // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align,
+                                    block_align, bits)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    runner = None  # set by make_server
+    # Needed for chunked transfer encoding on /stream; every other response sets Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug("serve: " + format % args)
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job(self, job_id):
+        job = self.runner.jobs.get(job_id)
+        if job is None:
+            self._send_json({"error": f"no such job: {job_id}"}, 404)
+        return job
+
+    def do_GET(self):
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        if parts == ["jobs"]:
+            self._send_json([job.to_dict() for job in self.runner.jobs.values()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                self._send_json(job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            job = self._job(parts[1])
+            if not job:
+                return
+            if job.status != 'finished':
+                self._send_json({"error": f"job is {job.status}"}, 409)
+                return
+            path = Path(job.output_path)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mp4")
+            self.send_header("Content-Length", str(path.stat().st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, payload):
+        try:
+            chunks = self.runner.stream(payload["text"], payload.get("audio_prompt_wav"), payload.get("options"))
+        except (KeyError, ValueError, TypeError) as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        except TimeoutError as e:
+            self._send_json({"error": str(e)}, 503)
+            return
+        import numpy as np
+
+        start = time.perf_counter()
+        header_sent = False
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                if not header_sent:
+                    self._write_chunk(wav_stream_header(chunk.sample_rate))
+                    header_sent = True
+                    logging.info(f"Stream: first audio after {time.perf_counter() - start:.2f}s")
+                pcm = (np.clip(chunk.audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+                self._write_chunk(pcm)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Stream: client went away; stopping synthesis")
+        finally:
+            chunks.close()
+            self.close_connection = True
+
+    def do_POST(self):
+        path = [p for p in urlsplit(self.path).path.split("/") if p]
+        if path not in (["jobs"], ["stream"]):
+            self._send_json({"error": "not found"}, 404)
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        if path == ["stream"]:
+            self._stream(payload)
+            return
+        try:
+            job = self.runner.submit(
+                payload["file_path"],
+                output_folder=payload.get("output_folder"),
+                priority=payload.get("priority", 0),
+                audio_prompt_wav=payload.get("audio_prompt_wav"),
+                options=payload.get("options"),
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        self._send_json(job.to_dict(), 201)
+
+    def do_DELETE(self):
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                self._send_json(self.runner.cancel(job.id).to_dict())
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(address, runner):
+    handler = type("BoundJobRequestHandler", (JobRequestHandler,), {"runner": runner})
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        return UnixHTTPServer(path, handler)
+    url = urlsplit(address)
+    return ThreadingHTTPServer((url.hostname or "127.0.0.1", url.port or 8765), handler)
+
+
+def run_server(address=DEFAULT_ADDRESS, audio_prompt_wav=None, output_folder='.', backend='chatterbox',
+               backend_options=None, precision='fp32', torch_compile=False, scratch_dir=None):
+    """Load the model once and serve jobs at ``address`` until interrupted."""
+    import core
+
+    start = time.perf_counter()
+    tts, _ = core.load_tts(backend, backend_options, precision, audio_prompt_wav, torch_compile)
+    core.load_spacy()
+    logging.info(f"Model warm in {time.perf_counter() - start:.1f}s")
+    runner = JobRunner(tts, default_wav=audio_prompt_wav, output_folder=output_folder, scratch_dir=scratch_dir)
+    runner.start()
+    server = make_server(address, runner)
+    logging.info(f"Serving synthesis jobs at {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down")
+    finally:
+        server.server_close()
+
+
+# ----------------- Client -----------------
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(address):
+    if address.startswith("unix:"):
+        return UnixHTTPConnection(address[len("unix:"):])
+    url = urlsplit(address)
+    return http.client.HTTPConnection(url.hostname or "127.0.0.1", url.port or 8765, timeout=60)
+
+
+def _request(address, method, path, payload=None):
+    conn = _connect(address)
+    try:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read() or b"null")
+    finally:
+        conn.close()
+    if response.status >= 400:
+        raise RuntimeError(f"{method} {path} failed ({response.status}): {data.get('error') if data else ''}")
+    return data
+
+
+def submit_job(address, file_path, priority=0, output_folder=None, audio_prompt_wav=None, options=None):
+    return _request(address, "POST", "/jobs", {
+        "file_path": str(Path(file_path).resolve()),
+        "output_folder": str(Path(output_folder).resolve()) if output_folder else None,
+        "priority": priority,
+        "audio_prompt_wav": str(Path(audio_prompt_wav).resolve()) if audio_prompt_wav else None,
+        "options": options or {},
+    })
+
+
+def stream_wav(address, text, out, audio_prompt_wav=None, options=None):
+    """Stream ``text`` from the daemon's /stream endpoint into the binary file object ``out``."""
+    conn = _connect(address)
+    try:
+        conn.request("POST", "/stream", body=json.dumps({
+            "text": text,
+            "audio_prompt_wav": str(Path(audio_prompt_wav).resolve()) if audio_prompt_wav else None,
+            "options": options or {},
+        }).encode("utf-8"), headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"POST /stream failed ({response.status}): {response.read()[:200]!r}")
+        shutil.copyfileobj(response, out)
+    finally:
+        conn.close()
+
+
+def get_job(address, job_id):
+    return _request(address, "GET", f"/jobs/{job_id}")
+
+
+def wait_for_job(address, job_id, poll_seconds=5.0):
+    """Poll until the job leaves the queue for good, logging progress; returns the final job."""
+    last = None
+    while True:
+        job = get_job(address, job_id)
+        if job["status"] in ('finished', 'failed', 'cancelled'):
+            return job
+        line = f"Job {job_id}: {job['status']} {job['progress']}% (ETA {job['eta'] or '-'})"
+        if line != last:
+            logging.info(line)
+            last = line
+        time.sleep(poll_seconds)
+
+
+def fetch_result(address, job, dest_folder):
+    """Download a finished job's audiobook into ``dest_folder``; returns the local path."""
+    served = Path(job["output_path"])
+    if served.parent.resolve() == Path(dest_folder).resolve():
+        return served  # the daemon already wrote it there
+    job_id = job["id"]
+    conn = _connect(address)
+    try:
+        conn.request("GET", f"/jobs/{job_id}/result")
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"fetching result of {job_id} failed ({response.status}): {response.read()[:200]!r}")
+        filename = response.getheader("Content-Disposition", "").partition('filename="')[2].rstrip('"') \
+            or f"{job_id}.m4b"
+        dest = Path(dest_folder) / filename
+        with open(dest, "wb") as f:
+            shutil.copyfileobj(response, f)
+    finally:
+        conn.close()
+    return dest
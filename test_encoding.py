@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from encoding import adts_duration, m4b_mux_args, write_ffmetadata
+
+
+def adts_frame(payload_bytes, rate_index=6, raw_blocks=0):
+    """One ADTS frame header (no CRC) followed by ``payload_bytes`` zero bytes."""
+    length = 7 + payload_bytes
+    header = bytes([
+        0xFF, 0xF1,
+        (1 << 6) | (rate_index << 2),  # AAC LC
+        (1 << 6) | (length >> 11),  # mono
+        (length >> 3) & 0xFF,
+        ((length & 0x07) << 5) | 0x1F,
+        0xFC | raw_blocks,
+    ])
+    return header + bytes(payload_bytes)
+
+
+class TestAdtsDuration(unittest.TestCase):
+    def write(self, data):
+        tmp = tempfile.NamedTemporaryFile(suffix=".aac", delete=False)
+        tmp.write(data)
+        tmp.close()
+        self.addCleanup(Path(tmp.name).unlink)
+        return tmp.name
+
+    def test_counts_frames_at_the_stream_rate(self):
+        # 24 kHz: 1024 samples per frame
+        path = self.write(b"".join(adts_frame(n) for n in (10, 200, 57) * 100))
+        self.assertAlmostEqual(adts_duration(path), 300 * 1024 / 24000)
+
+    def test_frames_with_several_raw_blocks(self):
+        path = self.write(adts_frame(40, rate_index=3, raw_blocks=3))
+        self.assertAlmostEqual(adts_duration(path), 4 * 1024 / 48000)
+
+    def test_empty_stream(self):
+        self.assertEqual(adts_duration(self.write(b"")), 0.0)
+
+    def test_garbage_is_rejected(self):
+        with self.assertRaises(ValueError):
+            adts_duration(self.write(adts_frame(10) + b"\x00" * 20))
+
+
+class TestWriteFfmetadata(unittest.TestCase):
+    def test_marks_do_not_drift(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "chapters.txt"
+            write_ffmetadata(path, "Title", "Author", [1024 / 24000] * 1000)
+            ends = [int(line[4:]) for line in path.read_text().splitlines() if line.startswith("END=")]
+        self.assertEqual(ends[-1], round(1000 * 1024 / 24000 * 1000))
+
+
+class TestM4bMuxArgs(unittest.TestCase):
+    def option(self, args, name):
+        return [str(a) for a in args][args.index(name) + 1]
+
+    def test_chapters_come_from_the_metadata_input_with_a_cover(self):
+        args = m4b_mux_args("book.aac", "chapters.txt", "cover")
+        inputs = [args[i + 1] for i, a in enumerate(args) if a == '-i']
+        self.assertEqual(inputs, ["book.aac", "chapters.txt", "cover"])
+        self.assertEqual(self.option(args, '-map_metadata'), '1')
+        self.assertEqual(self.option(args, '-map_chapters'), '1')
+        self.assertIn('2:v', args)
+
+    def test_without_a_cover(self):
+        args = m4b_mux_args("book.aac", "chapters.txt")
+        self.assertEqual(args.count('-i'), 2)
+        self.assertEqual(self.option(args, '-map_chapters'), '1')
+        self.assertNotIn('attached_pic', args)
+
+
+if __name__ == "__main__":
+    unittest.main()
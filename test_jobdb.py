@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from jobdb import JobDB
+
+
+class TestJobDB(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.book = self.dir / "book.epub"
+        self.book.write_bytes(b"epub")
+        self.db = JobDB(self.dir / "jobs.sqlite3")
+
+    def tearDown(self):
+        if self.db._conn is not None:
+            self.db._conn.close()
+        self.tmp.cleanup()
+
+    def finish_chapter(self, book_id, name, text):
+        wav = self.dir / f"{name}.wav"
+        wav.write_bytes(b"RIFF")
+        chapter_id = self.db.start_chapter(book_id, name, 1, text, wav)
+        self.db.finish_chapter(chapter_id, wav, 12.5)
+        return chapter_id
+
+    def test_finished_chapter_resumes(self):
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        self.finish_chapter(book_id, "ch1", "Some text.")
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        row = self.db.finished_chapter(book_id, "ch1", "Some text.")
+        self.assertIsNotNone(row)
+        self.assertEqual(row["duration"], 12.5)
+
+    def test_edited_chapter_is_unfinished(self):
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        self.finish_chapter(book_id, "ch1", "Some text.")
+        self.assertIsNone(self.db.finished_chapter(book_id, "ch1", "Some edited text."))
+
+    def test_settings_change_starts_over(self):
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        self.finish_chapter(book_id, "ch1", "Some text.")
+        self.db.finish_book(book_id, self.book)
+        self.assertTrue(self.db.is_book_finished(self.book, "settings-a"))
+        self.assertFalse(self.db.is_book_finished(self.book, "settings-b"))
+        book_id = self.db.start_book(self.book, "Title", "settings-b")
+        self.assertIsNone(self.db.finished_chapter(book_id, "ch1", "Some text."))
+
+    def test_file_change_starts_over(self):
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        self.finish_chapter(book_id, "ch1", "Some text.")
+        self.book.write_bytes(b"a different epub")
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        self.assertIsNone(self.db.finished_chapter(book_id, "ch1", "Some text."))
+
+    def test_batches_resume_only_for_the_same_text(self):
+        book_id = self.db.start_book(self.book, "Title", "settings-a")
+        chapter_id = self.db.start_chapter(book_id, "ch1", 1, "One. Two.", self.dir / "ch1.wav")
+        audio = np.arange(5, dtype=np.float32)
+        self.db.start_batch(chapter_id, 0, "One.")
+        self.db.finish_batch(chapter_id, 0, audio, self.dir / "parts")
+        self.db.start_batch(chapter_id, 1, "Two.")
+        np.testing.assert_array_equal(self.db.load_batch(chapter_id, 0, "One."), audio)
+        self.assertIsNone(self.db.load_batch(chapter_id, 0, "One!"))
+        # Started but never finished
+        self.assertIsNone(self.db.load_batch(chapter_id, 1, "Two."))
+
+    def test_old_database_gains_hash_columns(self):
+        path = self.dir / "old.sqlite3"
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, file_path TEXT NOT NULL UNIQUE, "
+                     "file_size INTEGER NOT NULL, file_mtime_ns INTEGER NOT NULL, title TEXT, status TEXT NOT NULL, "
+                     "started REAL, ended REAL, output_path TEXT, output_bytes INTEGER, error TEXT)")
+        st = os.stat(self.book)
+        conn.execute("INSERT INTO books (file_path, file_size, file_mtime_ns, status) VALUES (?, ?, ?, 'finished')",
+                     (str(self.book.resolve()), st.st_size, st.st_mtime_ns))
+        conn.commit()
+        conn.close()
+        db = JobDB(path)
+        try:
+            # Recorded before settings were tracked, so it cannot count as finished with them
+            self.assertFalse(db.is_book_finished(self.book, "settings-a"))
+        finally:
+            db._conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
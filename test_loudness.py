@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+
+from loudness import LoudnessMeter, LoudnessNormalizer, integrated_loudness
+
+
+def tone(sr, seconds=5.0, dbfs=0.0, freq=997):
+    t = np.arange(int(seconds * sr)) / sr
+    return (10 ** (dbfs / 20) * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+class TestIntegratedLoudness(unittest.TestCase):
+    def test_full_scale_reference_tone(self):
+        # BS.1770: a 0 dBFS 997 Hz sine reads -3.01 LUFS
+        self.assertAlmostEqual(integrated_loudness(tone(48000), 48000), -3.01, delta=0.01)
+
+    def test_reference_tone_at_model_rate(self):
+        self.assertAlmostEqual(integrated_loudness(tone(24000), 24000), -3.01, delta=0.05)
+
+    def test_level_change_is_exact(self):
+        full = integrated_loudness(tone(48000), 48000)
+        quiet = integrated_loudness(tone(48000, dbfs=-20), 48000)
+        self.assertAlmostEqual(full - quiet, 20.0, places=3)
+
+    def test_silence_and_short_audio(self):
+        self.assertEqual(integrated_loudness(np.zeros(48000 * 2, dtype=np.float32), 48000), float('-inf'))
+        # Shorter than one 400 ms block
+        self.assertEqual(integrated_loudness(tone(48000, seconds=0.3), 48000), float('-inf'))
+
+    def test_gating_ignores_silence(self):
+        sr = 48000
+        padded = np.concatenate([tone(sr, dbfs=-20), np.zeros(10 * sr, dtype=np.float32)])
+        # Only the few blocks straddling the end of the tone pass the gates at a lower level
+        self.assertAlmostEqual(integrated_loudness(padded, sr), integrated_loudness(tone(sr, dbfs=-20), sr),
+                               delta=0.2)
+
+    def test_streaming_matches_one_pass(self):
+        sr = 24000
+        audio = np.random.default_rng(0).standard_normal(7 * sr).astype(np.float32) * 0.05
+        meter = LoudnessMeter(sr)
+        for start in range(0, len(audio), 12345):
+            meter.update(audio[start:start + 12345])
+        whole = LoudnessMeter(sr)
+        whole.update(audio)
+        self.assertAlmostEqual(meter.integrated(), whole.integrated(), places=6)
+
+
+class TestLoudnessNormalizer(unittest.TestCase):
+    def test_reaches_target(self):
+        out = LoudnessNormalizer(24000, target=-18.0)(tone(24000, dbfs=-20))
+        self.assertAlmostEqual(integrated_loudness(out, 24000), -18.0, delta=0.01)
+
+    def test_gain_is_limited_by_peak_ceiling(self):
+        out = LoudnessNormalizer(24000, target=-2.0)(tone(24000, dbfs=-20))
+        self.assertAlmostEqual(20 * np.log10(np.max(np.abs(out))), -1.0, delta=0.01)
+
+    def test_silence_is_left_alone(self):
+        silence = np.zeros(24000 * 2, dtype=np.float32)
+        np.testing.assert_array_equal(LoudnessNormalizer(24000)(silence), silence)
+
+
+if __name__ == "__main__":
+    unittest.main()
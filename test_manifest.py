@@ -0,0 +1,99 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+from manifest import RenderManifest, render_fingerprint
+
+SR = 24000
+
+
+class TestRenderManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = self.dir / "store"
+        self.fingerprint = render_fingerprint(None, {"speed": 1.0, "seed": 0})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def render(self, manifest, name, index, text):
+        """Record a chapter as a render would, with audio derived from its index."""
+        wav = self.dir / f"{name}.wav"
+        audio = np.full(SR // 10, index / 100, dtype=np.float32)
+        soundfile.write(wav, audio, SR)
+        manifest.record(manifest.chapter_hash(text), name, index, wav, len(audio) / SR)
+        return audio
+
+    def test_unchanged_chapter_is_restored(self):
+        manifest = RenderManifest(self.store, self.fingerprint)
+        audio = self.render(manifest, "ch1", 1, "Chapter one.")
+        # A new run reads the manifest back from disk
+        manifest = RenderManifest(self.store, self.fingerprint)
+        out = self.dir / "restored.wav"
+        self.assertTrue(manifest.restore(manifest.chapter_hash("Chapter one."), out))
+        restored, sr = soundfile.read(out, dtype="float32")
+        self.assertEqual(sr, SR)
+        np.testing.assert_allclose(restored, audio, atol=1e-4)
+
+    def test_edited_chapter_misses(self):
+        manifest = RenderManifest(self.store, self.fingerprint)
+        self.render(manifest, "ch1", 1, "Chapter one.")
+        manifest = RenderManifest(self.store, self.fingerprint)
+        self.assertIsNone(manifest.lookup(manifest.chapter_hash("Chapter one, corrected.")))
+        self.assertFalse(manifest.restore(manifest.chapter_hash("Chapter one, corrected."), self.dir / "x.wav"))
+
+    def test_settings_change_misses(self):
+        manifest = RenderManifest(self.store, self.fingerprint)
+        self.render(manifest, "ch1", 1, "Chapter one.")
+        other = RenderManifest(self.store, render_fingerprint(None, {"speed": 1.25, "seed": 0}))
+        self.assertIsNone(other.lookup(other.chapter_hash("Chapter one.")))
+
+    def test_diff_of_an_edited_edition(self):
+        manifest = RenderManifest(self.store, self.fingerprint)
+        self.render(manifest, "ch1", 1, "Chapter one.")
+        self.render(manifest, "ch2", 2, "Chapter two.")
+        self.render(manifest, "ch3", 3, "Chapter three.")
+        lines = manifest.diff([("ch1", "Chapter one."), ("ch2", "Chapter two, corrected."),
+                               ("intro", "Chapter three."), ("ch4", "Chapter four.")])
+        self.assertEqual([(status, name) for status, name, _ in lines],
+                         [("reuse", "ch1"), ("changed", "ch2"), ("reuse", "intro"), ("new", "ch4")])
+        self.assertEqual(lines[2][2], "was ch3")
+
+    def test_prune_drops_old_audio(self):
+        manifest = RenderManifest(self.store, self.fingerprint)
+        self.render(manifest, "ch1", 1, "Chapter one.")
+        self.render(manifest, "ch2", 2, "Chapter two.")
+        keep = manifest.chapter_hash("Chapter one.")
+        manifest.prune([keep])
+        self.assertEqual(list(manifest.entries), [keep])
+        self.assertEqual(len(list(self.store.glob("*.flac"))), 1)
+        self.assertEqual(RenderManifest(self.store, self.fingerprint).diff([]), [("dropped", "ch1", "")])
+
+    def test_concurrent_saves_do_not_collide(self):
+        manifests = [RenderManifest(self.store, self.fingerprint) for _ in range(4)]
+        self.store.mkdir(parents=True)
+        errors = []
+
+        def save_often(manifest):
+            try:
+                for _ in range(50):
+                    manifest.save()
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save_often, args=(m,)) for m in manifests]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(list(self.store.glob("*.tmp")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+try:
+    import core
+    from backends import FakeBackend
+except ImportError:  # torch, spacy and the rest of the model's dependencies
+    core = None
+
+
+def chapter_text(n_sentences=40):
+    return " ".join(f"This is sentence number {i}{', which runs a little longer' * (i % 4)}."
+                    for i in range(n_sentences))
+
+
+@unittest.skipIf(core is None, "core needs the model dependencies (torch, spacy)")
+class TestGenAudioSegments(unittest.TestCase):
+    def render(self, text, **backend_options):
+        tts = FakeBackend(**backend_options).load()
+        segments = []
+        audio = core.gen_audio_segments(tts, core.get_nlp(), text, 1.0, seed=7, on_segment=segments.append)
+        return audio, segments
+
+    def test_batches_come_back_in_chapter_order(self):
+        text = chapter_text()
+        # Decoding slower than the token stage, so the decoder always has a backlog
+        audio, segments = self.render(text, latency=0.001, rtf=0.05)
+        self.assertGreater(len(segments), 2)
+        self.assertEqual([s.index for s in segments], list(range(len(segments))))
+        self.assertEqual(len(audio), len(segments))
+        for segment, batch_audio in zip(segments, audio):
+            np.testing.assert_array_equal(segment.audio, batch_audio)
+        # Every sentence once, in the order of the text
+        numbers = [int(word.strip(".,")) for s in segments for word in s.text.split()
+                   if word.strip(".,").isdigit()]
+        self.assertEqual(numbers, list(range(40)))
+
+    def test_same_seed_same_audio_regardless_of_timing(self):
+        text = chapter_text(20)
+        fast, _ = self.render(text)
+        slow, _ = self.render(text, latency=0.002, rtf=0.02)
+        self.assertEqual(len(fast), len(slow))
+        for a, b in zip(fast, slow):
+            np.testing.assert_array_equal(a, b)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import tempfile
+import unittest
+from concurrent.futures import Future
+from pathlib import Path
+from unittest import mock
+
+from progressive import ProgressiveM4B
+from test_encoding import adts_frame
+
+# 24 kHz ADTS: 1024 samples per frame
+FRAME_SECONDS = 1024 / 24000
+
+
+class StubEncoder:
+    """Hands out futures that the test resolves, in any order, with ADTS files of ``frames`` frames."""
+
+    def __init__(self, work_dir):
+        self.work_dir = Path(work_dir)
+        self.futures = {}
+
+    def submit(self, wav_path):
+        return self.futures.setdefault(str(wav_path), Future())
+
+    def finish(self, wav_path, frames):
+        encoded = self.work_dir / (Path(wav_path).stem + ".aac")
+        encoded.write_bytes(adts_frame(20) * frames)
+        self.futures[str(wav_path)].set_result(encoded)
+
+
+def fake_ffmpeg(args, **kwargs):
+    """Stands in for the mux: the output is a copy of the first input."""
+    Path(args[-1]).write_bytes(Path(args[1]).read_bytes())
+    return True
+
+
+class TestProgressiveM4B(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.encoder = StubEncoder(self.dir)
+        self.partial = self.dir / "book.partial.m4b"
+        patcher = mock.patch("progressive.run_ffmpeg", side_effect=fake_ffmpeg)
+        self.run_ffmpeg = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.book = ProgressiveM4B(self.encoder, self.partial, "Title", "Author")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chapter_lands_as_soon_as_it_is_encoded(self):
+        self.book.add_chapter("ch1.wav")
+        self.assertFalse(self.partial.exists())
+        self.encoder.finish("ch1.wav", 3)
+        self.assertEqual(self.partial.read_bytes(), adts_frame(20) * 3)
+        self.assertEqual(len(self.book.durations), 1)
+        self.assertAlmostEqual(self.book.durations[0], 3 * FRAME_SECONDS)
+
+    def test_out_of_order_encodes_are_appended_in_book_order(self):
+        for name in ("ch1.wav", "ch2.wav", "ch3.wav"):
+            self.book.add_chapter(name)
+        self.encoder.finish("ch3.wav", 3)
+        self.encoder.finish("ch2.wav", 2)
+        self.assertFalse(self.partial.exists())
+        self.encoder.finish("ch1.wav", 1)
+        self.assertEqual(self.partial.read_bytes(), adts_frame(20) * 6)
+        self.assertEqual([round(d / FRAME_SECONDS) for d in self.book.durations], [1, 2, 3])
+
+    def test_failed_replace_is_retried_with_the_next_chapter(self):
+        self.book.add_chapter("ch1.wav")
+        with mock.patch("progressive.os.replace", side_effect=PermissionError("file in use")):
+            self.encoder.finish("ch1.wav", 1)
+        self.assertFalse(self.partial.exists())
+        self.book.add_chapter("ch2.wav")
+        self.encoder.finish("ch2.wav", 2)
+        self.assertEqual(self.partial.read_bytes(), adts_frame(20) * 3)
+
+    def test_finalize_maps_chapters_from_the_metadata_input(self):
+        self.book.add_chapter("ch1.wav")
+        self.encoder.finish("ch1.wav", 1)
+        final = self.book.finalize(self.dir / "book.m4b", cover_image=b"jpeg")
+        self.assertTrue(final.exists())
+        self.assertFalse(self.partial.exists())
+        args = [str(a) for a in self.run_ffmpeg.call_args.args[0]]
+        self.assertEqual(args[args.index('-map_chapters') + 1], '1')
+        self.assertEqual(args[args.index('-map_metadata') + 1], '1')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from types import SimpleNamespace
+
+from scheduler import lpt_assign, plan_units
+
+
+def book(name, sizes):
+    return SimpleNamespace(file_path=f"{name}.epub", chapters=[f"{name}-{i}" for i in range(len(sizes))],
+                           sizes=sizes, chars=sum(sizes), split=False)
+
+
+class TestLptAssign(unittest.TestCase):
+    def test_makespan_of_textbook_case(self):
+        # 7+3+2 and 5+4+3
+        bins = lpt_assign([(s, s) for s in (7, 5, 4, 3, 3, 2)], 2)
+        self.assertEqual(sorted(b.load for b in bins), [12, 12])
+        self.assertEqual(sum(len(b.items) for b in bins), 6)
+
+    def test_every_item_placed_once(self):
+        items = [(s, i) for i, s in enumerate((9, 1, 8, 2, 7, 3, 6))]
+        bins = lpt_assign(items, 3)
+        self.assertEqual(sorted(p for b in bins for p in b.items), list(range(7)))
+        self.assertEqual(sum(b.load for b in bins), 36)
+        # Greedy LPT stays within 4/3 of the lower bound
+        self.assertLessEqual(max(b.load for b in bins), 4 / 3 * 36 / 3)
+
+    def test_more_bins_than_items(self):
+        bins = lpt_assign([(5, 'a')], 3)
+        self.assertEqual(sorted(b.load for b in bins), [0, 0, 5])
+
+
+class TestPlanUnits(unittest.TestCase):
+    def test_single_worker_never_splits(self):
+        units = plan_units([book("long", [100] * 10), book("short", [10])], 1)
+        self.assertEqual([u.chapters for u in units], [None, None])
+
+    def test_long_book_is_split_into_whole_chapters(self):
+        long_book = book("long", [100] * 10)
+        units = plan_units([long_book, book("a", [50]), book("b", [50])], 4)
+        parts = [u for u in units if u.book is long_book]
+        self.assertTrue(long_book.split)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(sorted(c for u in parts for c in u.chapters), sorted(long_book.chapters))
+        self.assertEqual(sum(u.chars for u in parts), long_book.chars)
+
+    def test_units_longest_first(self):
+        units = plan_units([book("a", [10]), book("b", [30]), book("c", [20])], 2)
+        self.assertEqual([u.chars for u in units], sorted((u.chars for u in units), reverse=True))
+
+    def test_single_chapter_book_is_not_split(self):
+        units = plan_units([book("one", [1000]), book("b", [10])], 4)
+        self.assertIsNone(units[0].chapters)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import soundfile
+
+from manifest import RenderManifest, render_fingerprint
+from serve import JobRunner
+
+TEXT = "The same chapter text in every job."
+
+
+class StubTTS:
+    def __init__(self):
+        self.voice = None
+
+    def condition(self, wav_path):
+        self.voice = wav_path
+
+    def reset_voice(self):
+        self.voice = None
+
+
+class TestJobVoices(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.book = self.dir / "book.epub"
+        self.book.write_bytes(b"epub")
+        self.voice_a = self.dir / "a.wav"
+        self.voice_b = self.dir / "b.wav"
+        self.voice_a.write_bytes(b"voice a")
+        self.voice_b.write_bytes(b"voice b")
+        self.reused = []
+        # core.main needs the model's dependencies; this stand-in does only its incremental bookkeeping
+        fake_core = types.SimpleNamespace(main=self.fake_main)
+        patcher = mock.patch.dict(sys.modules, {"core": fake_core})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fake_main(self, file_path, output_folder, audio_prompt_wav=None, tts=None, post_event=None, **kwargs):
+        manifest = RenderManifest(Path(output_folder) / "store", render_fingerprint(audio_prompt_wav, {}))
+        chapter_hash = manifest.chapter_hash(TEXT)
+        self.reused.append(manifest.lookup(chapter_hash) is not None)
+        wav = Path(output_folder) / "chapter.wav"
+        soundfile.write(wav, np.zeros(2400, dtype=np.float32), 24000)
+        manifest.record(chapter_hash, "ch1", 1, wav, 0.1)
+        post_event('CORE_FINISHED', output_path=str(wav))
+
+    def run_jobs(self, runner, voices):
+        for voice in voices:
+            runner.run_job(runner.submit(str(self.book), output_folder=str(self.dir), audio_prompt_wav=voice,
+                                         options={'incremental': True}))
+
+    def test_jobs_in_different_voices_do_not_share_chapters(self):
+        runner = JobRunner(StubTTS(), output_folder=str(self.dir))
+        self.run_jobs(runner, [str(self.voice_a), str(self.voice_b), str(self.voice_a)])
+        self.assertEqual(self.reused, [False, False, True])
+        self.assertEqual(runner.tts.voice, str(self.voice_a))
+
+    def test_default_voice_counts_as_that_voice(self):
+        runner = JobRunner(StubTTS(), default_wav=str(self.voice_a), output_folder=str(self.dir))
+        self.run_jobs(runner, [str(self.voice_a), None, str(self.voice_b)])
+        self.assertEqual(self.reused, [False, True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
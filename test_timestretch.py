@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from timestretch import wsola
+
+SR = 24000
+
+
+def tone(freq, seconds, amplitude=0.5):
+    t = np.arange(int(seconds * SR)) / SR
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def peak_frequency(audio):
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio))))
+    return np.fft.rfftfreq(len(audio), 1 / SR)[np.argmax(spectrum)]
+
+
+class TestWsola(unittest.TestCase):
+    def test_output_length(self):
+        audio = np.random.default_rng(0).standard_normal(SR).astype(np.float32) * 0.1
+        for speed in (0.5, 0.8, 1.0, 1.25, 1.5, 2.0):
+            out = wsola(audio, speed, SR)
+            self.assertEqual(len(out), round(len(audio) / speed))
+            self.assertEqual(out.dtype, np.float32)
+
+    def test_pitch_and_level_are_kept(self):
+        audio = tone(220, 2.0)
+        for speed in (0.75, 1.5, 2.0):
+            out = wsola(audio, speed, SR)
+            # Away from the edges, where the last frames fade out
+            middle = out[SR // 10:-SR // 10]
+            self.assertAlmostEqual(peak_frequency(middle), 220, delta=2)
+            self.assertAlmostEqual(np.sqrt(np.mean(middle ** 2)), 0.5 / np.sqrt(2), delta=0.02)
+
+    def test_unit_speed_is_near_identity(self):
+        audio = tone(180, 1.0)
+        out = wsola(audio, 1.0, SR)
+        np.testing.assert_allclose(out[:-SR // 20], audio[:-SR // 20], atol=0.02)
+
+    def test_empty_input(self):
+        out = wsola(np.zeros(0, dtype=np.float32), 1.5, SR)
+        self.assertEqual(len(out), 0)
+
+    def test_input_shorter_than_a_frame(self):
+        for n in (1, 100, 719):
+            out = wsola(tone(220, n / SR), 1.3, SR)
+            self.assertEqual(len(out), round(n / 1.3))
+            self.assertTrue(np.all(np.isfinite(out)))
+
+
+if __name__ == "__main__":
+    unittest.main()
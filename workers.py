@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Fork-after-load worker pool for batch synthesis.
+
+The parent loads (and conditions) the model once, then forks N workers. On
+fork the weights are shared copy-on-write: they are only ever read, so their
+pages stay shared and each worker adds just its own activations, caches and
+interpreter state on top. Every worker gets its own torch thread budget.
+
+Memory is read from /proc/self/smaps_rollup, so the per-worker report is
+Linux-only; elsewhere it reads as zero.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+import torch
+
+MB = 1024 * 1024
+
+
+def fork_supported():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def memory_usage():
+    """``(rss, private)`` bytes of this process; private memory is what it shares with no one."""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[key] = int(parts[0]) * 1024
+    except OSError:
+        pass
+    return fields.get("Rss", 0), fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+
+
+def _worker(worker_id, threads, synthesize, work, results):
+    torch.set_num_threads(threads)
+    while True:
+        job = work.get()
+        if job is None:
+            break
+        error = None
+        start = time.perf_counter()
+        try:
+            synthesize(job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logging.error(f"Worker {worker_id} failed on {job}:\n{traceback.format_exc()}")
+        rss, private = memory_usage()
+        results.put((worker_id, job, error, time.perf_counter() - start, rss, private))
+
+
+def run_worker_pool(jobs, synthesize, n_workers, threads_per_worker=None, on_job_done=None):
+    """
+    Run ``synthesize(job)`` for every job on ``n_workers`` forked workers, in
+    order, each job going to the next idle worker. Call it after loading the
+    model so the workers inherit it. Jobs are pickled to reach the workers;
+    anything else ``synthesize`` needs is inherited through the fork.
+    ``on_job_done(job)`` runs in the parent as each job succeeds.
+    Returns the jobs that failed.
+    """
+    ctx = multiprocessing.get_context("fork")
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // n_workers)
+    parent_rss, _ = memory_usage()
+    logging.info(f"Worker pool: {n_workers} workers x {threads} threads, "
+                 f"parent RSS {parent_rss / MB:.0f} MB after model load")
+
+    work, results = ctx.Queue(), ctx.Queue()
+    for job in jobs:
+        work.put(job)
+    for _ in range(n_workers):
+        work.put(None)
+    procs = [ctx.Process(target=_worker, args=(i, threads, synthesize, work, results)) for i in range(n_workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+
+    peak = {i: (0, 0) for i in range(n_workers)}
+    done = {i: 0 for i in range(n_workers)}
+    busy = {i: 0.0 for i in range(n_workers)}
+    failed = []
+    pending = len(jobs)
+    while pending:
+        try:
+            worker_id, job, error, seconds, rss, private = results.get(timeout=5)
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs):
+                logging.error(f"All workers exited with {pending} jobs unfinished")
+                break
+            continue
+        pending -= 1
+        done[worker_id] += 1
+        busy[worker_id] += seconds
+        peak[worker_id] = max(peak[worker_id][0], rss), max(peak[worker_id][1], private)
+        if error:
+            failed.append(job)
+        elif on_job_done:
+            on_job_done(job)
+    for p in procs:
+        p.join()
+
+    logging.info(f"Worker pool finished {len(jobs) - pending - len(failed)}/{len(jobs)} jobs "
+                 f"in {time.perf_counter() - start:.1f}s")
+    for i, (rss, private) in peak.items():
+        logging.info(f"  worker {i}: {done[i]} jobs, busy {busy[i]:.0f}s, peak RSS {rss / MB:.0f} MB, "
+                     f"private {private / MB:.0f} MB, shared {(rss - private) / MB:.0f} MB")
+    overhead = max(private for _, private in peak.values())
+    logging.info(f"Per-worker overhead up to {overhead / MB:.0f} MB: about "
+                 f"{(parent_rss + n_workers * overhead) / MB:.0f} MB for {n_workers} workers on one node")
+    return failed